@@ -3,6 +3,9 @@ import pandas as pd
 import random
 from datetime import datetime, timedelta
 
+from funnel_schema import FUNNEL_WIDE_VIEW
+from load_pipeline import finalize_load
+
 def add_funnel_data():
     """Добавление тестовых данных воронки"""
     conn = sqlite3.connect('marketing_analytics.db')
@@ -48,17 +51,19 @@ def add_funnel_data():
     
     # Сохраняем в базу данных
     funnel_df.to_sql('funnel_data', conn, if_exists='replace', index=False)
+    # Схема "звезда", новая версия данных и производные таблицы
+    finalize_load(conn)
     
     print(f"Добавлено {len(funnel_df)} записей в funnel_data")
     
     # Проверяем данные для rko_spring2024
     cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM funnel_data WHERE utm_campaign = 'rko_spring2024'")
+    cursor.execute(f"SELECT COUNT(*) FROM {FUNNEL_WIDE_VIEW} WHERE utm_campaign = 'rko_spring2024'")
     count = cursor.fetchone()[0]
     print(f"Записей для rko_spring2024: {count}")
     
     # Показываем пример данных
-    cursor.execute("SELECT * FROM funnel_data WHERE utm_campaign = 'rko_spring2024' LIMIT 3")
+    cursor.execute(f"SELECT * FROM {FUNNEL_WIDE_VIEW} WHERE utm_campaign = 'rko_spring2024' LIMIT 3")
     data = cursor.fetchall()
     print("\nПример данных для rko_spring2024:")
     for row in data:
@@ -1,5 +1,7 @@
 import sqlite3
-import pandas as pd
+
+from funnel_schema import FUNNEL_WIDE_VIEW, append_funnel_rows
+from load_pipeline import finalize_load
 
 def add_test_campaign():
     """Добавление тестовой кампании rko_spring2024"""
@@ -26,24 +28,18 @@ def add_test_campaign():
             'call_answered_flag': 2 + i,
             'quality_flag': 1 + i,
             'quality': 1 + i,
-            'step_name': 'Этап воронки',
-            'step_order': 1,
-            'visitors': 100 + i,
-            'conversions': 10 + i,
-            'conversion_rate': 10.0
         })
     
-    # Создаем DataFrame
-    df = pd.DataFrame(test_data)
-    
-    # Добавляем в базу (не заменяем существующие данные)
-    df.to_sql('funnel_data', conn, if_exists='append', index=False)
+    # Добавляем в базу (не заменяем существующие данные): UTM-значения
+    # кодируются в справочники, затем новая версия данных и производные таблицы
+    added = append_funnel_rows(conn, test_data)
+    finalize_load(conn)
     
-    print(f"Добавлено {len(df)} записей для кампании rko_spring2024")
+    print(f"Добавлено {added} записей для кампании rko_spring2024")
     
     # Проверяем
     cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM funnel_data WHERE utm_campaign = 'rko_spring2024'")
+    cursor.execute(f"SELECT COUNT(*) FROM {FUNNEL_WIDE_VIEW} WHERE utm_campaign = 'rko_spring2024'")
     count = cursor.fetchone()[0]
     print(f"Всего записей для rko_spring2024: {count}")
     
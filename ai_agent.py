@@ -1,17 +1,17 @@
 import sqlite3
 import pandas as pd
 import json
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 import re
+from contextlib import contextmanager
 from datetime import datetime
 import io
-try:
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils.dataframe import dataframe_to_rows
-    OPENPYXL_AVAILABLE = True
-except ImportError:
-    OPENPYXL_AVAILABLE = False
+from excel_export import (
+    CAMPAIGN_COLUMNS, CAMPAIGN_DAY_HEADER, CAMPAIGN_SUMMARY_LABELS, FUNNEL_CAMPAIGN_COLUMNS, FUNNEL_DAILY_COLUMNS,
+    FUNNEL_SOURCE_COLUMNS, FUNNEL_SUMMARY_LABELS, OPENPYXL_AVAILABLE, PLATFORM_COLUMNS, Heading, Sheet,
+    export_to_spool, records_sheet, summary_rows
+)
+if not OPENPYXL_AVAILABLE:
     print("openpyxl недоступен, Excel отчеты будут отключены")
 
 # Пытаемся импортировать RAG систему, но не блокируем запуск если она недоступна
@@ -23,21 +23,80 @@ except ImportError:
     print("RAG система недоступна, будет использоваться упрощенный режим")
 
 from marketing_goals import marketing_goals
+from connection_pool import SQLiteConnectionPool
+from query_builder import SQLQuery, QueryPlanCache
+from campaign_index import ensure_campaign_index, normalize_campaign_name
+from campaign_catalog import CampaignCatalog
+from data_version import get_data_version
+from result_cache import ResultCache, normalize_question
+from rollups import RollupRouter
+from funnel_schema import LAYOUT_WIDE, funnel_layout, render_funnel_sql
+from analytics_backend import BACKEND_SQLITE, create_backend
+from visit_sketches import SQLITE_AGGREGATES, sketches_current
+from campaign_report import (
+    LEVEL_CAMPAIGN, LEVEL_PLATFORM, LEVEL_TOTAL, render_campaign_day_sql, render_campaign_report_sql,
+    render_general_stats_sql, render_name_conditions
+)
+from csv_export import export_csv, iter_csv
+from report_artifacts import CSV_EXTENSION, EXCEL_EXTENSION, ArtifactStore, LazyArtifact, ReportFile
+from query_intent import (
+    ALL_CAMPAIGNS, CAMPAIGN_SPECIFIC, FUNNEL, FUNNEL_DAILY, FUNNEL_SOURCES, FUNNEL_TOTAL, GENERAL_REPORT,
+    GENERAL_STATS, INTENT_PARSER, LIMIT_TOP, PERFORMANCE, PLATFORM, PRODUCT, TERMS, TREND, UTM, QueryIntent
+)
+
+def _frame_records(df: pd.DataFrame, fields: Dict[str, object]) -> List[Dict]:
+    """
+    Записи DataFrame с заданными полями: отсутствующие колонки заполняются
+    значениями по умолчанию, строки не обходятся по одной (без iterrows)
+    """
+    frame = df.reindex(columns=list(fields))
+    for column, default in fields.items():
+        if column not in df.columns:
+            frame[column] = default
+    return frame.to_dict('records')
+
 
 class MarketingAnalyticsAgent:
     """
     AI-агент для автоматического формирования отчетов по рекламным кампаниям
     """
     
-    def __init__(self, db_path: str = 'marketing_analytics.db'):
+    def __init__(self, db_path: str = 'marketing_analytics.db', backend: str = BACKEND_SQLITE,
+                 approximate_visits: bool = False, rag_background: bool = True):
+        """
+        Args:
+            db_path: Путь к базе данных SQLite
+            backend: Движок выполнения отчетных запросов: 'sqlite' или 'duckdb'
+                (колоночная копия БД, строится при первом запросе)
+            approximate_visits: Считать визиты воронки по HyperLogLog-скетчам
+                (ошибка ~1.6%) вместо точного COUNT(DISTINCT visit_id)
+            rag_background: Загружать индекс и модель RAG в фоновом потоке;
+                пока они не готовы, ответы отдаются без RAG-контекста
+        """
         self.db_path = db_path
+        self.approximate_visits = approximate_visits
+        # Справочник нормализованных названий кампаний (строится при загрузке данных)
+        self.campaign_lookup_table = ensure_campaign_index(db_path)
+        self.pool = SQLiteConnectionPool(db_path, aggregates=SQLITE_AGGREGATES)
+        # Служебные чтения (версия данных, каталоги) остаются в SQLite
+        self.backend = create_backend(backend, self.pool)
+        self.query_plans = QueryPlanCache()
+        self.campaign_catalog = CampaignCatalog(self.pool)
+        # Предагрегированные таблицы campaign_metrics (строятся загрузчиками)
+        self.rollups = RollupRouter(self.pool)
+        # (версия данных, схема funnel_data, актуальны ли скетчи визитов)
+        self._funnel_state_cache = None
+        # Готовые ответы на повторные вопросы (до смены версии данных)
+        self.result_cache = ResultCache(maxsize=64, ttl=300.0)
+        # Построенные файлы отчетов и данные дашбордов (старые вытесняются)
+        self.artifacts = ArtifactStore(max_items=16, max_bytes=64 * 1024 * 1024)
         self.conversation_history = []
         self.domain_knowledge = self._load_domain_knowledge()
         
         # Инициализируем RAG систему только если она доступна
         if RAG_AVAILABLE:
             try:
-                self.rag_system = SimpleVectorRAG()
+                self.rag_system = SimpleVectorRAG(background=rag_background)
             except Exception as e:
                 print(f"Ошибка инициализации RAG системы: {e}")
                 self.rag_system = None
@@ -151,7 +210,16 @@ class MarketingAnalyticsAgent:
         return list(set(search_terms))  # Убираем дубликаты
 
     def _build_flexible_sql_conditions(self, search_terms: list) -> list:
-        """Построение гибких SQL условий для поиска с улучшенной обработкой вариаций"""
+        """
+        Построение гибких SQL условий для поиска с улучшенной обработкой вариаций.
+
+        Возвращает список пар (сигнатура, параметры): сигнатура - строка видов
+        предикатов из CAMPAIGN_NAME_PREDICATES (campaign_report), которые объединяются через OR,
+        параметры - значения для LIKE в том же порядке.
+        """
+        if self.campaign_lookup_table:
+            return self._build_lookup_conditions(search_terms)
+        
         conditions = []
         
         for term in search_terms:
@@ -159,21 +227,21 @@ class MarketingAnalyticsAgent:
             term_conditions = []
             
             # 1. Точное совпадение (регистр не важен)
-            term_conditions.append(f"UPPER(\"Название кампании\") LIKE '%{term}%'")
+            term_conditions.append(('U', f"%{term}%"))
             
             # 2. Поиск без пробелов и дефисов
             normalized_term = term.replace(' ', '').replace('-', '')
             if normalized_term != term:
-                term_conditions.append(f"REPLACE(REPLACE(UPPER(\"Название кампании\"), ' ', ''), '-', '') LIKE '%{normalized_term}%'")
+                term_conditions.append(('N', f"%{normalized_term}%"))
             
             # 3. Поиск с заменой дефисов на пробелы и наоборот
             if '-' in term:
                 space_version = term.replace('-', ' ')
-                term_conditions.append(f"UPPER(\"Название кампании\") LIKE '%{space_version}%'")
+                term_conditions.append(('U', f"%{space_version}%"))
             
             if ' ' in term:
                 dash_version = term.replace(' ', '-')
-                term_conditions.append(f"UPPER(\"Название кампании\") LIKE '%{dash_version}%'")
+                term_conditions.append(('U', f"%{dash_version}%"))
             
             # 4. Поиск по частям слова (для длинных терминов)
             if len(term) > 4:
@@ -181,19 +249,50 @@ class MarketingAnalyticsAgent:
                 if len(parts) > 1:
                     for part in parts:
                         if len(part) > 2:
-                            term_conditions.append(f"UPPER(\"Название кампании\") LIKE '%{part}%'")
+                            term_conditions.append(('U', f"%{part}%"))
             
             # 5. Поиск с игнорированием регистра и специальных символов
             clean_term = term.replace('-', '').replace(' ', '').replace('_', '')
             if clean_term != term:
-                term_conditions.append(f"REPLACE(REPLACE(REPLACE(UPPER(\"Название кампании\"), ' ', ''), '-', ''), '_', '') LIKE '%{clean_term}%'")
+                term_conditions.append(('C', f"%{clean_term}%"))
             
             # Объединяем условия для одного термина через OR
             if term_conditions:
-                conditions.append(f"({' OR '.join(term_conditions)})")
+                signature = ''.join(kind for kind, _ in term_conditions)
+                conditions.append((signature, [value for _, value in term_conditions]))
+        
+        return conditions
+
+    def _build_lookup_conditions(self, search_terms: list) -> list:
+        """
+        Условия поиска по нормализованным названиям из справочника кампаний.
+
+        Нормализация (верхний регистр, без пробелов, дефисов и подчеркиваний)
+        покрывает все варианты написания из _build_flexible_sql_conditions,
+        поэтому на термин остается один LIKE плюс части составных терминов.
+        """
+        conditions = []
+        
+        for term in search_terms:
+            patterns = [normalize_campaign_name(term)]
+            
+            # Поиск по частям слова (для длинных терминов)
+            if len(term) > 4:
+                parts = term.split()
+                if len(parts) > 1:
+                    patterns.extend(normalize_campaign_name(part) for part in parts if len(part) > 2)
+            
+            patterns = [pattern for pattern in dict.fromkeys(patterns) if pattern]
+            if patterns:
+                conditions.append(('L' * len(patterns), [f"%{pattern}%" for pattern in patterns]))
         
         return conditions
 
+    def _conditions_to_sql(self, signatures: List[str]) -> List[str]:
+        """Превращает сигнатуры условий в SQL фрагменты с плейсхолдерами"""
+        # Со справочником кампаний таблица фактов читается по индексу названия
+        return render_name_conditions(signatures, self.campaign_lookup_table)
+
     def _extract_campaign_keywords(self, question: str) -> list:
         """Извлекает ключевые слова для поиска кампании из вопроса пользователя"""
         import re
@@ -322,14 +421,8 @@ class MarketingAnalyticsAgent:
         return "Неизвестный продукт"
     
     def _get_all_campaign_names(self):
-        """Получить все уникальные названия кампаний из базы для fuzzy-поиска"""
-        import sqlite3
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT \"Название кампании\" FROM campaign_metrics")
-        names = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return names
+        """Получить все уникальные названия кампаний (из резидентного каталога) для fuzzy-поиска"""
+        return self.campaign_catalog.names()
 
     def _translit_and_synonyms(self, word: str) -> list:
         """Транслитерация и англо-русские синонимы"""
@@ -344,19 +437,37 @@ class MarketingAnalyticsAgent:
         w = word.lower()
         return translit_dict.get(w, [word])
 
+    # Основы слов, которыми формулируют вопрос, а не называют кампанию
+    QUESTION_WORD_STEMS = (
+        "КАМПАН", "ВОРОНК", "ПЛОЩАДК", "ИСТОЧНИК", "РЕКЛАМН", "СТАТИСТИК", "ОТЧЕТ", "ОТЧЁТ",
+        "ЭФФЕКТИВН", "ДИНАМИК", "КОНВЕРСИ",
+    )
+
     def _fuzzy_search_campaigns(self, search_terms: list, threshold: int = 80) -> list:
-        """Простой поиск по campaign_name. Возвращает наиболее похожие названия кампаний."""
-        all_names = self._get_all_campaign_names()
-        found = set()
+        """
+        Нечеткий поиск по campaign_name с учетом опечаток.
+
+        Возвращает названия кампаний с оценкой сходства не ниже threshold (в процентах),
+        отсортированные по убыванию оценки.
+        """
+        scores = {}
         for term in search_terms:
+            # Слова самого вопроса ("кампании", "воронку") ищем только точным вхождением,
+            # иначе они нечетко совпадут с названиями вида "Годовая кампания ..."
+            exact_only = self._normalize_search_term(term).startswith(self.QUESTION_WORD_STEMS)
+
             # Добавляем транслит и синонимы
             variants = [term] + self._translit_and_synonyms(term)
             for v in variants:
-                # Простой поиск по подстроке
-                for name in all_names:
-                    if v.upper() in name.upper():
-                        found.add(name)
-        return list(found)
+                if exact_only:
+                    matches = [(name, 100.0) for name in self.campaign_catalog.search(v)]
+                else:
+                    # Вхождение и расстояние Левенштейна по каталогу
+                    matches = self.campaign_catalog.fuzzy_search(v, threshold)
+                for name, score in matches:
+                    if score > scores.get(name, 0):
+                        scores[name] = score
+        return sorted(scores, key=lambda name: (-scores[name], name))
 
     def get_matching_campaigns(self, user_question: str) -> list:
         """
@@ -366,8 +477,8 @@ class MarketingAnalyticsAgent:
         search_terms = self._extract_search_terms(user_question)
         fuzzy_names = self._fuzzy_search_campaigns(search_terms)
         
-        # Группируем кампании по названию (без площадки)
-        unique_campaigns = set()
+        # Группируем кампании по названию (без площадки), сохраняя порядок по оценке
+        unique_campaigns = {}
         for campaign_name in fuzzy_names:
             # Убираем информацию о площадке из названия кампании
             # Ищем паттерны типа "Кампания - Площадка" или "Кампания (Площадка)"
@@ -386,133 +497,155 @@ class MarketingAnalyticsAgent:
             # Убираем площадки после пробела (если это не часть названия кампании)
             # Это более сложная логика, поэтому оставляем как есть для основных случаев
             
-            unique_campaigns.add(clean_name.strip())
+            unique_campaigns.setdefault(clean_name.strip(), None)
         
         return list(unique_campaigns)
 
-    def generate_sql_query(self, user_question: str) -> str:
+    def generate_sql_query(self, user_question: str, intent: Optional[QueryIntent] = None) -> SQLQuery:
         """
-        Генерация SQL запроса на основе вопроса пользователя
+        Генерация параметризованного SQL запроса на основе вопроса пользователя
         """
-        question_lower = user_question.lower()
+        intent = intent or self.parse_intent(user_question)
         
         # Проверяем, является ли это запросом к воронке или UTM-меткам
-        if self._is_funnel_query(user_question) or self._is_utm_query(user_question):
-            utm_params = self._extract_utm_parameters(user_question)
-            return self._generate_funnel_sql(user_question, utm_params)
+        if intent.is_funnel:
+            return self._generate_funnel_sql(user_question, intent.utm, intent)
         
         # Определяем тип запроса
-        is_general_stats = any(word in question_lower for word in [
-            "общая статистика", "общие показатели", "всего", "итого", 
-            "общий расход", "общие показы", "общие клики", "покажи общую статистику",
-            "все кампании", "всех кампаний"
-        ])
+        is_general_stats = intent.has(GENERAL_STATS)
         
         if is_general_stats:
-            select_fields = [
-                "COUNT(DISTINCT \"ID Кампании\") as campaigns_count",
-                "SUM(\"Показы\") as total_impressions", 
-                "SUM(\"Клики\") as total_clicks",
-                "SUM(\"Расход до НДС\") as total_cost",
-                "SUM(\"Визиты\") as total_visits",
-                "ROUND(SUM(\"Клики\") * 100.0 / SUM(\"Показы\"), 2) as avg_ctr",
-                "ROUND(SUM(\"Расход до НДС\") / SUM(\"Клики\"), 2) as avg_cpc"
-            ]
-            group_by = []
+            # Общая статистика (render_general_stats_sql).
+            # COUNT(DISTINCT "ID Кампании") требует гранулярности кампании
+            dimensions = ["campaign"]
         else:
-            select_fields = [
-                "\"Название кампании\" as campaign_name", "\"Площадка\" as platform", 
-                "SUM(\"Показы\") as impressions", 
-                "SUM(\"Клики\") as clicks", 
-                "SUM(\"Расход до НДС\") as cost", 
-                "SUM(\"Визиты\") as visits", 
-                "ROUND(SUM(\"Клики\") * 100.0 / SUM(\"Показы\"), 2) as ctr", 
-                "ROUND(SUM(\"Расход до НДС\") / SUM(\"Клики\"), 2) as cpc"
-            ]
-            group_by = ["\"Название кампании\"", "\"Площадка\""]
+            # Кампании, площадки и итог одним запросом (render_campaign_report_sql)
+            dimensions = ["campaign", "platform"]
+        
+        # Самая маленькая rollup-таблица с нужными измерениями (или таблица фактов)
+        source_table = self.rollups.choose(dimensions)
         
         # Извлекаем поисковые термины
         search_terms = self._extract_search_terms(user_question)
         
         # Строим условия поиска
-        where_conditions = []
+        conditions = []
         if search_terms and not is_general_stats:
             # Используем улучшенную логику поиска
             conditions = self._build_flexible_sql_conditions(search_terms)
-            if conditions:
-                where_conditions.extend(conditions)
-            else:
-                # Если не удалось построить сложные условия, используем простой LIKE
-                for term in search_terms:
-                    where_conditions.append(f"UPPER(\"Название кампании\") LIKE '%{term.upper()}%'")
+            # Условия объединяются через AND, поэтому порядок не важен - сортируем для канонического ключа
+            conditions.sort(key=lambda condition: condition[0])
         
         # Определяем ORDER BY
         order_by = []
-        if any(word in question_lower for word in ["дорогой", "расход", "стоимость"]):
-            order_by.append("cost DESC")
-        elif any(word in question_lower for word in ["показы", "трафик"]):
-            order_by.append("impressions DESC")
-        elif any(word in question_lower for word in ["клики"]):
-            order_by.append("clicks DESC")
+        if intent.order_by:
+            order_by.append(intent.order_by)
         elif is_general_stats:
             order_by.append("total_cost DESC")
         else:
-            order_by.append("\"Название кампании\" ASC")
+            order_by.append("campaign_name ASC")
         
         # Определяем LIMIT
-        limit_clause = ""
-        if any(word in question_lower for word in ["топ", "лучшие", "лучший"]):
-            limit_clause = "LIMIT 10"
-        elif any(word in question_lower for word in ["первые", "первые 5"]):
-            limit_clause = "LIMIT 5"
-        
-        # Собираем SQL запрос
-        sql = f"SELECT {', '.join(select_fields)} FROM campaign_metrics"
-        
-        if where_conditions:
-            sql += f" WHERE {' AND '.join(where_conditions)}"
-        
-        if group_by:
-            sql += f" GROUP BY {', '.join(group_by)}"
-        
-        if order_by:
-            sql += f" ORDER BY {', '.join(order_by)}"
+        limit = intent.limit
+        limit_clause = f"LIMIT {limit}" if limit else ""
+        
+        # Канонический ключ шаблона: одинаковая форма вопроса -> один и тот же SQL
+        signatures = [signature for signature, _ in conditions]
+        template_key = "|".join([
+            source_table,
+            "general" if is_general_stats else "campaigns",
+            ",".join(signatures),
+            ", ".join(order_by),
+            limit_clause
+        ])
         
-        if limit_clause:
-            sql += f" {limit_clause}"
+        def build_sql() -> str:
+            where_conditions = self._conditions_to_sql(signatures)
+            if is_general_stats:
+                return render_general_stats_sql(source_table, where_conditions, order_by[0], limit)
+            return render_campaign_report_sql(source_table, where_conditions, order_by[0], limit)
         
-        return sql
+        sql = self.query_plans.get_or_build(template_key, build_sql)
+        params = [value for _, values in conditions for value in values]
+        return SQLQuery(sql, params, template_key)
+    
+    def campaign_report_query(self, campaign_names: Optional[List[str]] = None,
+                              name_like: Optional[str] = None) -> SQLQuery:
+        """
+        Параметризованный отчет по выбранным кампаниям (точные названия)
+        или по подстроке названия - для выбора кампании в интерфейсе
+        """
+        source_table = self.rollups.choose(["campaign", "platform"])
+        where_conditions = []
+        params: List[str] = []
+        if campaign_names:
+            where_conditions.append(f'"Название кампании" IN ({", ".join("?" * len(campaign_names))})')
+            params.extend(campaign_names)
+        if name_like:
+            where_conditions.append('"Название кампании" LIKE ?')
+            params.append(f"%{name_like}%")
+        
+        template_key = f"{source_table}|report|{len(campaign_names or [])}|{bool(name_like)}"
+        sql = self.query_plans.get_or_build(
+            template_key, lambda: render_campaign_report_sql(source_table, where_conditions)
+        )
+        return SQLQuery(sql, params, template_key)
     
-    def execute_query(self, sql_query: str) -> pd.DataFrame:
-        """Выполнение SQL запроса и возврат результатов"""
+    def execute_query(self, sql_query: Union[str, SQLQuery]) -> pd.DataFrame:
+        """Выполнение SQL запроса (строки или параметризованного SQLQuery) и возврат результатов"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            df = pd.read_sql_query(sql_query, conn)
-            conn.close()
-            return df
+            if isinstance(sql_query, SQLQuery):
+                return self.backend.read_sql(sql_query.sql, sql_query.params)
+            return self.backend.read_sql(sql_query)
         except Exception as e:
             print(f"Ошибка выполнения SQL запроса: {e}")
             return pd.DataFrame()
     
-    def analyze_data(self, df: pd.DataFrame, question: str) -> Dict:
+    # Поля записей анализа и значения для отсутствующих в результате колонок
+    CAMPAIGN_FIELDS = {
+        'campaign_name': '—', 'platform': '—', 'impressions': 0, 'clicks': 0,
+        'cost': 0, 'visits': 0, 'ctr': 0, 'cpc': 0,
+    }
+    PLATFORM_FIELDS = {
+        'platform': '—', 'impressions': 0, 'clicks': 0, 'cost': 0, 'visits': 0, 'ctr': 0, 'cpc': 0,
+    }
+    FUNNEL_SOURCE_FIELDS = {
+        'utm_source': '—', 'visits': 0, 'submits': 0, 'accounts_opened': 0, 'quality_leads': 0,
+        'conversion_to_submits': 0, 'conversion_to_accounts': 0, 'conversion_to_quality': 0,
+    }
+    FUNNEL_DAILY_FIELDS = {
+        'date': '—', 'visits': 0, 'submits': 0, 'accounts_opened': 0, 'quality_leads': 0,
+    }
+    FUNNEL_CAMPAIGN_FIELDS = {
+        'utm_campaign': '—', 'visits': 0, 'submits': 0, 'accounts_opened': 0, 'quality_leads': 0,
+        'conversion_to_submits': 0,
+    }
+    FUNNEL_TOTAL_FIELDS = {
+        'visits': 0, 'submits': 0, 'accounts_opened': 0, 'created': 0, 'calls_answered': 0,
+        'quality_leads': 0, 'conversion_to_submits': 0, 'conversion_to_accounts': 0, 'conversion_to_quality': 0,
+    }
+
+    def analyze_data(self, df: pd.DataFrame, question: str, intent: Optional[QueryIntent] = None) -> Dict:
         """
-        Динамический анализ данных на основе структуры DataFrame
+        Динамический анализ данных на основе структуры DataFrame.
+
+        Суммы считаются одним проходом по колонкам, а записи кампаний и
+        площадок собираются через to_dict('records') без обхода строк.
         """
         if df.empty:
             return {"error": "Нет данных для анализа по вашему запросу"}
         
+        intent = intent or self.parse_intent(question)
+        
         # Проверяем, является ли это анализом воронки
-        if self._is_funnel_query(question) or self._is_utm_query(question):
+        if intent.is_funnel:
             return self._analyze_funnel_data(df, question)
         
         # Оригинальная логика для campaign_metrics
         columns = df.columns.tolist()
-        question_lower = question.lower()
         
         # Определяем тип анализа
-        is_all_campaigns = any(word in question_lower for word in [
-            "все кампании", "всех кампаний", "общая статистика", "общие показы", "общие клики", "покажи общую статистику"
-        ])
+        is_all_campaigns = intent.has(ALL_CAMPAIGNS)
         
         # Определяем тип анализа
         analysis_type = "all_campaigns" if is_all_campaigns else "specific_campaign"
@@ -523,7 +656,10 @@ class MarketingAnalyticsAgent:
         # Анализируем данные
         summary = {}
         
-        if has_result_columns:
+        if 'level' in columns:
+            # Итоги и площадки уже посчитаны в SQL (render_campaign_report_sql)
+            summary = self._summary_from_report_levels(df, analysis_type)
+        elif has_result_columns:
             # Общая статистика
             summary = {
                 "analysis_type": "general_stats",
@@ -536,70 +672,35 @@ class MarketingAnalyticsAgent:
                 "campaigns_count": df.iloc[0].get('campaigns_count', 0)
             }
         else:
-            # Детальная статистика по кампаниям
+            # Детальная статистика по кампаниям (запросы без колонки level)
             if 'campaign_name' in df.columns:
                 unique_campaigns_count = df['campaign_name'].nunique()
             else:
                 unique_campaigns_count = len(df)
+            # Все суммы одним проходом
+            totals = df[['impressions', 'clicks', 'cost', 'visits']].sum()
             summary = {
                 "analysis_type": analysis_type,
-                "total_impressions": df['impressions'].sum(),
-                "total_clicks": df['clicks'].sum(),
-                "total_cost": df['cost'].sum(),
-                "total_visits": df['visits'].sum(),
-                "avg_ctr": round((df['clicks'].sum() / df['impressions'].sum()) * 100, 2) if df['impressions'].sum() > 0 else 0,
-                "avg_cpc": round(df['cost'].sum() / df['clicks'].sum(), 2) if df['clicks'].sum() > 0 else 0,
+                "total_impressions": totals['impressions'],
+                "total_clicks": totals['clicks'],
+                "total_cost": totals['cost'],
+                "total_visits": totals['visits'],
+                "avg_ctr": round((totals['clicks'] / totals['impressions']) * 100, 2) if totals['impressions'] > 0 else 0,
+                "avg_cpc": round(totals['cost'] / totals['clicks'], 2) if totals['clicks'] > 0 else 0,
                 "campaigns_count": unique_campaigns_count
             }
             
             # Добавляем данные по кампаниям
             if 'campaign_name' in columns:
-                campaigns_data = []
-                for _, row in df.iterrows():
-                    campaign_data = {
-                        'campaign_name': row.get('campaign_name', '—'),
-                        'platform': row.get('platform', '—'),
-                        'impressions': row.get('impressions', 0),
-                        'clicks': row.get('clicks', 0),
-                        'cost': row.get('cost', 0),
-                        'visits': row.get('visits', 0),
-                        'ctr': row.get('ctr', 0),
-                        'cpc': row.get('cpc', 0)
-                    }
-                    campaigns_data.append(campaign_data)
-                
-                summary["campaigns"] = campaigns_data
-                
-                # Сортируем кампании по эффективности
-                if campaigns_data:
-                    sorted_campaigns = sorted(campaigns_data, key=lambda x: x.get('ctr', 0), reverse=True)
-                    summary["top_campaigns"] = sorted_campaigns[:5]
+                summary.update(self._campaign_records(df))
             
-            # Анализ по площадкам
+            # Анализ по площадкам: CTR и CPC - отношение сумм, как в SQL отчета
             if 'platform' in df.columns and 'ctr' in df.columns:
-                platform_stats = df.groupby('platform').agg({
-                    'impressions': 'sum',
-                    'clicks': 'sum',
-                    'cost': 'sum',
-                    'visits': 'sum',
-                    'ctr': 'mean',
-                    'cpc': 'mean'
-                }).reset_index()
+                platform_stats = df.groupby('platform')[['impressions', 'clicks', 'cost', 'visits']].sum()
+                platform_stats['ctr'] = (platform_stats['clicks'] * 100.0 / platform_stats['impressions'].where(platform_stats['impressions'] > 0)).round(2).fillna(0)
+                platform_stats['cpc'] = (platform_stats['cost'] / platform_stats['clicks'].where(platform_stats['clicks'] > 0)).round(2).fillna(0)
                 
-                platforms_data = []
-                for _, row in platform_stats.iterrows():
-                    platform_data = {
-                        'platform': row.get('platform', '—'),
-                        'impressions': row.get('impressions', 0),
-                        'clicks': row.get('clicks', 0),
-                        'cost': row.get('cost', 0),
-                        'visits': row.get('visits', 0),
-                        'ctr': row.get('ctr', 0),
-                        'cpc': row.get('cpc', 0)
-                    }
-                    platforms_data.append(platform_data)
-                
-                summary["platforms"] = platforms_data
+                summary["platforms"] = _frame_records(platform_stats.reset_index(), self.PLATFORM_FIELDS)
         
         # Генерируем инсайты
         insights = []
@@ -635,6 +736,42 @@ class MarketingAnalyticsAgent:
             "recommendations": recommendations
         }
     
+    def _campaign_records(self, df: pd.DataFrame) -> Dict:
+        """Записи кампаний и топ-5 по CTR (при равенстве - в порядке результата)"""
+        campaigns_data = _frame_records(df, self.CAMPAIGN_FIELDS)
+        result = {"campaigns": campaigns_data}
+        if campaigns_data:
+            ctr = df['ctr'].fillna(0) if 'ctr' in df.columns else pd.Series(0, index=df.index)
+            top_positions = ctr.reset_index(drop=True).nlargest(5, keep='first').index
+            result["top_campaigns"] = [campaigns_data[i] for i in top_positions]
+        return result
+    
+    def _summary_from_report_levels(self, df: pd.DataFrame, analysis_type: str) -> Dict:
+        """
+        Сводка из результата отчета по кампаниям: строка level='total' дает
+        итоги и взвешенные CTR/CPC, строки 'platform' - площадки, строки
+        'campaign' - кампании. Пересчета в pandas нет.
+        """
+        levels = df['level']
+        campaigns = df[levels == LEVEL_CAMPAIGN]
+        platforms = df[levels == LEVEL_PLATFORM]
+        total_rows = df[levels == LEVEL_TOTAL]
+        total = total_rows.iloc[0].fillna(0) if not total_rows.empty else pd.Series(dtype=object)
+        
+        summary = {
+            "analysis_type": analysis_type,
+            "total_impressions": total.get('impressions', 0),
+            "total_clicks": total.get('clicks', 0),
+            "total_cost": total.get('cost', 0),
+            "total_visits": total.get('visits', 0),
+            "avg_ctr": total.get('ctr', 0),
+            "avg_cpc": total.get('cpc', 0),
+            "campaigns_count": int(total.get('campaigns_count', 0))
+        }
+        summary.update(self._campaign_records(campaigns))
+        summary["platforms"] = _frame_records(platforms, self.PLATFORM_FIELDS)
+        return summary
+    
     def _analyze_funnel_data(self, df: pd.DataFrame, question: str) -> Dict:
         """
         Анализ данных воронки
@@ -652,61 +789,19 @@ class MarketingAnalyticsAgent:
         # Определяем тип анализа воронки
         if 'metric' in columns and len(df) == 1:
             # Общая воронка
-            row = df.iloc[0]
-            summary.update({
-                "visits": row.get('visits', 0),
-                "submits": row.get('submits', 0),
-                "accounts_opened": row.get('accounts_opened', 0),
-                "created": row.get('created', 0),
-                "calls_answered": row.get('calls_answered', 0),
-                "quality_leads": row.get('quality_leads', 0),
-                "conversion_to_submits": row.get('conversion_to_submits', 0),
-                "conversion_to_accounts": row.get('conversion_to_accounts', 0),
-                "conversion_to_quality": row.get('conversion_to_quality', 0)
-            })
+            summary.update(_frame_records(df, self.FUNNEL_TOTAL_FIELDS)[0])
         
         elif 'utm_source' in columns:
             # Сравнение источников
-            summary["sources_comparison"] = []
-            for _, row in df.iterrows():
-                source_data = {
-                    'utm_source': row.get('utm_source', '—'),
-                    'visits': row.get('visits', 0),
-                    'submits': row.get('submits', 0),
-                    'accounts_opened': row.get('accounts_opened', 0),
-                    'quality_leads': row.get('quality_leads', 0),
-                    'conversion_to_submits': row.get('conversion_to_submits', 0),
-                    'conversion_to_accounts': row.get('conversion_to_accounts', 0),
-                    'conversion_to_quality': row.get('conversion_to_quality', 0)
-                }
-                summary["sources_comparison"].append(source_data)
+            summary["sources_comparison"] = _frame_records(df, self.FUNNEL_SOURCE_FIELDS)
         
         elif 'date' in columns:
             # Динамика по дням
-            summary["daily_trends"] = []
-            for _, row in df.iterrows():
-                trend_data = {
-                    'date': row.get('date', '—'),
-                    'visits': row.get('visits', 0),
-                    'submits': row.get('submits', 0),
-                    'accounts_opened': row.get('accounts_opened', 0),
-                    'quality_leads': row.get('quality_leads', 0)
-                }
-                summary["daily_trends"].append(trend_data)
+            summary["daily_trends"] = _frame_records(df, self.FUNNEL_DAILY_FIELDS)
         
         elif 'utm_campaign' in columns:
             # Топ кампаний
-            summary["top_campaigns"] = []
-            for _, row in df.iterrows():
-                campaign_data = {
-                    'utm_campaign': row.get('utm_campaign', '—'),
-                    'visits': row.get('visits', 0),
-                    'submits': row.get('submits', 0),
-                    'accounts_opened': row.get('accounts_opened', 0),
-                    'quality_leads': row.get('quality_leads', 0),
-                    'conversion_to_submits': row.get('conversion_to_submits', 0)
-                }
-                summary["top_campaigns"].append(campaign_data)
+            summary["top_campaigns"] = _frame_records(df, self.FUNNEL_CAMPAIGN_FIELDS)
         
         # Генерируем инсайты для воронки
         insights = []
@@ -748,52 +843,39 @@ class MarketingAnalyticsAgent:
             "recommendations": recommendations
         }
     
-    def generate_report(self, analysis: Dict, question: str, sql_query: str = "") -> str:
+    def generate_report(self, analysis: Dict, question: str, sql_query: str = "",
+                        intent: Optional[QueryIntent] = None) -> str:
         """
         Динамическая генерация отчета на основе типа запроса и данных
         """
         if "error" in analysis:
             return f"## Нет данных для анализа по вашему запросу.\n"
         
-        question_lower = question.lower()
+        intent = intent or self.parse_intent(question)
         summary = analysis.get("summary", {})
         
         # Проверяем тип анализа из данных
         analysis_type = summary.get('analysis_type', 'general')
         
         # Определяем тип отчета на основе запроса
-        is_general_stats = (
-            any(word in question_lower for word in [
-                "общая статистика", "общие показатели", "всего", "итого", 
-                "общий расход", "общие показы", "общие клики", "покажи общую статистику"
-            ]) or analysis_type == "all_campaigns"
-        )
+        is_general_stats = intent.has(GENERAL_REPORT) or analysis_type == "all_campaigns"
         
         # Проверяем, есть ли конкретное название кампании в запросе
-        campaign_name = self._extract_campaign_name(question)
+        campaign_name = intent.campaign_name
         
         # Если это анализ всех кампаний, то не считаем это анализом конкретной кампании
         is_campaign_specific = (
-            any(word in question_lower for word in [
-                "по кампании", "кампания", "отчет по", "статистика по", "сделай отчет по", "покажи отчет по"
-            ]) and campaign_name and analysis_type != "all_campaigns"
+            intent.has(CAMPAIGN_SPECIFIC) and campaign_name and analysis_type != "all_campaigns"
         )
         
-        is_product_specific = any(word in question_lower for word in [
-            "по продукту", "продукт", "рко", "рбидос", "бизнес-карты", "бизнес-кредиты"
-        ]) and not campaign_name  # Не показываем анализ продукта, если есть конкретная кампания
+        # Не показываем анализ продукта, если есть конкретная кампания
+        is_product_specific = intent.has(PRODUCT) and not campaign_name
         
-        is_platform_analysis = any(word in question_lower for word in [
-            "по площадкам", "площадки", "платформа", "эффективность площадок"
-        ])
+        is_platform_analysis = intent.has(PLATFORM)
         
-        is_performance_analysis = any(word in question_lower for word in [
-            "эффективность", "конверсия", "результат", "лучший", "лучшие", "топ"
-        ])
+        is_performance_analysis = intent.has(PERFORMANCE)
         
-        is_trend_analysis = any(word in question_lower for word in [
-            "по дням", "тренд", "динамика", "время", "дата", "график"
-        ])
+        is_trend_analysis = intent.has(TREND)
         
         # Проверяем, является ли это анализом воронки
         is_funnel_analysis = analysis.get("summary", {}).get("analysis_type") == "funnel_analysis"
@@ -1245,12 +1327,35 @@ class MarketingAnalyticsAgent:
         """
         Обработка вопроса пользователя с динамическим анализом
         """
-        # Проверяем, является ли это запросом к воронке или UTM-меткам
-        is_funnel_query = self._is_funnel_query(question)
-        is_utm_query = self._is_utm_query(question)
-        
-        # Генерируем SQL запрос
-        sql_query = self.generate_sql_query(question)
+        # Ключевые слова вопроса разбираются один раз для всего конвейера
+        intent = self.parse_intent(question)
+        
+        # Генерируем SQL запрос (шаблон берется из QueryPlanCache)
+        sql_query = self.generate_sql_query(question, intent)
+        
+        # Ответ зависит от текста вопроса (заголовок, анализ), от SQL (таблица,
+        # схема воронки, скетчи) с параметрами, от версии данных и от настроек
+        # агента, которых нет в шаблоне SQL
+        with self.pool.connection() as conn:
+            data_version = get_data_version(conn)
+        cache_key = (
+            normalize_question(question), sql_query.template_key, tuple(sql_query.params), data_version,
+            self.backend.name, self.campaign_lookup_table, self.approximate_visits,
+        )
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            report, analysis = cached
+            self.conversation_history.append({
+                "question": question,
+                "answer": report,
+                "timestamp": datetime.now().isoformat()
+            })
+            # Ленивые артефакты у каждого вызова свои: кэшируется только анализ
+            return (
+                report, sql_query,
+                self.report_file(analysis, question) if analysis else None,
+                self.dashboard_artifact(analysis) if analysis else None,
+            )
         
         # Выполняем запрос
         df = self.execute_query(sql_query)
@@ -1259,14 +1364,13 @@ class MarketingAnalyticsAgent:
         has_data = not df.empty and not (len(df) == 1 and df.iloc[0].get('result') == 'no_data')
         
         # Проверяем, спрашивает ли пользователь о терминах/метриках
-        is_asking_about_terms = any(word in question.lower() for word in [
-            'что такое', 'что означает', 'определение', 'расшифровка', 'ctr', 'cpc', 'cpm', 'конверсия'
-        ])
+        is_asking_about_terms = intent.has(TERMS)
         
         # Анализируем данные только если они есть
+        analysis = None
         if has_data:
-            analysis = self.analyze_data(df, question)
-            report = self.generate_report(analysis, question, sql_query)
+            analysis = self.analyze_data(df, question, intent)
+            report = self.generate_report(analysis, question, sql_query, intent)
         else:
             # Если данных нет, создаем базовый отчет
             report = f"# 📋 Отчет по запросу: {question}\n\n"
@@ -1276,11 +1380,13 @@ class MarketingAnalyticsAgent:
         # 1. Нет данных для анализа ИЛИ
         # 2. Пользователь явно спрашивает о терминах/метриках
         should_use_rag = not has_data or is_asking_about_terms
+        # Модель еще загружается: ответ не ждет ее и не кэшируется без RAG-контекста
+        rag_pending = should_use_rag and self.rag_system is not None and not self.rag_system.ready.done()
         
         if should_use_rag and self.rag_system is not None:
             try:
-                # Улучшаем отчет с помощью RAG системы
-                enhanced_report = self.rag_system.enhance_report(report, question)
+                # Улучшаем отчет с помощью RAG системы (словарные термины - и до загрузки модели)
+                enhanced_report = self.rag_system.enhance_report(report, question, wait=False)
                 if enhanced_report != report:
                     report = enhanced_report
             except Exception as e:
@@ -1294,175 +1400,152 @@ class MarketingAnalyticsAgent:
             "timestamp": datetime.now().isoformat()
         })
         
-        # Генерируем Excel отчет
-        excel_data = self.generate_excel_report(analysis, question)
+        # Файл отчета и дашборд строятся только при обращении к ним
+        excel_data = self.report_file(analysis, question) if analysis else None
+        dashboard_data = self.dashboard_artifact(analysis) if analysis else None
         
-        # Генерируем данные для дашборда
-        dashboard_data = self.generate_dashboard_data(analysis)
+        # Ответ без данных не кэшируется: он дешевый, а его RAG-часть
+        # зависит от состояния модели
+        if has_data and not rag_pending:
+            self.result_cache.put(cache_key, (report, analysis))
         
-        # Возвращаем отчет, SQL запрос, Excel данные и данные дашборда
-        return report, sql_query, excel_data, dashboard_data
+        # Возвращаем отчет, SQL запрос, ленивый файл отчета и данные дашборда
+        return (report, sql_query, excel_data, dashboard_data)
+    
+    def report_file(self, analysis: Dict, question: str) -> ReportFile:
+        """
+        Ленивый файл отчета: Excel (или CSV, если openpyxl недоступен или
+        Excel построить не удалось) строится при первом get()
+        """
+        def build() -> Tuple[bytes, str]:
+            if OPENPYXL_AVAILABLE:
+                try:
+                    with self._report_detail_rows(analysis) as detail_rows:
+                        excel_data = self.generate_excel_report(analysis, question, detail_rows)
+                    if excel_data:
+                        return excel_data, EXCEL_EXTENSION
+                    print("Excel данные пустые, пробуем CSV")
+                except Exception as e:
+                    print(f"Ошибка генерации Excel: {e}")
+            with self._report_detail_rows(analysis) as detail_rows:
+                return self._generate_csv_report(analysis, question, detail_rows), CSV_EXTENSION
+        
+        return ReportFile(build, self.artifacts)
     
-    def generate_excel_report(self, analysis: Dict, question: str) -> bytes:
+    @contextmanager
+    def _report_detail_rows(self, analysis: Dict) -> Iterator[Optional[Iterator[Tuple]]]:
         """
-        Генерация Excel отчета на основе анализа данных
+        Детализация по дням для кампаний из ответа (None, если ее не построить).
+
+        Курсор закрывается и соединение возвращается в пул при выходе из
+        блока with, даже если выгрузка прервалась, не дочитав строки.
+        """
+        summary = analysis.get("summary", {})
+        rows = None
+        if summary.get("analysis_type") != "funnel_analysis" and summary.get("campaigns"):
+            names = list(dict.fromkeys(
+                campaign["campaign_name"] for campaign in summary["campaigns"] if campaign.get("campaign_name")
+            ))
+            try:
+                rows = self.campaign_day_rows(names)
+            except sqlite3.Error as e:
+                print(f"Детализация по дням недоступна: {e}")
+        try:
+            yield rows
+        finally:
+            if hasattr(rows, "close"):
+                rows.close()
+    
+    def dashboard_artifact(self, analysis: Dict) -> LazyArtifact:
+        """Ленивые данные дашборда (generate_dashboard_data при первом get())"""
+        return LazyArtifact(lambda: self.generate_dashboard_data(analysis), self.artifacts)
+    
+    def generate_excel_report(self, analysis: Dict, question: str,
+                              detail_rows: Optional[Iterable[Sequence]] = None) -> bytes:
+        """
+        Генерация Excel отчета на основе анализа данных.
+
+        Листы пишутся потоково (excel_export, openpyxl write_only) через
+        временный файл: detail_rows - итератор строк листа "Детализация по
+        дням" (например, курсор campaign_day_rows), он не загружается в память.
         """
         if not OPENPYXL_AVAILABLE:
             # Создаем CSV отчет как альтернативу Excel
-            return self._generate_csv_report(analysis, question)
-        
-        wb = Workbook()
+            return self._generate_csv_report(analysis, question, detail_rows)
         
-        # Удаляем дефолтный лист
-        wb.remove(wb.active)
-        
-        # Создаем лист с общей статистикой
-        summary_sheet = wb.create_sheet("Общая статистика")
+        with export_to_spool(self._report_sheets(analysis, question, detail_rows)) as spool:
+            return spool.read()
+    
+    def _report_sheets(self, analysis: Dict, question: str,
+                       detail_rows: Optional[Iterable[Sequence]] = None) -> Iterator[Sheet]:
+        """Листы отчета (Excel) и секции CSV: сводка, кампании, площадки, воронка, детализация, инсайты"""
         summary = analysis.get("summary", {})
+        is_funnel = summary.get("analysis_type") == "funnel_analysis"
         
-        # Заголовок
-        summary_sheet['A1'] = f"Отчет по запросу: {question}"
-        summary_sheet['A1'].font = Font(bold=True, size=14)
-        summary_sheet.merge_cells('A1:D1')
-        
-        # Общая статистика
-        row = 3
-        summary_sheet[f'A{row}'] = "Всего кампаний"
-        summary_sheet[f'B{row}'] = summary.get('campaigns_count', 0)
-        row += 1
-        
-        summary_sheet[f'A{row}'] = "Общие показы"
-        summary_sheet[f'B{row}'] = summary.get('total_impressions', 0)
-        row += 1
-        
-        summary_sheet[f'A{row}'] = "Общие клики"
-        summary_sheet[f'B{row}'] = summary.get('total_clicks', 0)
-        row += 1
-        
-        summary_sheet[f'A{row}'] = "Общий расход (₽)"
-        summary_sheet[f'B{row}'] = summary.get('total_cost', 0)
-        row += 1
-        
-        summary_sheet[f'A{row}'] = "Общие визиты"
-        summary_sheet[f'B{row}'] = summary.get('total_visits', 0)
-        row += 1
-        
-        summary_sheet[f'A{row}'] = "Средний CTR (%)"
-        summary_sheet[f'B{row}'] = summary.get('avg_ctr', 0)
-        row += 1
-        
-        summary_sheet[f'A{row}'] = "Средний CPC (₽)"
-        summary_sheet[f'B{row}'] = summary.get('avg_cpc', 0)
-        
-        # Стили для заголовков
-        header_font = Font(bold=True)
-        header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-        
-        for cell in summary_sheet['A3:A9']:
-            cell.font = header_font
-            cell.fill = header_fill
-        
-        # Создаем лист с детальной статистикой по кампаниям
-        if "campaigns" in summary and summary["campaigns"]:
-            campaigns_sheet = wb.create_sheet("Детальная статистика")
-            
-            # Заголовки
-            headers = ["Кампания", "Площадка", "Показы", "Клики", "Расход (₽)", "Визиты", "CTR (%)", "CPC (₽)"]
-            for col, header in enumerate(headers, 1):
-                cell = campaigns_sheet.cell(row=1, column=col)
-                cell.value = header
-                cell.font = header_font
-                cell.fill = header_fill
-            
-            # Данные
-            for row_idx, campaign in enumerate(summary["campaigns"], 2):
-                campaigns_sheet.cell(row=row_idx, column=1, value=campaign.get('campaign_name', '—'))
-                campaigns_sheet.cell(row=row_idx, column=2, value=campaign.get('platform', '—'))
-                campaigns_sheet.cell(row=row_idx, column=3, value=campaign.get('impressions', 0))
-                campaigns_sheet.cell(row=row_idx, column=4, value=campaign.get('clicks', 0))
-                campaigns_sheet.cell(row=row_idx, column=5, value=campaign.get('cost', 0))
-                campaigns_sheet.cell(row=row_idx, column=6, value=campaign.get('visits', 0))
-                campaigns_sheet.cell(row=row_idx, column=7, value=campaign.get('ctr', 0))
-                campaigns_sheet.cell(row=row_idx, column=8, value=campaign.get('cpc', 0))
-            
-            # Автоподбор ширины столбцов
-            for column in campaigns_sheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                campaigns_sheet.column_dimensions[column_letter].width = adjusted_width
-        
-        # Создаем лист с анализом по площадкам
-        if "platforms" in summary and summary["platforms"]:
-            platforms_sheet = wb.create_sheet("Анализ по площадкам")
-            
-            # Заголовки
-            headers = ["Площадка", "Показы", "Клики", "Расход (₽)", "Визиты", "CTR (%)", "CPC (₽)"]
-            for col, header in enumerate(headers, 1):
-                cell = platforms_sheet.cell(row=1, column=col)
-                cell.value = header
-                cell.font = header_font
-                cell.fill = header_fill
-            
-            # Данные
-            for row_idx, platform in enumerate(summary["platforms"], 2):
-                platforms_sheet.cell(row=row_idx, column=1, value=platform.get('platform', '—'))
-                platforms_sheet.cell(row=row_idx, column=2, value=platform.get('impressions', 0))
-                platforms_sheet.cell(row=row_idx, column=3, value=platform.get('clicks', 0))
-                platforms_sheet.cell(row=row_idx, column=4, value=platform.get('cost', 0))
-                platforms_sheet.cell(row=row_idx, column=5, value=platform.get('visits', 0))
-                platforms_sheet.cell(row=row_idx, column=6, value=platform.get('ctr', 0))
-                platforms_sheet.cell(row=row_idx, column=7, value=platform.get('cpc', 0))
-            
-            # Автоподбор ширины столбцов
-            for column in platforms_sheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                platforms_sheet.column_dimensions[column_letter].width = adjusted_width
-        
-        # Создаем лист с инсайтами и рекомендациями
-        insights_sheet = wb.create_sheet("Инсайты и рекомендации")
-        
-        # Инсайты
-        insights_sheet['A1'] = "Ключевые инсайты"
-        insights_sheet['A1'].font = Font(bold=True, size=12)
-        
-        row = 3
-        if analysis.get("insights"):
-            for insight in analysis["insights"]:
-                insights_sheet[f'A{row}'] = f"• {insight}"
-                row += 1
-        
-        # Рекомендации
-        row += 1
-        insights_sheet[f'A{row}'] = "Рекомендации"
-        insights_sheet[f'A{row}'].font = Font(bold=True, size=12)
-        
-        row += 2
-        if analysis.get("recommendations"):
-            for rec in analysis["recommendations"]:
-                insights_sheet[f'A{row}'] = f"• {rec}"
-                row += 1
-        
-        # Сохраняем в bytes
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
-        
-        return excel_buffer.getvalue()
+        title = f"Отчет по запросу: {question}"
+        if is_funnel:
+            yield Sheet("Общая статистика", None, summary_rows(title, summary, FUNNEL_SUMMARY_LABELS, defaults=False))
+        else:
+            yield Sheet("Общая статистика", None, summary_rows(title, summary, CAMPAIGN_SUMMARY_LABELS))
+        
+        if summary.get("campaigns"):
+            yield records_sheet("Детальная статистика", CAMPAIGN_COLUMNS, summary["campaigns"])
+        if summary.get("platforms"):
+            yield records_sheet("Анализ по площадкам", PLATFORM_COLUMNS, summary["platforms"])
+        
+        # Разрезы воронки
+        if summary.get("sources_comparison"):
+            yield records_sheet("Источники", FUNNEL_SOURCE_COLUMNS, summary["sources_comparison"])
+        if summary.get("daily_trends"):
+            yield records_sheet("Динамика по дням", FUNNEL_DAILY_COLUMNS, summary["daily_trends"])
+        if is_funnel and summary.get("top_campaigns"):
+            yield records_sheet("Топ кампаний воронки", FUNNEL_CAMPAIGN_COLUMNS, summary["top_campaigns"])
+        
+        if detail_rows is not None:
+            yield Sheet("Детализация по дням", CAMPAIGN_DAY_HEADER, detail_rows)
+        
+        def insight_rows():
+            yield Heading("Ключевые инсайты")
+            yield ()
+            for insight in analysis.get("insights") or []:
+                yield (f"• {insight}",)
+            yield ()
+            yield Heading("Рекомендации")
+            yield ()
+            for rec in analysis.get("recommendations") or []:
+                yield (f"• {rec}",)
+        
+        yield Sheet("Инсайты и рекомендации", None, insight_rows())
+    
+    def campaign_day_rows(self, campaign_names: List[str]) -> Iterator[Tuple]:
+        """
+        Строки детализации кампаний по дням прямо из курсора SQLite
+        (самая маленькая актуальная таблица с кампанией и датой)
+        """
+        if not campaign_names:
+            return iter(())
+        source_table = self.rollups.choose(["campaign", "date"])
+        sql = render_campaign_day_sql(source_table, len(campaign_names))
+        return self._stream_rows(sql, campaign_names)
+    
+    def _stream_rows(self, sql: str, params: List, batch_size: int = 1000) -> Iterator[Tuple]:
+        """
+        Строки курсора, прочитанные пачками по batch_size.
+
+        Соединение занято, пока строки читаются: оно возвращается в пул после
+        последней строки или при close() генератора (см. _report_detail_rows),
+        а не при сборке мусора брошенного итератора.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield from rows
+            finally:
+                cursor.close()
     
     def generate_dashboard_data(self, analysis: Dict) -> Dict:
         """
@@ -1543,78 +1626,18 @@ class MarketingAnalyticsAgent:
         
         return dashboard_data
     
-    def _generate_csv_report(self, analysis: Dict, question: str) -> bytes:
+    def _generate_csv_report(self, analysis: Dict, question: str,
+                             detail_rows: Optional[Iterable[Sequence]] = None) -> bytes:
         """
-        Генерация CSV отчета как альтернатива Excel
+        Генерация CSV отчета как альтернатива Excel: те же листы секциями,
+        через csv.writer с числовыми ячейками без разделителей разрядов
         """
-        import pandas as pd
-        
-        # Создаем список строк для CSV
-        csv_lines = []
-        
-        # Заголовок
-        csv_lines.append(f"Отчет по запросу: {question}")
-        csv_lines.append("")
-        
-        # Общая статистика
-        summary = analysis.get("summary", {})
-        csv_lines.append("ОБЩАЯ СТАТИСТИКА")
-        csv_lines.append("Показатель,Значение")
-        csv_lines.append(f"Всего кампаний,{summary.get('campaigns_count', 0)}")
-        csv_lines.append(f"Общие показы,{summary.get('total_impressions', 0):,}")
-        csv_lines.append(f"Общие клики,{summary.get('total_clicks', 0):,}")
-        csv_lines.append(f"Общий расход (₽),{summary.get('total_cost', 0):,.2f}")
-        csv_lines.append(f"Общие визиты,{summary.get('total_visits', 0):,}")
-        csv_lines.append(f"Средний CTR (%),{summary.get('avg_ctr', 0):.2f}")
-        csv_lines.append(f"Средний CPC (₽),{summary.get('avg_cpc', 0):.2f}")
-        csv_lines.append("")
-        
-        # Детальная статистика по кампаниям
-        if "campaigns" in summary and summary["campaigns"]:
-            csv_lines.append("ДЕТАЛЬНАЯ СТАТИСТИКА ПО КАМПАНИЯМ")
-            csv_lines.append("Кампания,Площадка,Показы,Клики,Расход (₽),Визиты,CTR (%),CPC (₽)")
-            
-            for campaign in summary["campaigns"]:
-                csv_lines.append(f"\"{campaign.get('campaign_name', '—')}\","
-                               f"\"{campaign.get('platform', '—')}\","
-                               f"{campaign.get('impressions', 0):,},"
-                               f"{campaign.get('clicks', 0):,},"
-                               f"{campaign.get('cost', 0):,.2f},"
-                               f"{campaign.get('visits', 0):,},"
-                               f"{campaign.get('ctr', 0):.2f},"
-                               f"{campaign.get('cpc', 0):.2f}")
-            csv_lines.append("")
-        
-        # Анализ по площадкам
-        if "platforms" in summary and summary["platforms"]:
-            csv_lines.append("АНАЛИЗ ПО ПЛОЩАДКАМ")
-            csv_lines.append("Площадка,Показы,Клики,Расход (₽),Визиты,CTR (%),CPC (₽)")
-            
-            for platform in summary["platforms"]:
-                csv_lines.append(f"\"{platform.get('platform', '—')}\","
-                               f"{platform.get('impressions', 0):,},"
-                               f"{platform.get('clicks', 0):,},"
-                               f"{platform.get('cost', 0):,.2f},"
-                               f"{platform.get('visits', 0):,},"
-                               f"{platform.get('ctr', 0):.2f},"
-                               f"{platform.get('cpc', 0):.2f}")
-            csv_lines.append("")
-        
-        # Инсайты и рекомендации
-        if analysis.get("insights"):
-            csv_lines.append("КЛЮЧЕВЫЕ ИНСАЙТЫ")
-            for insight in analysis["insights"]:
-                csv_lines.append(f"• {insight}")
-            csv_lines.append("")
-        
-        if analysis.get("recommendations"):
-            csv_lines.append("РЕКОМЕНДАЦИИ")
-            for rec in analysis["recommendations"]:
-                csv_lines.append(f"• {rec}")
-        
-        # Объединяем строки и конвертируем в bytes
-        csv_content = "\n".join(csv_lines)
-        return csv_content.encode('utf-8-sig')  # UTF-8 с BOM для корректного отображения в Excel
+        return export_csv(self._report_sheets(analysis, question, detail_rows))
+    
+    def stream_csv_report(self, analysis: Dict, question: str,
+                          detail_rows: Optional[Iterable[Sequence]] = None) -> Iterator[bytes]:
+        """CSV отчета кусками байт - для записи больших выгрузок в файл или ответ без сборки целиком"""
+        return iter_csv(self._report_sheets(analysis, question, detail_rows))
     
     def get_conversation_history(self) -> List[Dict]:
         """Получение истории диалога"""
@@ -1669,168 +1692,89 @@ class MarketingAnalyticsAgent:
         
         return utm_params
     
+    def parse_intent(self, question: str) -> QueryIntent:
+        """
+        Разбор вопроса за один проход (query_intent.IntentParser): признаки по
+        всем спискам ключевых слов, название кампании и UTM-параметры.
+        Результат неизменяемый и передается в generate_sql_query,
+        analyze_data и generate_report.
+        """
+        return INTENT_PARSER.parse(
+            question, self._extract_campaign_name(question), self._extract_utm_parameters(question)
+        )
+    
     def _is_funnel_query(self, question: str) -> bool:
         """
         Определение, является ли запрос связанным с воронкой
         """
-        question_lower = question.lower()
-        funnel_keywords = [
-            'воронка', 'воронку', 'конверсия', 'конверсии', 'заявки', 'заявок',
-            'лиды', 'лидов', 'счета', 'счетов', 'регистрации', 'регистраций',
-            'визиты', 'визитов', 'submits', 'account_num', 'created_flag',
-            'call_answered_flag', 'quality_flag', 'quality', 'динамика', 'тренд'
-        ]
-        
-        return any(keyword in question_lower for keyword in funnel_keywords)
+        return FUNNEL in INTENT_PARSER.scan(question.lower())
     
     def _is_utm_query(self, question: str) -> bool:
         """
         Определение, является ли запрос связанным с UTM-метками
         """
-        question_lower = question.lower()
-        utm_keywords = [
-            'utm', 'utm_campaign', 'utm_source', 'utm_medium', 'utm_content', 'utm_term',
-            'метки', 'метка', 'параметры', 'параметр'
-        ]
-        
-        return any(keyword in question_lower for keyword in utm_keywords)
+        return UTM in INTENT_PARSER.scan(question.lower())
     
-    def _generate_funnel_sql(self, question: str, utm_params: Dict[str, str] = None) -> str:
+    def _generate_funnel_sql(self, question: str, utm_params: Dict[str, str] = None,
+                             intent: Optional[QueryIntent] = None) -> SQLQuery:
         """
-        Генерация SQL запроса для анализа воронки
+        Генерация параметризованного SQL запроса для анализа воронки.
+
+        Тип запроса выбирает шаблон из FUNNEL_TEMPLATES, а SQL строится под
+        схему funnel_data (справочники UTM и целочисленные ключи или широкая таблица).
         """
-        question_lower = question.lower()
+        intent = intent or self.parse_intent(question)
+        params = []
         
         # Определяем тип анализа воронки
-        if any(word in question_lower for word in ['воронка', 'воронку', 'конверсия']):
-            # Анализ воронки для конкретной кампании
+        if intent.has(FUNNEL_TOTAL):
             if utm_params and 'utm_campaign' in utm_params:
-                campaign_value = utm_params['utm_campaign']
-                sql = f"""
-                SELECT 
-                    'Воронка конверсии' as metric,
-                    COUNT(DISTINCT visitID) as visits,
-                    SUM(submits) as submits,
-                    SUM(account_num) as accounts_opened,
-                    SUM(created_flag) as created,
-                    SUM(call_answered_flag) as calls_answered,
-                    SUM(quality_flag) as quality_leads,
-                    ROUND(SUM(submits) * 100.0 / COUNT(DISTINCT visitID), 2) as conversion_to_submits,
-                    ROUND(SUM(account_num) * 100.0 / SUM(submits), 2) as conversion_to_accounts,
-                    ROUND(SUM(quality_flag) * 100.0 / SUM(account_num), 2) as conversion_to_quality
-                FROM funnel_data 
-                WHERE utm_campaign = '{campaign_value}'
-                """
+                # Анализ воронки для конкретной кампании
+                kind = "campaign_funnel"
+                params = [utm_params['utm_campaign']]
             else:
                 # Общая воронка
-                sql = """
-                SELECT 
-                    'Общая воронка' as metric,
-                    COUNT(DISTINCT visit_id) as visits,
-                    SUM(submits) as submits,
-                    SUM(account_num) as accounts_opened,
-                    SUM(created_flag) as created,
-                    SUM(call_answered_flag) as calls_answered,
-                    SUM(quality_flag) as quality_leads,
-                    ROUND(SUM(submits) * 100.0 / COUNT(DISTINCT visit_id), 2) as conversion_to_submits,
-                    ROUND(SUM(account_num) * 100.0 / SUM(submits), 2) as conversion_to_accounts,
-                    ROUND(SUM(quality_flag) * 100.0 / SUM(account_num), 2) as conversion_to_quality
-                FROM funnel_data
-                """
-        
-        elif any(word in question_lower for word in ['сравни', 'сравнение', 'источники', 'каналы']):
+                kind = "total_funnel"
+        
+        elif intent.has(FUNNEL_SOURCES):
             # Сравнение источников
-            sql = """
-            SELECT 
-                utm_source,
-                COUNT(DISTINCT visit_id) as visits,
-                SUM(submits) as submits,
-                SUM(account_num) as accounts_opened,
-                SUM(quality_flag) as quality_leads,
-                ROUND(SUM(submits) * 100.0 / COUNT(DISTINCT visit_id), 2) as conversion_to_submits,
-                ROUND(SUM(account_num) * 100.0 / SUM(submits), 2) as conversion_to_accounts,
-                ROUND(SUM(quality_flag) * 100.0 / SUM(account_num), 2) as conversion_to_quality
-            FROM funnel_data 
-            WHERE utm_source IS NOT NULL
-            GROUP BY utm_source
-            ORDER BY visits DESC
-            """
-        
-        elif any(word in question_lower for word in ['динамика', 'тренд', 'по дням', 'график']):
+            kind = "sources"
+        
+        elif intent.has(FUNNEL_DAILY):
             # Динамика по дням
-            # Извлекаем название кампании из запроса
-            campaign_name = self._extract_campaign_name(question)
+            # Название кампании из запроса
+            campaign_name = intent.campaign_name
             if campaign_name:
-                sql = f"""
-                SELECT 
-                    date,
-                    COUNT(DISTINCT visit_id) as visits,
-                    SUM(submits) as submits,
-                    SUM(account_num) as accounts_opened,
-                    SUM(quality_flag) as quality_leads
-                FROM funnel_data 
-                WHERE utm_campaign = '{campaign_name}'
-                GROUP BY date
-                ORDER BY date
-                """
+                kind = "daily_campaign"
+                params = [campaign_name]
             elif utm_params and 'utm_campaign' in utm_params:
-                campaign_value = utm_params['utm_campaign']
-                sql = f"""
-                SELECT 
-                    date,
-                    COUNT(DISTINCT visit_id) as visits,
-                    SUM(submits) as submits,
-                    SUM(account_num) as accounts_opened,
-                    SUM(quality_flag) as quality_leads
-                FROM funnel_data 
-                WHERE utm_campaign = '{campaign_value}'
-                GROUP BY date
-                ORDER BY date
-                """
+                kind = "daily_campaign"
+                params = [utm_params['utm_campaign']]
             else:
-                sql = """
-                SELECT 
-                    date,
-                    COUNT(DISTINCT visit_id) as visits,
-                    SUM(submits) as submits,
-                    SUM(account_num) as accounts_opened,
-                    SUM(quality_flag) as quality_leads
-                FROM funnel_data 
-                GROUP BY date
-                ORDER BY date
-                """
-        
-        elif any(word in question_lower for word in ['топ', 'лучшие', 'лучший']):
+                kind = "daily"
+        
+        elif intent.has(LIMIT_TOP):
             # Топ кампаний
-            sql = """
-            SELECT 
-                utm_campaign,
-                COUNT(DISTINCT visit_id) as visits,
-                SUM(submits) as submits,
-                SUM(account_num) as accounts_opened,
-                SUM(quality_flag) as quality_leads,
-                ROUND(SUM(submits) * 100.0 / COUNT(DISTINCT visit_id), 2) as conversion_to_submits
-            FROM funnel_data 
-            WHERE utm_campaign IS NOT NULL
-            GROUP BY utm_campaign
-            ORDER BY submits DESC
-            LIMIT 10
-            """
+            kind = "top_campaigns"
         
         else:
             # Общая статистика
-            sql = """
-            SELECT 
-                COUNT(DISTINCT visit_id) as visits,
-                SUM(submits) as submits,
-                SUM(account_num) as accounts_opened,
-                SUM(created_flag) as created,
-                SUM(call_answered_flag) as calls_answered,
-                SUM(quality_flag) as quality_leads
-            FROM funnel_data
-            """
-        
-        return sql
+            kind = "totals"
+        
+        layout, sketches_ready = self._funnel_state()
+        # Скетчи читаются только в SQLite: hll_count зарегистрирована в соединениях пула
+        approximate = self.approximate_visits and sketches_ready and self.backend.name == BACKEND_SQLITE
+        template_key = f"funnel|{kind}|{layout}|{'approx' if approximate else 'exact'}"
+        sql = self.query_plans.get_or_build(template_key, lambda: render_funnel_sql(kind, layout, approximate))
+        return SQLQuery(sql, params, template_key)
+
+    def _funnel_state(self) -> Tuple[str, bool]:
+        """Схема funnel_data и актуальность скетчей визитов, перечитываются при смене версии данных"""
+        with self.pool.connection() as conn:
+            version = get_data_version(conn)
+            if self._funnel_state_cache is None or self._funnel_state_cache[0] != version:
+                self._funnel_state_cache = (version, funnel_layout(conn) or LAYOUT_WIDE, sketches_current(conn))
+        return self._funnel_state_cache[1], self._funnel_state_cache[2]
 
 # Пример использования
 if __name__ == "__main__":
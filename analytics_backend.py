@@ -0,0 +1,206 @@
+"""
+Движки выполнения аналитических запросов агента: SQLite (строчное хранение)
+и встроенное колоночное хранилище DuckDB, построенное из той же БД
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from connection_pool import SQLiteConnectionPool
+from data_version import DATA_VERSION_TABLE, get_data_version
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+BACKEND_SQLITE = "sqlite"
+BACKEND_DUCKDB = "duckdb"
+
+# Строк SQLite на одну пачку при копировании в колоночное хранилище
+COPY_CHUNK_ROWS = 100000
+
+
+class SQLiteBackend:
+    """Запросы выполняются в SQLite через пул соединений агента"""
+
+    name = BACKEND_SQLITE
+
+    def __init__(self, pool: SQLiteConnectionPool):
+        self.pool = pool
+
+    def read_sql(self, sql: str, params: Iterable = ()) -> pd.DataFrame:
+        with self.pool.connection() as conn:
+            return pd.read_sql_query(sql, conn, params=tuple(params))
+
+    def close(self):
+        pass
+
+
+def columnar_store_path(db_path: str) -> str:
+    """Файл колоночного хранилища рядом с файлом SQLite"""
+    return os.path.splitext(db_path)[0] + ".duckdb"
+
+
+def _copied_tables(conn: sqlite3.Connection) -> List[str]:
+    """
+    Таблицы SQLite, которые переносятся в колоночное хранилище.
+
+    Виртуальные таблицы (FTS5 справочник кампаний) переносятся как обычные -
+    агент читает из них только колонки, а служебные таблицы FTS5 пропускаются.
+    """
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()
+    virtual = [name for name, sql in rows if (sql or "").upper().startswith("CREATE VIRTUAL TABLE")]
+    return [
+        name for name, _ in rows
+        if not any(name.startswith(f"{table}_") for table in virtual)
+    ]
+
+
+def _column_types(conn: sqlite3.Connection, table: str) -> Dict[str, str]:
+    """
+    Типы колонок DuckDB по фактическим значениям: в SQLite колонка может
+    хранить и числа, и текст (например, visit_id вида 'visit_5'), а колонка
+    DuckDB строго типизирована
+    """
+    types = {}
+    for row in conn.execute(f'PRAGMA table_info("{table}")'):
+        column = row[1]
+        stored = {
+            value for (value,) in
+            conn.execute(f'SELECT DISTINCT typeof("{column}") FROM "{table}"')
+        } - {"null"}
+        if stored <= {"integer"}:
+            types[column] = "BIGINT"
+        elif stored <= {"integer", "real"}:
+            types[column] = "DOUBLE"
+        else:
+            types[column] = "VARCHAR"
+    return types
+
+
+_SQLITE_CAST = {"BIGINT": "INTEGER", "DOUBLE": "REAL", "VARCHAR": "TEXT"}
+
+
+def build_columnar_store(db_path: str, store_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Строит файл DuckDB с копией всех таблиц SQLite (факты, справочники,
+    rollup-таблицы и версия данных), поэтому SQL шаблоны агента выполняются
+    в нем без изменений.
+
+    Файл собирается во временном файле и подменяет прежний целиком.
+
+    Returns:
+        Количество строк в каждой перенесенной таблице
+    """
+    if not DUCKDB_AVAILABLE:
+        raise RuntimeError("duckdb не установлен: pip install duckdb")
+
+    store_path = store_path or columnar_store_path(db_path)
+    tmp_path = store_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    source = sqlite3.connect(db_path)
+    target = duckdb.connect(tmp_path)
+    copied = {}
+    try:
+        for table in _copied_tables(source):
+            types = _column_types(source, table)
+            definitions = [f'"{column}" {sql_type}' for column, sql_type in types.items()]
+            target.execute(f'CREATE TABLE "{table}" ({", ".join(definitions)})')
+            # Значения приводятся к выбранному типу еще в SQLite, чтобы пачка pandas была однородной
+            select = ", ".join(f'CAST("{c}" AS {_SQLITE_CAST[t]})' for c, t in types.items())
+            copied[table] = 0
+            for chunk in pd.read_sql_query(f'SELECT {select} FROM "{table}"', source, chunksize=COPY_CHUNK_ROWS):
+                target.register("chunk", chunk)
+                target.execute(f'INSERT INTO "{table}" SELECT * FROM chunk')
+                target.unregister("chunk")
+                copied[table] += len(chunk)
+        target.execute("CHECKPOINT")
+    finally:
+        target.close()
+        source.close()
+
+    os.replace(tmp_path, store_path)
+    return copied
+
+
+class DuckDBBackend:
+    """
+    Запросы выполняются в колоночном хранилище DuckDB.
+
+    Агрегаты SUM/COUNT DISTINCT читают только нужные колонки, а не строки
+    целиком. Хранилище строится из SQLite при первом обращении и
+    перестраивается, когда загрузчики меняют версию данных в SQLite.
+    """
+
+    name = BACKEND_DUCKDB
+
+    def __init__(self, pool: SQLiteConnectionPool, store_path: Optional[str] = None, threads: Optional[int] = None):
+        if not DUCKDB_AVAILABLE:
+            raise RuntimeError("duckdb не установлен: pip install duckdb")
+        self.pool = pool
+        self.store_path = store_path or columnar_store_path(pool.db_path)
+        self.threads = threads
+        self._conn = None
+        self._store_version = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = duckdb.connect(self.store_path, read_only=True)
+        if self.threads:
+            conn.execute(f"SET threads TO {int(self.threads)}")
+        try:
+            row = conn.execute(f"SELECT version FROM {DATA_VERSION_TABLE} WHERE id = 1").fetchone()
+        except duckdb.CatalogException:
+            row = None
+        return conn, row[0] if row else 0
+
+    def _cursor(self):
+        """
+        Новый курсор к актуальной версии хранилища. Курсор открывается на
+        запрос, а не на поток: потоки Streamlit не накапливают курсоры
+        """
+        with self.pool.connection() as conn:
+            version = get_data_version(conn)
+        with self._lock:
+            if self._conn is None and os.path.exists(self.store_path):
+                self._conn, self._store_version = self._open()
+            if self._conn is None or self._store_version != version:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                print(f"Построение колоночного хранилища {self.store_path} (версия данных {version})...")
+                build_columnar_store(self.pool.db_path, self.store_path)
+                self._conn, self._store_version = self._open()
+            return self._conn.cursor()
+
+    def read_sql(self, sql: str, params: Iterable = ()) -> pd.DataFrame:
+        cursor = self._cursor()
+        try:
+            return cursor.execute(sql, list(params)).df()
+        finally:
+            cursor.close()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_backend(backend: str, pool: SQLiteConnectionPool, **options):
+    """Движок выполнения запросов по имени: 'sqlite' или 'duckdb'"""
+    if backend == BACKEND_SQLITE:
+        return SQLiteBackend(pool)
+    if backend == BACKEND_DUCKDB:
+        return DuckDBBackend(pool, **options)
+    raise ValueError(f"Неизвестный движок запросов: {backend} (ожидается '{BACKEND_SQLITE}' или '{BACKEND_DUCKDB}')")
@@ -1,10 +1,12 @@
 import streamlit as st
 import pandas as pd
 from ai_agent import MarketingAnalyticsAgent
+from visit_sketches import approximate_visits_enabled
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import sqlite3
+import os
 
 # Проверяем доступность openpyxl
 try:
@@ -201,7 +203,14 @@ init_db.init_database()
 @st.cache_resource
 def get_agent():
     try:
-        return MarketingAnalyticsAgent()
+        # Движок отчетных запросов: sqlite (по умолчанию) или duckdb;
+        # FUNNEL_APPROX_VISITS=1 - визиты воронки по HyperLogLog-скетчам
+        # (загрузчики строят скетчи только с той же переменной окружения);
+        # RAG_INDEX=flat|fp16|sq8|hnsw|ivfpq - тип векторного индекса базы знаний
+        return MarketingAnalyticsAgent(
+            backend=os.environ.get("ANALYTICS_BACKEND", "sqlite"),
+            approximate_visits=approximate_visits_enabled()
+        )
     except Exception as e:
         st.error(f"Ошибка инициализации агента: {e}")
         return None
@@ -244,34 +253,43 @@ with chat_container:
             with st.chat_message("assistant"):
                 st.markdown(message["content"])
                 
-                # Кнопка скачивания отчета
-                if "excel_data" in message and message["excel_data"] and len(message["excel_data"]) > 0:
-                    # Определяем тип файла на основе доступности openpyxl
-                    if OPENPYXL_AVAILABLE:
-                        file_name = f"отчет_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                        mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        button_label = "📊 Скачать Excel отчет"
-                    else:
-                        file_name = f"отчет_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                        mime_type = "text/csv"
-                        button_label = "📊 Скачать CSV отчет"
-                    
-                    st.download_button(
-                        label=button_label,
-                        data=message["excel_data"],
-                        file_name=file_name,
-                        mime=mime_type
-                    )
-                elif "excel_data" in message and (not message["excel_data"] or len(message["excel_data"]) == 0):
-                    st.info("📊 Отчет недоступен")
+                # Кнопка скачивания отчета: файл строится по запросу пользователя
+                report_file = message.get("excel_data")
+                if report_file is not None:
+                    if not report_file.ready:
+                        if st.button("📄 Подготовить отчет для скачивания", key=f"prepare_report_{i}"):
+                            try:
+                                report_file.get()
+                            except Exception as e:
+                                print(f"Ошибка генерации отчета: {e}")
+                    report_bytes = report_file.get() if report_file.ready else None
+                    if report_bytes:
+                        st.download_button(
+                            label=report_file.label,
+                            data=report_bytes,
+                            file_name=report_file.file_name,
+                            mime=report_file.mime,
+                            key=f"download_report_{i}"
+                        )
+                    elif report_file.ready:
+                        st.info("📊 Отчет недоступен")
                 
-                # Отображение дашборда
-                if "dashboard_data" in message and message["dashboard_data"]:
+                # Отображение дашборда: данные строятся по запросу пользователя,
+                # а не на каждый перезапуск скрипта для всей истории чата
+                dashboard_artifact = message.get("dashboard_data")
+                dashboard_data = None
+                if dashboard_artifact is not None:
+                    if not dashboard_artifact.ready:
+                        if st.button("📊 Показать дашборд", key=f"show_dashboard_{i}"):
+                            try:
+                                dashboard_artifact.get()
+                            except Exception as e:
+                                print(f"Ошибка построения дашборда: {e}")
+                    dashboard_data = dashboard_artifact.get() if dashboard_artifact.ready else None
+                if dashboard_data:
                     st.markdown("---")
                     st.markdown("### 📊 Интерактивный дашборд")
                     
-                    dashboard_data = message["dashboard_data"]
-                    
                     # Основные метрики
                     if dashboard_data.get("metrics"):
                         metrics = dashboard_data["metrics"]
@@ -368,40 +386,15 @@ if st.session_state.pending_campaign_select:
     with col1:
         if st.button("📊 Показать отчет", key=f"show_report_{st.session_state.pending_user_question}"):
             if selected_campaign == "Все кампании":
-                # Для "Все кампаний" формируем SQL запрос для всех найденных кампаний
-                campaign_conditions = " OR ".join([f"\"Название кампании\" = '{campaign}'" for campaign in st.session_state.pending_campaign_select])
-                sql_query = f"""
-                SELECT 
-                    "Название кампании" as campaign_name,
-                    "Площадка" as platform,
-                    SUM("Показы") as impressions,
-                    SUM("Клики") as clicks,
-                    SUM("Расход до НДС") as cost,
-                    SUM("Визиты") as visits,
-                    ROUND(SUM("Клики") * 100.0 / SUM("Показы"), 2) as ctr,
-                    ROUND(SUM("Расход до НДС") / SUM("Клики"), 2) as cpc
-                FROM campaign_metrics 
-                WHERE {campaign_conditions}
-                GROUP BY "Название кампании", "Площадка"
-                ORDER BY "Название кампании" ASC
-                """
+                # Отчет по всем найденным кампаниям: кампании, площадки и итог одним запросом
+                sql_query = agent.campaign_report_query(campaign_names=st.session_state.pending_campaign_select) if agent else ""
                 if agent:
                     df = agent.execute_query(sql_query)
                     analysis = agent.analyze_data(df, str(st.session_state.pending_user_question))
                     response = agent.generate_report(analysis, str(st.session_state.pending_user_question), sql_query)
-                    dashboard_data = agent.generate_dashboard_data(analysis)
-                    try:
-                        excel_data = agent.generate_excel_report(analysis, str(st.session_state.pending_user_question))
-                        if not excel_data or len(excel_data) == 0:
-                            print("Excel данные пустые, пробуем CSV")
-                            excel_data = agent._generate_csv_report(analysis, str(st.session_state.pending_user_question))
-                    except Exception as e:
-                        print(f"Ошибка генерации Excel: {e}")
-                        try:
-                            excel_data = agent._generate_csv_report(analysis, str(st.session_state.pending_user_question))
-                        except Exception as csv_e:
-                            print(f"Ошибка генерации CSV: {csv_e}")
-                            excel_data = None
+                    # Файл отчета и дашборд строятся при обращении к ним
+                    dashboard_data = agent.dashboard_artifact(analysis)
+                    excel_data = agent.report_file(analysis, str(st.session_state.pending_user_question))
                     # SQL запрос передается отдельно
                 else:
                     response = "❌ Ошибка: агент недоступен"
@@ -411,24 +404,14 @@ if st.session_state.pending_campaign_select:
             else:
                 # Формируем SQL запрос только для выбранной кампании
                 # Используем LIKE для более гибкого поиска
-                sql_query = f"SELECT \"Название кампании\" as campaign_name, \"Площадка\" as platform, SUM(\"Показы\") as impressions, SUM(\"Клики\") as clicks, SUM(\"Расход до НДС\") as cost, SUM(\"Визиты\") as visits, ROUND(SUM(\"Клики\") * 100.0 / SUM(\"Показы\"), 2) as ctr, ROUND(SUM(\"Расход до НДС\") / SUM(\"Клики\"), 2) as cpc FROM campaign_metrics WHERE \"Название кампании\" LIKE '%{selected_campaign}%' GROUP BY \"Название кампании\", \"Площадка\" ORDER BY \"Название кампании\" ASC"
+                sql_query = agent.campaign_report_query(name_like=selected_campaign) if agent else ""
                 if agent:
                     df = agent.execute_query(sql_query)
                     analysis = agent.analyze_data(df, f"Сделай отчет по кампании {selected_campaign}")
                     response = agent.generate_report(analysis, f"Сделай отчет по кампании {selected_campaign}", sql_query)
-                    dashboard_data = agent.generate_dashboard_data(analysis)
-                    try:
-                        excel_data = agent.generate_excel_report(analysis, f"Сделай отчет по кампании {selected_campaign}")
-                        if not excel_data or len(excel_data) == 0:
-                            print("Excel данные пустые, пробуем CSV")
-                            excel_data = agent._generate_csv_report(analysis, f"Сделай отчет по кампании {selected_campaign}")
-                    except Exception as e:
-                        print(f"Ошибка генерации Excel: {e}")
-                        try:
-                            excel_data = agent._generate_csv_report(analysis, f"Сделай отчет по кампании {selected_campaign}")
-                        except Exception as csv_e:
-                            print(f"Ошибка генерации CSV: {csv_e}")
-                            excel_data = None
+                    # Файл отчета и дашборд строятся при обращении к ним
+                    dashboard_data = agent.dashboard_artifact(analysis)
+                    excel_data = agent.report_file(analysis, f"Сделай отчет по кампании {selected_campaign}")
                     # SQL запрос передается отдельно
                 else:
                     response = "❌ Ошибка: агент недоступен"
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк анализа результатов запросов: прежний обход iterrows()
+против векторизованного analyze_data / _analyze_funnel_data
+"""
+
+import random
+import sys
+import time
+
+import pandas as pd
+
+from ai_agent import MarketingAnalyticsAgent
+
+
+def make_campaign_frame(rows_count):
+    """Результат запроса по кампаниям и площадкам"""
+    random.seed(1)
+    platforms = ["Яндекс.Директ", "VK Реклама", "Telegram Ads", "MyTarget"]
+    rows = []
+    for i in range(rows_count):
+        impressions = random.randint(1000, 100000)
+        clicks = random.randint(10, 2000)
+        cost = round(random.uniform(1000, 50000), 2)
+        rows.append({
+            "campaign_name": f"РКО кампания {i // len(platforms)}",
+            "platform": platforms[i % len(platforms)],
+            "impressions": impressions, "clicks": clicks, "cost": cost, "visits": random.randint(5, 1500),
+            "ctr": round(clicks * 100.0 / impressions, 2), "cpc": round(cost / clicks, 2),
+        })
+    return pd.DataFrame(rows)
+
+
+def make_daily_frame(rows_count):
+    """Результат запроса динамики воронки"""
+    return pd.DataFrame({
+        "date": [f"2025-{1 + i // 28 % 12:02d}-{i % 28 + 1:02d}" for i in range(rows_count)],
+        "visits": range(rows_count), "submits": range(rows_count),
+        "accounts_opened": range(rows_count), "quality_leads": range(rows_count),
+    })
+
+
+def legacy_campaign_records(df):
+    """Прежняя реализация: запись на строку через iterrows() и row.get()"""
+    campaigns = []
+    for _, row in df.iterrows():
+        campaigns.append({
+            'campaign_name': row.get('campaign_name', '—'), 'platform': row.get('platform', '—'),
+            'impressions': row.get('impressions', 0), 'clicks': row.get('clicks', 0),
+            'cost': row.get('cost', 0), 'visits': row.get('visits', 0),
+            'ctr': row.get('ctr', 0), 'cpc': row.get('cpc', 0),
+        })
+    top = sorted(campaigns, key=lambda x: x.get('ctr', 0), reverse=True)[:5]
+    total_ctr = round((df['clicks'].sum() / df['impressions'].sum()) * 100, 2) if df['impressions'].sum() > 0 else 0
+    return campaigns, top, total_ctr
+
+
+def legacy_daily_records(df):
+    trends = []
+    for _, row in df.iterrows():
+        trends.append({
+            'date': row.get('date', '—'), 'visits': row.get('visits', 0), 'submits': row.get('submits', 0),
+            'accounts_opened': row.get('accounts_opened', 0), 'quality_leads': row.get('quality_leads', 0),
+        })
+    return trends
+
+
+def _measure(func, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = func()
+    return (time.perf_counter() - start) / repeats * 1000, result
+
+
+def run_benchmark(rows_count=5000, repeats=5):
+    # Анализ не обращается к БД и моделям - агент без инициализации
+    agent = MarketingAnalyticsAgent.__new__(MarketingAnalyticsAgent)
+
+    campaigns_df = make_campaign_frame(rows_count)
+    legacy_ms, (legacy_campaigns, legacy_top, _) = _measure(lambda: legacy_campaign_records(campaigns_df), repeats)
+    new_ms, analysis = _measure(lambda: agent.analyze_data(campaigns_df, "Покажи кампании по площадкам"), repeats)
+    summary = analysis["summary"]
+    assert summary["campaigns"] == legacy_campaigns
+    assert summary["top_campaigns"] == legacy_top
+    print(f"📊 analyze_data, {rows_count:,} строк кампания×площадка")
+    print(f"   iterrows: {legacy_ms:8.1f} мс   векторизовано: {new_ms:8.1f} мс   x{legacy_ms / new_ms:.1f}")
+
+    daily_df = make_daily_frame(rows_count)
+    legacy_ms, legacy_trends = _measure(lambda: legacy_daily_records(daily_df), repeats)
+    new_ms, analysis = _measure(lambda: agent._analyze_funnel_data(daily_df, "динамика воронки"), repeats)
+    assert analysis["summary"]["daily_trends"] == legacy_trends
+    print(f"📊 _analyze_funnel_data, {rows_count:,} дней")
+    print(f"   iterrows: {legacy_ms:8.1f} мс   векторизовано: {new_ms:8.1f} мс   x{legacy_ms / new_ms:.1f}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк движков запросов агента: SQLite против колоночного хранилища DuckDB
+на одних и тех же SQL шаблонах (формы запросов из index_advisor)
+"""
+
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from analytics_backend import DuckDBBackend, SQLiteBackend, build_columnar_store
+from benchmark_csv_parser import write_sample
+from campaign_index import build_campaign_index
+from connection_pool import SQLiteConnectionPool
+from fast_csv_loader import fast_load_csv_to_db
+from incremental_loader import append_campaign_metrics
+from index_advisor import agent_query_shapes, ensure_query_indexes
+
+# Значения параметров для шаблонов с фильтром (кампания из write_sample)
+SHAPE_PARAMS = {
+    "funnel|campaign_funnel": ["100003"],
+    "funnel|daily_campaign": ["100003"],
+    "campaigns|report": ["%РКО%"],
+    "campaigns|by_day": ["Годовая кампания. Самозанятые ИП 2025"],
+}
+
+
+def _measure(backend, sql, params, repeats):
+    backend.read_sql(sql, params)  # прогрев
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.read_sql(sql, params)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def run_benchmark(funnel_rows=1000000, repeats=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "funnel.csv")
+        db_path = os.path.join(tmp, "bench.db")
+        write_sample(csv_path, funnel_rows)
+        fast_load_csv_to_db(csv_path, db_path)
+
+        conn = sqlite3.connect(db_path)
+        append_campaign_metrics(conn, "rko_econometric_sample.csv")
+        build_campaign_index(conn)
+        ensure_query_indexes(conn)
+        shapes = agent_query_shapes(conn)
+        conn.close()
+
+        start = time.perf_counter()
+        build_columnar_store(db_path)
+        print(f"\n📦 Колоночное хранилище построено за {time.perf_counter() - start:.1f} сек")
+
+        pool = SQLiteConnectionPool(db_path)
+        sqlite_backend = SQLiteBackend(pool)
+        duckdb_backend = DuckDBBackend(pool)
+
+        print(f"\n📊 funnel_data: {funnel_rows:,} строк, медиана из {repeats} запусков\n")
+        print(f"{'Запрос':<36} {'SQLite, мс':>12} {'DuckDB, мс':>12} {'Ускорение':>10}")
+        for shape in shapes:
+            params = SHAPE_PARAMS.get(shape.name, [])
+            sqlite_ms = _measure(sqlite_backend, shape.sql, params, repeats)
+            duckdb_ms = _measure(duckdb_backend, shape.sql, params, repeats)
+            print(f"{shape.name:<36} {sqlite_ms:12.1f} {duckdb_ms:12.1f} {sqlite_ms / duckdb_ms:9.1f}x")
+
+        duckdb_backend.close()
+        pool.close_all()
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
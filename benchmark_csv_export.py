@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк выгрузки детализации в CSV: прежняя сборка строк f-строками
+со списком всех строк против csv_export (csv.writer, поток кусков)
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+
+from csv_export import iter_csv
+from excel_export import CAMPAIGN_COLUMNS, records_sheet
+
+
+def campaign_records(rows_count):
+    """Записи кампаний, как их отдает analyze_data"""
+    random.seed(5)
+    platforms = ["Яндекс.Директ", "VK Реклама", "Telegram Ads", "MyTarget"]
+    for i in range(rows_count):
+        impressions = random.randint(1000, 100000)
+        clicks = random.randint(10, 2000)
+        cost = round(random.uniform(1000, 50000), 2)
+        yield {
+            "campaign_name": f"РКО кампания {i // 4}", "platform": platforms[i % 4],
+            "impressions": impressions, "clicks": clicks, "cost": cost, "visits": random.randint(5, 1500),
+            "ctr": round(clicks * 100.0 / impressions, 2), "cpc": round(cost / clicks, 2),
+        }
+
+
+def legacy_export(records):
+    """Прежний _generate_csv_report: f-строки с разделителями разрядов, join всего файла"""
+    csv_lines = ["ДЕТАЛЬНАЯ СТАТИСТИКА ПО КАМПАНИЯМ", "Кампания,Площадка,Показы,Клики,Расход (₽),Визиты,CTR (%),CPC (₽)"]
+    for campaign in records:
+        csv_lines.append(f"\"{campaign.get('campaign_name', '—')}\","
+                         f"\"{campaign.get('platform', '—')}\","
+                         f"{campaign.get('impressions', 0):,},"
+                         f"{campaign.get('clicks', 0):,},"
+                         f"{campaign.get('cost', 0):,.2f},"
+                         f"{campaign.get('visits', 0):,},"
+                         f"{campaign.get('ctr', 0):.2f},"
+                         f"{campaign.get('cpc', 0):.2f}")
+    return len("\n".join(csv_lines).encode('utf-8-sig'))
+
+
+def streaming_export(records):
+    size = 0
+    for chunk in iter_csv([records_sheet("Детальная статистика", CAMPAIGN_COLUMNS, records)]):
+        size += len(chunk)
+    return size
+
+
+def _measure(func, rows_count, trace):
+    records = campaign_records(rows_count)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    size = func(records)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    if trace:
+        tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def run_benchmark(rows_count=1000000):
+    print(f"📊 Выгрузка {rows_count:,} строк кампаний в CSV")
+    for name, func in [("f-строки + join", legacy_export), ("csv.writer поток", streaming_export)]:
+        # Время без tracemalloc, пик памяти - отдельным прогоном
+        elapsed, _, size = _measure(func, rows_count, trace=False)
+        _, peak, _ = _measure(func, rows_count, trace=True)
+        print(f"   {name:<17} {elapsed:6.2f} с, пик памяти {peak / 2**20:7.1f} МБ, файл {size / 2**20:6.1f} МБ")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
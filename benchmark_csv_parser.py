@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк разбора выгрузки воронки: построчный parse_csv_line против
+пачечного разбора модулем csv (parse_export_block)
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from fast_csv_loader import iter_export_blocks, iter_funnel_rows, parse_csv_line
+
+HEADER = ('﻿"date,""lastTrafficSource"",""UTMCampaign_clear"",""UTMSource"",""UTMMedium"",'
+          '""UTMContent"",""UTMTerm"",""visitID"",""submits"",""res"",""subs_all"",""account_num"",'
+          '""created_flag"",""call_answered_flag"",""quality_flag"",""quality""";;;;\n')
+
+
+def write_sample(path, rows_count):
+    """Синтетическая выгрузка в формате head_funnel_sample.csv"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HEADER)
+        for i in range(rows_count):
+            f.write(
+                f'"2025-05-{i % 28 + 1:02d},Ad traffic,""{100000 + i % 5000}"",yandex,cpc,'
+                f'|cid|{i}|gid|5471099176|ad|16331752758|src|none_search|geo|54|,'
+                f'""term_{i % 977}"",{i},1.0,0.0,1.0,{i % 2},0,0,{i % 3 == 0:d},0";;;;\n'
+            )
+
+
+def _measure(label, func, rows_count):
+    start = time.perf_counter()
+    parsed = func()
+    elapsed = time.perf_counter() - start
+    assert parsed == rows_count, f"{label}: разобрано {parsed} строк из {rows_count}"
+    rate = rows_count / elapsed
+    print(f"{label:<45} {elapsed:8.2f} сек  {rate:12,.0f} строк/сек")
+    return rate
+
+
+def run_benchmark(rows_count=500000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "funnel.csv")
+        write_sample(path, rows_count)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"📊 Выгрузка: {rows_count:,} строк, {size_mb:.1f} МБ\n")
+
+        def legacy_parse():
+            with open(path, encoding="utf-8") as f:
+                next(f)
+                return sum(1 for line in f if parse_csv_line(line))
+
+        def block_parse():
+            with open(path, encoding="utf-8-sig", newline="") as f:
+                f.readline()
+                return sum(len(rows) for rows in iter_export_blocks(f))
+
+        def block_parse_typed():
+            return sum(1 for _ in iter_funnel_rows(path))
+
+        legacy = _measure("parse_csv_line (построчно)", legacy_parse, rows_count)
+        block = _measure("parse_export_block (пачками)", block_parse, rows_count)
+        typed = _measure("iter_funnel_rows (пачками + типы)", block_parse_typed, rows_count)
+
+        print(f"\n🚀 Ускорение разбора: x{block / legacy:.1f}, с приведением типов: x{typed / legacy:.1f}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
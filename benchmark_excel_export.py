@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк выгрузки детализации кампания×день в Excel: прежняя книга в памяти
+(Workbook() + BytesIO) против потоковой записи excel_export (write_only)
+"""
+
+import io
+import random
+import sys
+import time
+import tracemalloc
+
+from excel_export import CAMPAIGN_DAY_HEADER, OPENPYXL_AVAILABLE, Sheet, export_to_spool
+
+# Книга в памяти занимает сотни байт на ячейку - прежний способ меряем на меньшем объеме
+LEGACY_MAX_ROWS = 100000
+
+
+def detail_rows(rows_count):
+    """Строки детализации, как их отдает курсор campaign_day_rows"""
+    random.seed(3)
+    for i in range(rows_count):
+        impressions = random.randint(100, 50000)
+        clicks = random.randint(1, 1000)
+        cost = round(random.uniform(100, 30000), 2)
+        yield (
+            f"2025-{1 + i // 2000 % 12:02d}-{1 + i // 100 % 28:02d}", f"РКО кампания {i % 2000}",
+            impressions, clicks, cost, random.randint(0, 800),
+            round(clicks * 100.0 / impressions, 2), round(cost / clicks, 2),
+        )
+
+
+def legacy_export(rows_count):
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Детализация по дням"
+    ws.append(CAMPAIGN_DAY_HEADER)
+    for row in detail_rows(rows_count):
+        ws.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return len(buffer.getvalue())
+
+
+def streaming_export(rows_count):
+    with export_to_spool([Sheet("Детализация по дням", CAMPAIGN_DAY_HEADER, detail_rows(rows_count))]) as spool:
+        spool.seek(0, io.SEEK_END)
+        return spool.tell()
+
+
+def _measure(func, rows_count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func(rows_count)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def run_benchmark(rows_count=500000):
+    if not OPENPYXL_AVAILABLE:
+        print("⚠️ openpyxl не установлен: pip install openpyxl")
+        return
+
+    legacy_rows = min(rows_count, LEGACY_MAX_ROWS)
+    print(f"📊 Выгрузка детализации кампания×день в Excel")
+    elapsed, peak, size = _measure(legacy_export, legacy_rows)
+    print(f"   Workbook() в памяти, {legacy_rows:>9,} строк: {elapsed:7.1f} с, "
+          f"пик памяти {peak / 2**20:8.1f} МБ, файл {size / 2**20:6.1f} МБ")
+    elapsed, peak, size = _measure(streaming_export, rows_count)
+    print(f"   write_only потоком,  {rows_count:>9,} строк: {elapsed:7.1f} с, "
+          f"пик памяти {peak / 2**20:8.1f} МБ, файл {size / 2**20:6.1f} МБ")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
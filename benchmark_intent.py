@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк разбора вопроса: прежние проверки any(word in question) по каждому
+списку ключевых слов против одного прохода IntentParser
+"""
+
+import random
+import sys
+import time
+
+from query_intent import INTENT_KEYWORDS, INTENT_PARSER
+
+FILLER = ["покажи", "отчет", "по", "кампании", "за", "май", "для", "бизнеса", "в", "разрезе", "и", "статистику"]
+
+
+def questions(count):
+    random.seed(11)
+    words = [word for group in INTENT_KEYWORDS.values() for word in group]
+    for _ in range(count):
+        parts = random.choices(FILLER, k=random.randint(4, 12)) + random.choices(words, k=random.randint(0, 3))
+        random.shuffle(parts)
+        yield " ".join(parts)
+
+
+def keyword_scans(text):
+    # Каждый этап конвейера заново перебирал свои списки
+    return frozenset(flag for flag, group in INTENT_KEYWORDS.items() if any(word in text for word in group))
+
+
+def run_benchmark(count=100000):
+    texts = [question.lower() for question in questions(count)]
+    print(f"📊 Разбор {count:,} вопросов, {sum(len(group) for group in INTENT_KEYWORDS.values())} ключевых слов")
+    for name, func in [("any() по спискам", keyword_scans), ("IntentParser", INTENT_PARSER.scan)]:
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        elapsed = time.perf_counter() - start
+        print(f"   {name:<17} {elapsed:6.2f} с, {elapsed / count * 1e6:6.1f} мкс на вопрос")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк RAG-обогащения пакета вопросов: цикл search по одному запросу
+против search_batch (один model.encode и один index.search на весь пакет)
+"""
+
+import sys
+import time
+
+from embedding_cache import EmbeddingCache
+from simple_vector_rag import SimpleVectorRAG
+
+TEMPLATES = [
+    "как снизить стоимость клика на площадке {i}",
+    "почему упала конверсия кампании {i} за неделю",
+    "какие показатели смотреть для оценки кампании {i}",
+    "что влияет на расход рекламного бюджета в месяце {i}",
+    "как сравнить эффективность каналов в отчете {i}",
+]
+
+
+def questions(count):
+    # Уникальные, не словарные вопросы - каждый требует эмбеддинга
+    return [TEMPLATES[i % len(TEMPLATES)].format(i=i) for i in range(count)]
+
+
+def run_benchmark(count=200):
+    rag = SimpleVectorRAG(query_cache_file=None)
+    # Модель загружается до замеров
+    rag.search("прогрев модели")
+    batch = questions(count)
+    print(f"📊 RAG-обогащение {count} вопросов, модель {rag.model_name}")
+
+    results = {}
+    for name, run in [
+        ("цикл search", lambda: [rag.search(question, top_k=2) for question in batch]),
+        ("search_batch", lambda: rag.search_batch(batch, top_k=2)),
+    ]:
+        # Без кэша эмбеддингов: каждый прогон кодирует все вопросы
+        rag.query_cache = EmbeddingCache(None, rag.index.d)
+        start = time.perf_counter()
+        results[name] = run()
+        elapsed = time.perf_counter() - start
+        print(f"   {name:<13} {elapsed:6.2f} с, {count / elapsed:8.1f} вопросов/с")
+
+    same = all(
+        [item["term"] for item in single] == [item["term"] for item in batched]
+        for single, batched in zip(results["цикл search"], results["search_batch"])
+    )
+    print(f"   Результаты совпадают: {'да' if same else 'нет'}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк типов векторного индекса базы знаний (knowledge_embeddings.INDEX_KINDS):
+время построения (с обучением), размер, задержка поиска и recall@k
+относительно точного IndexFlatIP на синтетических кластеризованных векторах
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from knowledge_embeddings import INDEX_KINDS, build_index, evaluate_index, index_spec
+
+DIM = 384  # all-MiniLM-L6-v2
+QUERIES = 500
+TOP_K = 10
+
+
+def clustered_vectors(count, dim=DIM, clusters=200, seed=5):
+    """Нормализованные векторы вокруг центров - похоже на эмбеддинги фрагментов текста"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, count)] + rng.normal(scale=0.4, size=(count, dim))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_benchmark(count=50000):
+    vectors = clustered_vectors(count)
+    rng = np.random.default_rng(9)
+    queries = vectors[rng.integers(0, count, QUERIES)] + rng.normal(scale=0.05, size=(QUERIES, DIM)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"📊 {count:,} векторов x {DIM}, {QUERIES} запросов, recall@{TOP_K} относительно точного поиска")
+    print(f"   {'тип':<6} {'индекс':<16} {'построение':>11} {'размер':>10} {'поиск':>12} {'recall':>7}")
+    for kind in INDEX_KINDS:
+        start = time.perf_counter()
+        index = build_index(kind, vectors)
+        built = time.perf_counter() - start
+        report = evaluate_index(index, vectors, queries, TOP_K)
+        print(f"   {kind:<6} {index_spec(kind, DIM, count):<16} {built:9.2f} с "
+              f"{report['memory_bytes'] / 2**20:7.1f} МБ {report['latency_ms']:8.3f} мс "
+              f"{report['recall_at_k']:7.3f}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
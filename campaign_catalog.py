@@ -0,0 +1,281 @@
+"""
+Резидентный каталог названий кампаний с триграммным индексом
+"""
+
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from campaign_index import CAMPAIGN_DIM_TABLE, get_campaign_name_column, normalize_campaign_name
+from connection_pool import SQLiteConnectionPool
+from data_version import get_data_version
+from fuzzy_match import batch_bounded_levenshtein, encode_strings
+
+_EMPTY_POSTINGS = np.empty(0, dtype=np.int32)
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    """Множество n-грамм строки"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def name_tokens(name: str) -> Tuple[str, ...]:
+    """
+    Слова названия в верхнем регистре и склейки соседних слов.
+
+    Склейки нужны для терминов, написанных слитно: "БИЗНЕСФЕСТ" для "Бизнес-Фест".
+    """
+    words = re.findall(r"[^\W_]+", name.upper())
+    return tuple(words) + tuple(a + b for a, b in zip(words, words[1:]))
+
+
+class CampaignCatalog:
+    """
+    Каталог названий кампаний, загружаемый из БД один раз.
+
+    Названия держатся в памяти вместе с инвертированным индексом
+    n-грамма -> id названий. Поиск подстроки пересекает списки только для
+    n-грамм термина и проверяет небольшое множество кандидатов. Каталог
+    перечитывается, когда загрузчики меняют версию данных (data_version);
+    при этом в индекс добавляются и из него удаляются только изменившиеся названия.
+
+    Для нечеткого поиска (fuzzy_search) дополнительно хранится словарь слов
+    названий со своим n-граммным индексом: общие n-граммы считаются сразу для
+    всех названий и слов через numpy.bincount, а расстояние Левенштейна
+    досчитывается только для слов, которые могут пройти порог.
+    """
+
+    def __init__(self, pool: SQLiteConnectionPool, n: int = 3):
+        self.pool = pool
+        self.n = n
+        self.version: Optional[int] = None
+
+        self._names: List[Optional[str]] = []
+        self._normalized: List[Optional[str]] = []
+        self._tokens: List[Tuple[str, ...]] = []
+        self._ids: Dict[str, int] = {}
+        self._postings: Dict[str, Set[int]] = {}
+
+        # Словарь слов: слово -> id, n-грамма -> id слов, id слова -> id названий
+        self._token_ids: Dict[str, int] = {}
+        self._token_list: List[str] = []
+        self._token_postings: Dict[str, Set[int]] = {}
+        self._token_names: List[Set[int]] = []
+
+        # Массивы numpy для поиска, строятся лениво и сбрасываются при обновлении
+        self._arrays: Dict[Tuple[str, object], np.ndarray] = {}
+        self._token_codes: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._name_ranks: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+
+    def _load_names(self, conn: sqlite3.Connection) -> List[str]:
+        """Читает названия кампаний: из справочника, если он есть, иначе из таблицы фактов"""
+        try:
+            return [row[0] for row in conn.execute(f"SELECT campaign_name FROM {CAMPAIGN_DIM_TABLE}")]
+        except sqlite3.OperationalError:
+            pass
+
+        name_column = get_campaign_name_column(conn)
+        if name_column is None:
+            return []
+        return [
+            row[0] for row in conn.execute(
+                f'SELECT DISTINCT "{name_column}" FROM campaign_metrics WHERE "{name_column}" IS NOT NULL'
+            )
+        ]
+
+    def _add(self, name: str):
+        normalized = normalize_campaign_name(name)
+        name_id = len(self._names)
+        self._names.append(name)
+        self._normalized.append(normalized)
+        self._ids[name] = name_id
+        for gram in ngrams(normalized, self.n):
+            self._postings.setdefault(gram, set()).add(name_id)
+
+        tokens = name_tokens(name)
+        self._tokens.append(tokens)
+        for token in tokens:
+            token_id = self._token_ids.get(token)
+            if token_id is None:
+                token_id = len(self._token_list)
+                self._token_ids[token] = token_id
+                self._token_list.append(token)
+                self._token_names.append(set())
+                for gram in ngrams(token, self.n):
+                    self._token_postings.setdefault(gram, set()).add(token_id)
+            self._token_names[token_id].add(name_id)
+
+    def _remove(self, name: str):
+        name_id = self._ids.pop(name)
+        for gram in ngrams(self._normalized[name_id], self.n):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(name_id)
+                if not postings:
+                    del self._postings[gram]
+        for token in self._tokens[name_id]:
+            self._token_names[self._token_ids[token]].discard(name_id)
+        self._names[name_id] = None
+        self._normalized[name_id] = None
+        self._tokens[name_id] = ()
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Обновляет каталог, если изменилась версия данных.
+
+        Returns:
+            True, если каталог был перечитан
+        """
+        with self.pool.connection() as conn:
+            version = get_data_version(conn)
+            if not force and version == self.version:
+                return False
+
+            with self._lock:
+                if not force and version == self.version:
+                    return False
+
+                names = set(self._load_names(conn))
+                current = set(self._ids)
+                for name in current - names:
+                    self._remove(name)
+                for name in sorted(names - current):
+                    self._add(name)
+
+                # Компактируем id, если удаленных названий стало много
+                if len(self._names) > 2 * max(len(self._ids), 1):
+                    remaining = [name for name in self._names if name is not None]
+                    self._names, self._normalized, self._tokens = [], [], []
+                    self._ids, self._postings = {}, {}
+                    self._token_ids, self._token_list = {}, []
+                    self._token_postings, self._token_names = {}, []
+                    for name in remaining:
+                        self._add(name)
+
+                self._arrays.clear()
+                self._token_codes = None
+                self._name_ranks = None
+
+                self.version = version
+            return True
+
+    def names(self) -> List[str]:
+        """Все названия кампаний каталога"""
+        self.refresh()
+        with self._lock:
+            return [name for name in self._names if name is not None]
+
+    def search(self, term: str) -> List[str]:
+        """Названия кампаний, содержащие термин (после нормализации)"""
+        self.refresh()
+        normalized_term = normalize_campaign_name(term)
+        if not normalized_term:
+            return []
+
+        with self._lock:
+            grams = ngrams(normalized_term, self.n)
+            if grams:
+                postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                # Термин короче n-граммы - проверяем все названия
+                candidates = self._ids.values()
+
+            return [
+                self._names[name_id] for name_id in sorted(candidates)
+                if normalized_term in self._normalized[name_id]
+            ]
+
+    def _as_array(self, key: Tuple[str, object], ids: Optional[Set[int]]) -> np.ndarray:
+        """Множество id в виде массива numpy (кэшируется до обновления каталога)"""
+        array = self._arrays.get(key)
+        if array is None:
+            array = np.fromiter(ids, dtype=np.int32, count=len(ids)) if ids else _EMPTY_POSTINGS
+            self._arrays[key] = array
+        return array
+
+    def _shared_ngrams(self, grams: Set[str], postings: Dict[str, Set[int]], kind: str, size: int) -> np.ndarray:
+        """Число общих n-грамм термина с каждым элементом индекса"""
+        arrays = [self._as_array((kind, gram), postings.get(gram)) for gram in grams]
+        return np.bincount(np.concatenate(arrays), minlength=size)
+
+    def fuzzy_search(self, term: str, threshold: int = 80, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Нечеткий поиск названий кампаний.
+
+        Оценка (0-100): 100, если термин входит в название (после нормализации),
+        иначе сходство по расстоянию Левенштейна с лучшим словом названия
+        (или склейкой двух соседних слов).
+
+        Args:
+            term: Поисковый термин
+            threshold: Минимальная оценка в процентах
+            limit: Максимальное число результатов
+
+        Returns:
+            Список (название, оценка), отсортированный по убыванию оценки
+        """
+        self.refresh()
+        normalized_term = normalize_campaign_name(term)
+        if not normalized_term:
+            return []
+
+        grams = ngrams(normalized_term, self.n)
+        if not grams:
+            # Термин короче n-граммы - только точное вхождение
+            return [(name, 100.0) for name in self.search(term)][:limit]
+
+        with self._lock:
+            # Точное вхождение: все n-граммы термина есть в названии, подстрока проверяется
+            shared = self._shared_ngrams(grams, self._postings, "name", len(self._names))
+            scores = np.zeros(len(self._names))
+            for name_id in np.flatnonzero(shared == len(grams)).tolist():
+                if normalized_term in self._normalized[name_id]:
+                    scores[name_id] = 100.0
+
+            # Кандидаты для расстояния Левенштейна: слова подходящей длины
+            # с достаточным числом общих n-грамм (каждая правка разрушает не более n n-грамм)
+            if self._token_codes is None:
+                self._token_codes = encode_strings(self._token_list)
+            codes, lengths = self._token_codes
+            term_length = len(normalized_term)
+            longest = np.maximum(lengths, term_length)
+            limits = np.floor(longest * (100 - threshold) / 100.0 + 1e-9).astype(np.int32)
+            token_shared = self._shared_ngrams(grams, self._token_postings, "token", len(self._token_list))
+            candidates = np.flatnonzero(
+                (token_shared >= np.maximum(1, len(grams) - self.n * limits)) &
+                (np.abs(lengths - term_length) <= limits)
+            )
+
+            if len(candidates):
+                distances = batch_bounded_levenshtein(
+                    normalized_term, codes[candidates], lengths[candidates], limits[candidates]
+                )
+                passed = distances <= limits[candidates]
+                token_ids = candidates[passed]
+                similarities = 100.0 * (1 - distances[passed] / longest[token_ids])
+                name_arrays = [self._as_array(("names", token_id), self._token_names[token_id])
+                               for token_id in token_ids.tolist()]
+                if name_arrays:
+                    sizes = [len(array) for array in name_arrays]
+                    np.maximum.at(scores, np.concatenate(name_arrays), np.repeat(similarities, sizes))
+
+            # Ранжируем по оценке, при равенстве - по названию
+            if self._name_ranks is None:
+                order = sorted(range(len(self._names)), key=lambda name_id: self._names[name_id] or "")
+                self._name_ranks = np.empty(len(order), dtype=np.int32)
+                self._name_ranks[order] = np.arange(len(order), dtype=np.int32)
+            matched = np.flatnonzero(scores >= threshold)
+            rounded = np.round(scores[matched], 1)
+            ranking = np.lexsort((self._name_ranks[matched], -rounded))[:limit]
+            return [
+                (self._names[name_id], score)
+                for name_id, score in zip(matched[ranking].tolist(), rounded[ranking].tolist())
+            ]
+
+    def __len__(self) -> int:
+        return len(self._ids)
@@ -0,0 +1,162 @@
+"""
+Справочник кампаний с нормализованными названиями для быстрого поиска
+"""
+
+import os
+import re
+import sqlite3
+from typing import Optional
+
+# Таблица-справочник и полнотекстовый индекс по триграммам
+CAMPAIGN_DIM_TABLE = "campaign_dim"
+CAMPAIGN_FTS_TABLE = "campaign_name_fts"
+
+# Возможные названия колонки с названием кампании в campaign_metrics
+CAMPAIGN_NAME_COLUMNS = ["Название кампании", "campaign_name"]
+
+_SEPARATORS_RE = re.compile(r"[\s\-_]+")
+
+
+def normalize_campaign_name(name: str) -> str:
+    """Нормализация названия: верхний регистр (включая кириллицу), без пробелов, дефисов и подчеркиваний"""
+    return _SEPARATORS_RE.sub("", str(name).upper())
+
+
+def fts5_trigram_available(conn: sqlite3.Connection) -> bool:
+    """Проверяет, поддерживает ли SQLite FTS5 с токенизатором trigram"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize='trigram')")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def get_campaign_name_column(conn: sqlite3.Connection) -> Optional[str]:
+    """Возвращает название колонки с названием кампании в campaign_metrics"""
+    if not _table_exists(conn, "campaign_metrics"):
+        return None
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(campaign_metrics)")]
+    for column in CAMPAIGN_NAME_COLUMNS:
+        if column in columns:
+            return column
+    return None
+
+
+def get_campaign_lookup_table(conn: sqlite3.Connection) -> Optional[str]:
+    """Таблица для поиска по нормализованному названию: FTS5 индекс, справочник или None"""
+    if _table_exists(conn, CAMPAIGN_FTS_TABLE):
+        return CAMPAIGN_FTS_TABLE
+    if _table_exists(conn, CAMPAIGN_DIM_TABLE):
+        return CAMPAIGN_DIM_TABLE
+    return None
+
+
+def build_campaign_index(conn: sqlite3.Connection) -> int:
+    """
+    Строит справочник кампаний по campaign_metrics.
+
+    campaign_dim хранит название и его нормализованную форму (с индексом),
+    campaign_name_fts - триграммный FTS5 индекс по нормализованной форме, если
+    он доступен. Поиск по подстроке идет по справочнику из десятков строк,
+    а не по всей таблице фактов.
+
+    Returns:
+        Количество кампаний в справочнике
+    """
+    name_column = get_campaign_name_column(conn)
+    if name_column is None:
+        print("Таблица campaign_metrics не найдена, справочник кампаний не создан")
+        return 0
+
+    names = [
+        row[0] for row in conn.execute(
+            f'SELECT DISTINCT "{name_column}" FROM campaign_metrics WHERE "{name_column}" IS NOT NULL'
+        )
+    ]
+    rows = [(name, normalize_campaign_name(name)) for name in names]
+
+    conn.execute(f"DROP TABLE IF EXISTS {CAMPAIGN_FTS_TABLE}")
+    conn.execute(f"DROP TABLE IF EXISTS {CAMPAIGN_DIM_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {CAMPAIGN_DIM_TABLE} (
+            campaign_name TEXT PRIMARY KEY,
+            normalized_name TEXT NOT NULL
+        )
+    """)
+    conn.executemany(f"INSERT INTO {CAMPAIGN_DIM_TABLE} VALUES (?, ?)", rows)
+    conn.execute(f"CREATE INDEX idx_campaign_dim_normalized ON {CAMPAIGN_DIM_TABLE}(normalized_name)")
+
+    if fts5_trigram_available(conn):
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE {CAMPAIGN_FTS_TABLE}
+            USING fts5(normalized_name, campaign_name UNINDEXED, tokenize='trigram')
+        """)
+        conn.execute(f"""
+            INSERT INTO {CAMPAIGN_FTS_TABLE} (normalized_name, campaign_name)
+            SELECT normalized_name, campaign_name FROM {CAMPAIGN_DIM_TABLE}
+        """)
+
+    # Найденные названия подставляются в IN (...) по таблице фактов
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS idx_campaign_metrics_name ON campaign_metrics("{name_column}")'
+    )
+    conn.commit()
+    return len(rows)
+
+
+def add_campaign_names(conn: sqlite3.Connection, names) -> int:
+    """
+    Добавляет новые названия в готовый справочник (инкрементальная загрузка).
+
+    Returns:
+        Количество добавленных названий
+    """
+    if get_campaign_lookup_table(conn) is None:
+        return 0
+
+    existing = {
+        row[0] for row in conn.execute(f"SELECT campaign_name FROM {CAMPAIGN_DIM_TABLE}")
+    }
+    rows = [
+        (name, normalize_campaign_name(name))
+        for name in dict.fromkeys(names) if name is not None and name not in existing
+    ]
+    conn.executemany(f"INSERT INTO {CAMPAIGN_DIM_TABLE} VALUES (?, ?)", rows)
+    if _table_exists(conn, CAMPAIGN_FTS_TABLE):
+        conn.executemany(
+            f"INSERT INTO {CAMPAIGN_FTS_TABLE} (normalized_name, campaign_name) VALUES (?, ?)",
+            [(normalized, name) for name, normalized in rows]
+        )
+    return len(rows)
+
+
+def ensure_campaign_index(db_path: str) -> Optional[str]:
+    """
+    Создает справочник кампаний в уже существующей БД, если его еще нет.
+
+    Returns:
+        Таблица для поиска (см. get_campaign_lookup_table) или None
+    """
+    if not os.path.exists(db_path):
+        return None
+
+    conn = sqlite3.connect(db_path)
+    try:
+        lookup_table = get_campaign_lookup_table(conn)
+        if lookup_table is None and get_campaign_name_column(conn) is not None:
+            build_campaign_index(conn)
+            lookup_table = get_campaign_lookup_table(conn)
+        return lookup_table
+    except sqlite3.Error as e:
+        print(f"Не удалось создать справочник кампаний: {e}")
+        return None
+    finally:
+        conn.close()
@@ -0,0 +1,130 @@
+"""
+Отчет по кампаниям одним запросом: строки кампаний, итоги по площадкам и
+общий итог (эмуляция GROUPING SETS через UNION ALL)
+"""
+
+from typing import List, Optional, Sequence
+
+# Уровни строк результата. Порядок значений по алфавиту совпадает с порядком
+# блоков в отчете, поэтому результат сортируется просто по level
+LEVEL_CAMPAIGN = "campaign"
+LEVEL_PLATFORM = "platform"
+LEVEL_TOTAL = "total"
+
+# Колонки campaign_metrics (и rollup-таблиц) -> колонки результата
+REPORT_MEASURES = {
+    "impressions": "Показы",
+    "clicks": "Клики",
+    "cost": "Расход до НДС",
+    "visits": "Визиты",
+}
+
+# Суммы исходных колонок и суммы уже переименованных колонок
+_BASE_SUMS = ", ".join(f'SUM("{column}") AS {name}' for name, column in REPORT_MEASURES.items())
+_SUMS = ", ".join(f"SUM({name}) AS {name}" for name in REPORT_MEASURES)
+_NAMES = ", ".join(REPORT_MEASURES)
+# CTR и CPC - отношение сумм, а не среднее округленных значений строк
+_RATIOS = (
+    "ROUND(SUM(clicks) * 100.0 / NULLIF(SUM(impressions), 0), 2) AS ctr, "
+    "ROUND(SUM(cost) / NULLIF(SUM(clicks), 0), 2) AS cpc"
+)
+
+# Предикаты поиска кампании по названию: буква сигнатуры условия -> SQL
+CAMPAIGN_NAME_PREDICATES = {
+    'U': "UPPER(\"Название кампании\") LIKE ?",
+    'N': "REPLACE(REPLACE(UPPER(\"Название кампании\"), ' ', ''), '-', '') LIKE ?",
+    'C': "REPLACE(REPLACE(REPLACE(UPPER(\"Название кампании\"), ' ', ''), '-', ''), '_', '') LIKE ?",
+    # Поиск по справочнику кампаний (campaign_dim / campaign_name_fts)
+    'L': "normalized_name LIKE ?",
+}
+
+# Общая статистика по кампаниям (вопросы без конкретной кампании)
+GENERAL_STATS_FIELDS = [
+    "COUNT(DISTINCT \"ID Кампании\") as campaigns_count",
+    "SUM(\"Показы\") as total_impressions",
+    "SUM(\"Клики\") as total_clicks",
+    "SUM(\"Расход до НДС\") as total_cost",
+    "SUM(\"Визиты\") as total_visits",
+    "ROUND(SUM(\"Клики\") * 100.0 / SUM(\"Показы\"), 2) as avg_ctr",
+    "ROUND(SUM(\"Расход до НДС\") / SUM(\"Клики\"), 2) as avg_cpc",
+]
+
+
+def render_name_conditions(signatures: Sequence[str], lookup_table: Optional[str] = None) -> List[str]:
+    """
+    Условия WHERE по сигнатурам поиска названия: каждая сигнатура - группа
+    предикатов CAMPAIGN_NAME_PREDICATES через OR. Со справочником кампаний
+    все группы проверяются в справочнике, а таблица читается по названию.
+    """
+    term_conditions = [
+        "(" + " OR ".join(CAMPAIGN_NAME_PREDICATES[kind] for kind in signature) + ")"
+        for signature in signatures
+    ]
+    if lookup_table and term_conditions:
+        return [
+            f"\"Название кампании\" IN (SELECT campaign_name FROM {lookup_table} "
+            f"WHERE {' AND '.join(term_conditions)})"
+        ]
+    return term_conditions
+
+
+def render_general_stats_sql(source_table: str, where_conditions: Optional[List[str]] = None,
+                             order_by: str = "total_cost DESC", limit: Optional[int] = None) -> str:
+    """SQL общей статистики по кампаниям (одна строка итогов)"""
+    sql = f"SELECT {', '.join(GENERAL_STATS_FIELDS)} FROM {source_table}"
+    if where_conditions:
+        sql += f" WHERE {' AND '.join(where_conditions)}"
+    sql += f" ORDER BY {order_by}"
+    if limit:
+        sql += f" LIMIT {limit}"
+    return sql
+
+
+def render_campaign_report_sql(source_table: str, where_conditions: Optional[List[str]] = None,
+                               order_by: str = "campaign_name ASC", limit: Optional[int] = None) -> str:
+    """
+    SQL отчета по кампаниям для generate_sql_query.
+
+    Строки (кампания, площадка) агрегируются один раз в CTE base, из него же
+    считаются блоки площадок и общий итог. Каждая строка результата помечена
+    колонкой level ('campaign', 'platform', 'total').
+
+    limit ограничивает только блок кампаний (ROW_NUMBER по order_by): итоги
+    по площадкам и общий итог считаются по всем найденным строкам.
+    """
+    where = f" WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
+    rank_filter = f" WHERE row_rank <= {int(limit)}" if limit else ""
+    return (
+        f'WITH base AS (SELECT "Название кампании" AS campaign_name, "Площадка" AS platform, {_BASE_SUMS} '
+        f'FROM {source_table}{where} GROUP BY "Название кампании", "Площадка"), '
+        f"ranked AS (SELECT *, ROW_NUMBER() OVER (ORDER BY {order_by}, campaign_name, platform) AS row_rank FROM base) "
+        f"SELECT '{LEVEL_CAMPAIGN}' AS level, row_rank, campaign_name, platform, {_NAMES}, "
+        f"ROUND(clicks * 100.0 / NULLIF(impressions, 0), 2) AS ctr, "
+        f"ROUND(cost / NULLIF(clicks, 0), 2) AS cpc, NULL AS campaigns_count "
+        f"FROM ranked{rank_filter} "
+        f"UNION ALL "
+        f"SELECT '{LEVEL_PLATFORM}', 0, NULL, platform, {_SUMS}, {_RATIOS}, COUNT(DISTINCT campaign_name) "
+        f"FROM base GROUP BY platform "
+        f"UNION ALL "
+        # HAVING без GROUP BY: без найденных строк итоговой строки нет
+        f"SELECT '{LEVEL_TOTAL}', 0, NULL, NULL, {_SUMS}, {_RATIOS}, COUNT(DISTINCT campaign_name) "
+        f"FROM base HAVING COUNT(*) > 0 "
+        f"ORDER BY level, row_rank, platform"
+    )
+
+
+def render_campaign_day_sql(source_table: str, campaigns_count: int) -> str:
+    """
+    Детализация выбранных кампаний по дням (campaigns_count параметров
+    названий) для листа выгрузки: дата, кампания, суммы, CTR и CPC
+    """
+    placeholders = ", ".join("?" * campaigns_count)
+    return (
+        f'SELECT day, campaign_name, {_NAMES}, '
+        f"ROUND(clicks * 100.0 / NULLIF(impressions, 0), 2) AS ctr, "
+        f"ROUND(cost / NULLIF(clicks, 0), 2) AS cpc "
+        f'FROM (SELECT "Дата" AS day, "Название кампании" AS campaign_name, {_BASE_SUMS} '
+        f'FROM {source_table} WHERE "Название кампании" IN ({placeholders}) '
+        f'GROUP BY "Дата", "Название кампании") '
+        f"ORDER BY day, campaign_name"
+    )
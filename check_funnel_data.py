@@ -1,6 +1,8 @@
 import sqlite3
 import pandas as pd
 
+from funnel_schema import FUNNEL_WIDE_VIEW
+
 conn = sqlite3.connect('marketing_analytics.db')
 
 print("=== ПРОВЕРКА ДАННЫХ ВОРОНКИ ===")
@@ -22,9 +24,9 @@ except Exception as e:
     print(f"Ошибка при проверке funnel_data: {e}")
     print()
 
-# Проверяем уникальные UTM кампании
+# Проверяем уникальные UTM кампании (текстовые значения - через представление)
 try:
-    cursor.execute("SELECT DISTINCT utm_campaign FROM funnel_data")
+    cursor.execute(f"SELECT DISTINCT utm_campaign FROM {FUNNEL_WIDE_VIEW}")
     campaigns = cursor.fetchall()
     print("Уникальные UTM кампании:")
     for campaign in campaigns:
@@ -36,7 +38,7 @@ except Exception as e:
 
 # Проверяем данные для rko_spring2024
 try:
-    cursor.execute("SELECT * FROM funnel_data WHERE utm_campaign = 'rko_spring2024' LIMIT 5")
+    cursor.execute(f"SELECT * FROM {FUNNEL_WIDE_VIEW} WHERE utm_campaign = 'rko_spring2024' LIMIT 5")
     data = cursor.fetchall()
     print("Данные для rko_spring2024:")
     for row in data:
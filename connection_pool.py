@@ -0,0 +1,127 @@
+"""
+Пул соединений SQLite для AI-агента отчетности
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+class SQLiteConnectionPool:
+    """
+    Потокобезопасный пул соединений SQLite.
+
+    Соединения только для чтения берутся из пула на время запроса
+    (with pool.connection() as conn) и возвращаются обратно, поэтому на
+    каждый вопрос не тратится время на подключение, разбор схемы и прогрев
+    кэша страниц. Открытых соединений не больше max_connections, сколько бы
+    потоков ни создал Streamlit. Скомпилированные выражения переиспользуются
+    через встроенный кэш sqlite3 (cached_statements).
+    """
+
+    def __init__(self, db_path: str, cache_size_kb: int = 65536,
+                 mmap_size: int = 268435456, cached_statements: int = 256,
+                 timeout: float = 5.0, aggregates: Optional[Dict[str, type]] = None,
+                 max_connections: int = 4):
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            cache_size_kb: Размер кэша страниц на соединение (в КБ)
+            mmap_size: Размер memory-mapped области (в байтах)
+            cached_statements: Размер кэша подготовленных выражений на соединение
+            timeout: Время ожидания блокировки и свободного соединения (в секундах)
+            aggregates: Агрегатные функции (имя -> класс с step/finalize) с одним аргументом
+            max_connections: Наибольшее число открытых соединений
+        """
+        self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self.aggregates = dict(aggregates or {})
+        self.max_connections = max_connections
+
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        # Свободные соединения: последнее возвращенное выдается первым (кэш страниц теплее)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        # Число выданных соединений ограничено, поэтому открытых не больше max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._wal_enabled = False
+
+    def _enable_wal(self, conn: sqlite3.Connection):
+        """Включает WAL один раз для файла БД (режим сохраняется в самом файле)"""
+        with self._lock:
+            if self._wal_enabled:
+                return
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+            except sqlite3.OperationalError as e:
+                # Например, БД на файловой системе только для чтения
+                print(f"Не удалось включить WAL для {self.db_path}: {e}")
+            self._wal_enabled = True
+
+    def _open_connection(self) -> sqlite3.Connection:
+        """Открывает и настраивает новое соединение для чтения"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            # Соединение переходит между потоками: в каждый момент его держит один поток
+            check_same_thread=False
+        )
+        self._enable_wal(conn)
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA query_only = 1")
+        for name, aggregate in self.aggregates.items():
+            conn.create_aggregate(name, 1, aggregate)
+
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Соединение на время блока with. Если все max_connections соединений
+        заняты, ждет освобождения до timeout секунд.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                f"Нет свободных соединений с {self.db_path} ({self.max_connections} заняты)"
+            )
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open_connection()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                # Соединение, закрытое close_all() во время использования, в пул не возвращается
+                if any(c is conn for c in self._connections):
+                    self._idle.put(conn)
+            self._slots.release()
+
+    def close_all(self):
+        """Закрывает все открытые соединения пула"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._idle = queue.LifoQueue()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._connections)
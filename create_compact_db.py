@@ -6,6 +6,8 @@ import sqlite3
 import pandas as pd
 from pathlib import Path
 
+from load_pipeline import finalize_load
+
 def create_compact_database():
     """Создание компактной базы данных с обрезанными данными"""
     
@@ -51,11 +53,8 @@ def create_compact_database():
             df_funnel_trimmed.to_sql('funnel_data', conn, if_exists='replace', index=False)
             print(f"Таблица funnel_data создана с {len(df_funnel_trimmed)} записями (обрезано {cut_length} записей)")
         
-        # Создаем индексы для оптимизации
-        print("Создание индексов...")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_campaign_name ON campaign_metrics(campaign_name)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_platform ON campaign_metrics(platform)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_date ON campaign_metrics(date)")
+        # Схема воронки, справочник кампаний, версия данных, агрегаты, скетчи и индексы
+        finalize_load(conn)
         
         print("Компактная база данных успешно создана!")
         
@@ -7,6 +7,8 @@ import numpy as np
 from datetime import datetime, timedelta
 import random
 
+from load_pipeline import finalize_load
+
 def create_demo_database():
     """Создает демо-базу данных с небольшим объемом данных для деплоя"""
     
@@ -133,7 +135,8 @@ def create_demo_database():
     df_funnel = pd.DataFrame(funnel_data)
     df_funnel.to_sql('funnel_data', conn, if_exists='replace', index=False)
     
-    conn.commit()
+    # Схема "звезда" для воронки, новая версия данных, rollup-таблицы и индексы
+    finalize_load(conn)
     conn.close()
     
     print("✅ Демо-база данных создана успешно!")
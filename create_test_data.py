@@ -7,6 +7,9 @@ import sqlite3
 import random
 from datetime import datetime, timedelta
 
+from funnel_schema import FUNNEL_WIDE_VIEW
+from load_pipeline import finalize_load
+
 def create_test_funnel_data():
     """Создает тестовые данные для funnel_data"""
     
@@ -14,9 +17,10 @@ def create_test_funnel_data():
     
     conn = sqlite3.connect('marketing_analytics.db')
     
-    # Создаем таблицу
+    # Создаем таблицу в широкой схеме (прежняя, в том числе "звезда", удаляется)
+    conn.execute('DROP TABLE IF EXISTS funnel_data')
     conn.execute('''
-        CREATE TABLE IF NOT EXISTS funnel_data (
+        CREATE TABLE funnel_data (
             date TEXT,
             traffic_source TEXT,
             utm_campaign TEXT,
@@ -36,9 +40,6 @@ def create_test_funnel_data():
         )
     ''')
     
-    # Очищаем таблицу
-    conn.execute('DELETE FROM funnel_data')
-    
     # Тестовые данные
     utm_campaigns = ['rko_spring2024', '06133744', '111959248', '17262419', '22066899', '23226611']
     utm_sources = ['yandex', 'google', 'vsp', 'organic', 'direct']
@@ -108,20 +109,21 @@ def create_test_funnel_data():
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', test_data)
     
-    conn.commit()
+    # Схема "звезда", новая версия данных и производные таблицы
+    finalize_load(conn)
     
     print(f"✅ Создано {len(test_data)} тестовых записей")
     
     # Показываем примеры
-    sample = conn.execute('SELECT * FROM funnel_data LIMIT 3').fetchall()
+    sample = conn.execute(f'SELECT * FROM {FUNNEL_WIDE_VIEW} LIMIT 3').fetchall()
     print("\n📋 Примеры данных:")
     for row in sample:
         print(row)
     
-    campaigns = conn.execute('SELECT DISTINCT utm_campaign FROM funnel_data LIMIT 10').fetchall()
+    campaigns = conn.execute(f'SELECT DISTINCT utm_campaign FROM {FUNNEL_WIDE_VIEW} LIMIT 10').fetchall()
     print(f"🎯 Примеры utm_campaign: {[c[0] for c in campaigns]}")
     
-    sources = conn.execute('SELECT DISTINCT utm_source FROM funnel_data LIMIT 5').fetchall()
+    sources = conn.execute(f'SELECT DISTINCT utm_source FROM {FUNNEL_WIDE_VIEW} LIMIT 5').fetchall()
     print(f"🌐 Примеры utm_source: {[s[0] for s in sources]}")
     
     # Статистика
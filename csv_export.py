@@ -0,0 +1,71 @@
+"""
+Выгрузка отчета в CSV через csv.writer: те же листы (excel_export.Sheet),
+что и в Excel, секциями одна за другой, потоком кусков байт
+"""
+
+import csv
+import io
+from itertools import islice
+from typing import IO, Iterable, Iterator
+
+from excel_export import Heading, Sheet
+
+# UTF-8 с BOM - Excel открывает такой CSV с кириллицей без выбора кодировки
+CSV_ENCODING = "utf-8-sig"
+# Минимальный размер куска при потоковой выгрузке (кусок завершается на границе пачки строк)
+CSV_CHUNK_CHARS = 256 * 1024
+# Строк секции, которые пишутся одним вызовом writerows
+WRITE_BATCH_ROWS = 4096
+
+
+def _section_rows(sheet: Sheet) -> Iterator:
+    """Строки секции: название листа, заголовок таблицы, строки, пустая строка"""
+    yield (sheet.title.upper(),)
+    if sheet.header:
+        yield tuple(sheet.header)
+    for row in sheet.rows:
+        yield (str(row),) if isinstance(row, Heading) else row
+    yield ()
+
+
+def iter_csv(sheets: Iterable[Sheet], chunk_chars: int = CSV_CHUNK_CHARS) -> Iterator[bytes]:
+    """
+    CSV отчета кусками байт (первый кусок начинается с BOM).
+
+    Числа пишутся как есть, без разделителей разрядов, поэтому ячейки
+    остаются числовыми. В памяти держится только текущий кусок: строки
+    секций читаются из итераторов листов пачками по WRITE_BATCH_ROWS.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    encoding = CSV_ENCODING
+    for sheet in sheets:
+        rows = _section_rows(sheet)
+        while True:
+            batch = list(islice(rows, WRITE_BATCH_ROWS))
+            if not batch:
+                break
+            writer.writerows(batch)
+            if buffer.tell() >= chunk_chars:
+                yield buffer.getvalue().encode(encoding)
+                # BOM только в начале файла
+                encoding = "utf-8"
+                buffer.seek(0)
+                buffer.truncate()
+    tail = buffer.getvalue()
+    if tail or encoding == CSV_ENCODING:
+        yield tail.encode(encoding)
+
+
+def write_csv(sheets: Iterable[Sheet], target: IO[bytes]) -> int:
+    """Пишет CSV в двоичный файл target. Returns: количество записанных байт"""
+    written = 0
+    for chunk in iter_csv(sheets):
+        target.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def export_csv(sheets: Iterable[Sheet]) -> bytes:
+    """CSV отчета целиком (для кнопки скачивания)"""
+    return b"".join(iter_csv(sheets))
@@ -0,0 +1,35 @@
+"""
+Версия данных в БД: загрузчики увеличивают ее после каждой загрузки,
+а кэши агента сбрасываются при ее изменении
+"""
+
+import sqlite3
+from datetime import datetime
+
+DATA_VERSION_TABLE = "data_version"
+
+
+def bump_data_version(conn: sqlite3.Connection) -> int:
+    """Увеличивает версию данных и возвращает новое значение"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute(f"""
+        INSERT INTO {DATA_VERSION_TABLE} (id, version, updated_at) VALUES (1, 1, ?)
+        ON CONFLICT(id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+    """, (datetime.now().isoformat(),))
+    conn.commit()
+    return get_data_version(conn)
+
+
+def get_data_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия данных (0, если загрузчики ее еще не записывали)"""
+    try:
+        row = conn.execute(f"SELECT version FROM {DATA_VERSION_TABLE} WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
@@ -3,6 +3,8 @@ import sqlite3
 import os
 from pathlib import Path
 
+from load_pipeline import finalize_load
+
 def setup_database():
     """Создание базы данных SQLite с данными из CSV файлов"""
     
@@ -122,16 +124,8 @@ def setup_database():
         ''')
         print("Создаем пустую таблицу funnel_data для совместимости")
     
-    # Создаем индексы для оптимизации запросов
-    try:
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_campaign_date ON campaign_metrics(date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_campaign_id ON campaign_metrics(campaign_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_funnel_date ON funnel_data(date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_funnel_campaign ON funnel_data(utm_campaign)")
-    except Exception as e:
-        print(f"Ошибка при создании индексов: {e}")
-    
-    conn.commit()
+    # Схема воронки, справочник кампаний, версия данных, агрегаты, скетчи и индексы
+    finalize_load(conn)
     conn.close()
     
     print("База данных успешно создана!")
@@ -0,0 +1,137 @@
+"""
+Кэш эмбеддингов запросов: LRU в памяти и постоянный файл numpy memmap,
+ключ - хеш нормализованного запроса
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from result_cache import normalize_question
+
+# Слот файла: ключ запроса и номер последнего обращения (0 - слот свободен)
+SLOT_DTYPE = np.dtype([("key", "<u8"), ("stamp", "<u8")])
+
+
+def query_key(query: str, namespace: str = "") -> int:
+    """
+    Ключ запроса: 64-битный хеш нормализованного текста. namespace (имя
+    модели) входит в хеш, чтобы векторы другой модели не находились.
+    """
+    text = f"{namespace}\n{normalize_question(query)}"
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class EmbeddingCache:
+    """
+    Двухуровневый кэш векторов запросов.
+
+    Первый уровень - OrderedDict на memory_items последних запросов.
+    Второй - два .npy файла, открытых через np.memmap: векторы
+    (capacity x dim, float32) и слоты (ключ, номер обращения). Файлы
+    переживают перезапуск приложения; при заполнении вытесняется слот
+    с самым старым обращением. Без path кэш работает только в памяти.
+    """
+
+    def __init__(self, path: Optional[str], dim: int, capacity: int = 4096,
+                 memory_items: int = 256, namespace: str = ""):
+        self.path = path
+        self.dim = dim
+        self.capacity = capacity
+        self.memory_items = memory_items
+        self.namespace = namespace
+        self._memory: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._vectors = None
+        self._slots = None
+        self._slot_by_key: Dict[int, int] = {}
+        self._clock = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path:
+            self._open()
+
+    def _slots_path(self) -> str:
+        return os.path.splitext(self.path)[0] + ".keys.npy"
+
+    def _open(self):
+        vectors_shape = (self.capacity, self.dim)
+        try:
+            vectors = np.lib.format.open_memmap(self.path, mode="r+")
+            slots = np.lib.format.open_memmap(self._slots_path(), mode="r+")
+            if vectors.shape != vectors_shape or vectors.dtype != np.float32 \
+                    or slots.shape != (self.capacity,) or slots.dtype != SLOT_DTYPE:
+                raise ValueError("другая размерность или емкость кэша")
+        except (OSError, ValueError):
+            # Нет файлов, они повреждены или от другой модели - начинаем заново
+            vectors = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float32, shape=vectors_shape)
+            slots = np.lib.format.open_memmap(self._slots_path(), mode="w+", dtype=SLOT_DTYPE, shape=(self.capacity,))
+
+        self._vectors, self._slots = vectors, slots
+        used = np.flatnonzero(slots["stamp"])
+        self._slot_by_key = dict(zip(slots["key"][used].tolist(), used.tolist()))
+        self._clock = int(slots["stamp"].max()) if len(slots) else 0
+
+    def _remember(self, key: int, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """Вектор запроса (float32, размер dim) или None"""
+        key = query_key(query, self.namespace)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            slot = self._slot_by_key.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._clock += 1
+            self._slots["stamp"][slot] = self._clock
+            vector = np.array(self._vectors[slot])
+            self._remember(key, vector)
+            self.disk_hits += 1
+            return vector
+
+    def put(self, query: str, vector: np.ndarray):
+        """Сохраняет вектор в памяти и в файле"""
+        key = query_key(query, self.namespace)
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            self._remember(key, vector)
+            if self._vectors is None:
+                return
+
+            slot = self._slot_by_key.get(key)
+            if slot is None:
+                stamps = self._slots["stamp"]
+                slot = int(np.argmin(stamps))
+                if stamps[slot]:
+                    del self._slot_by_key[int(self._slots["key"][slot])]
+                self._slot_by_key[key] = slot
+            self._clock += 1
+            self._vectors[slot] = vector
+            self._slots[slot] = (key, self._clock)
+            self._vectors.flush()
+            self._slots.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика попаданий по уровням кэша"""
+        return {
+            "memory_size": len(self._memory), "disk_size": len(self._slot_by_key),
+            "memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+        }
+
+    def __len__(self) -> int:
+        return len(self._slot_by_key) if self._vectors is not None else len(self._memory)
@@ -0,0 +1,172 @@
+"""
+Потоковая выгрузка отчета в Excel: листы openpyxl в режиме write-only,
+строки пишутся по одной, файл собирается во временном файле
+"""
+
+import tempfile
+from itertools import chain, islice
+from typing import IO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+# Файл до этого размера собирается в памяти, больше - переносится на диск
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Строк листа, по которым подбирается ширина столбцов (остальные не буферизуются)
+WIDTH_SAMPLE_ROWS = 100
+MAX_COLUMN_WIDTH = 50
+
+# Колонки листов: поле записи анализа -> заголовок
+CAMPAIGN_COLUMNS = [
+    ("campaign_name", "Кампания"), ("platform", "Площадка"), ("impressions", "Показы"), ("clicks", "Клики"),
+    ("cost", "Расход (₽)"), ("visits", "Визиты"), ("ctr", "CTR (%)"), ("cpc", "CPC (₽)"),
+]
+PLATFORM_COLUMNS = CAMPAIGN_COLUMNS[1:]
+FUNNEL_SOURCE_COLUMNS = [
+    ("utm_source", "Источник"), ("visits", "Визиты"), ("submits", "Заявки"), ("accounts_opened", "Открыто счетов"),
+    ("quality_leads", "Качественные лиды"), ("conversion_to_submits", "Конверсия в заявки (%)"),
+    ("conversion_to_accounts", "Конверсия в счета (%)"), ("conversion_to_quality", "Доля качественных (%)"),
+]
+FUNNEL_DAILY_COLUMNS = [("date", "Дата")] + FUNNEL_SOURCE_COLUMNS[1:5]
+FUNNEL_CAMPAIGN_COLUMNS = [("utm_campaign", "Кампания")] + FUNNEL_SOURCE_COLUMNS[1:6]
+# Строки листа "Детализация по дням" (campaign_report.render_campaign_day_sql)
+CAMPAIGN_DAY_HEADER = ["Дата", "Кампания", "Показы", "Клики", "Расход (₽)", "Визиты", "CTR (%)", "CPC (₽)"]
+
+# Показатели сводки: поле -> подпись
+CAMPAIGN_SUMMARY_LABELS = [
+    ("campaigns_count", "Всего кампаний"), ("total_impressions", "Общие показы"), ("total_clicks", "Общие клики"),
+    ("total_cost", "Общий расход (₽)"), ("total_visits", "Общие визиты"), ("avg_ctr", "Средний CTR (%)"),
+    ("avg_cpc", "Средний CPC (₽)"),
+]
+FUNNEL_SUMMARY_LABELS = [
+    ("visits", "Визиты"), ("submits", "Заявки"), ("accounts_opened", "Открыто счетов"), ("created", "Создано заявок"),
+    ("calls_answered", "Дозвоны"), ("quality_leads", "Качественные лиды"),
+    ("conversion_to_submits", "Конверсия в заявки (%)"), ("conversion_to_accounts", "Конверсия в счета (%)"),
+    ("conversion_to_quality", "Доля качественных (%)"),
+]
+
+
+class Heading(str):
+    """Строка листа из одной ячейки-заголовка раздела (жирный шрифт)"""
+
+
+class Sheet(NamedTuple):
+    """Лист выгрузки: заголовок таблицы (None - без него) и итератор строк"""
+    title: str
+    header: Optional[Sequence[str]]
+    rows: Iterable
+
+
+def _cell_value(value):
+    # NaN из pandas: Excel считает его поврежденным значением, в CSV он попал бы как 'nan'
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def records_sheet(title: str, columns: List[Tuple[str, str]], records: Iterable[Dict]) -> Sheet:
+    """Лист из записей анализа (словарей) с колонками columns"""
+    fields = [field for field, _ in columns]
+    rows = (tuple(_cell_value(record.get(field)) for field in fields) for record in records)
+    return Sheet(title, [header for _, header in columns], rows)
+
+
+def summary_rows(title: str, summary: Dict, labels: List[Tuple[str, str]], defaults: bool = True) -> Iterator:
+    """Строки сводки "подпись - значение" (без значения по умолчанию пропускаются)"""
+    yield Heading(title)
+    yield ()
+    for field, label in labels:
+        if field in summary or defaults:
+            yield Heading(label), _cell_value(summary.get(field, 0))
+
+
+def _column_widths(header: Optional[Sequence[str]], sample: List) -> List[int]:
+    widths: List[int] = []
+    for row in ([header] if header else []) + sample:
+        if isinstance(row, Heading):
+            continue
+        for index, value in enumerate(row):
+            length = len(str(value)) if value is not None else 0
+            if index == len(widths):
+                widths.append(length)
+            elif length > widths[index]:
+                widths[index] = length
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def write_workbook(sheets: Iterable[Sheet], target: IO[bytes]) -> Dict[str, int]:
+    """
+    Пишет листы в файл target (путь или двоичный файловый объект).
+
+    Книга создается в режиме write_only: openpyxl не держит ячейки в памяти,
+    а сразу сериализует строки листа во временный файл, поэтому память
+    не растет с числом строк. Ширина столбцов подбирается по заголовку и
+    первым WIDTH_SAMPLE_ROWS строкам - ее нужно задать до первой строки.
+
+    Returns:
+        Количество строк данных в каждом листе
+    """
+    if not OPENPYXL_AVAILABLE:
+        raise RuntimeError("openpyxl не установлен: pip install openpyxl")
+
+    wb = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    heading_font = Font(bold=True, size=12)
+
+    def styled(ws, value, font, fill=None):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        return cell
+
+    counts = {}
+    for sheet in sheets:
+        ws = wb.create_sheet(sheet.title)
+        rows = iter(sheet.rows)
+        sample = list(islice(rows, WIDTH_SAMPLE_ROWS))
+        for index, width in enumerate(_column_widths(sheet.header, sample), 1):
+            ws.column_dimensions[get_column_letter(index)].width = width
+
+        if sheet.header:
+            ws.append([styled(ws, value, header_font, header_fill) for value in sheet.header])
+        count = 0
+        for row in chain(sample, rows):
+            if isinstance(row, Heading):
+                ws.append([styled(ws, str(row), heading_font)])
+            else:
+                ws.append([
+                    styled(ws, str(value), header_font, header_fill) if isinstance(value, Heading)
+                    else _cell_value(value)
+                    for value in row
+                ])
+            count += 1
+        counts[sheet.title] = count
+
+    wb.save(target)
+    return counts
+
+
+def export_to_spool(sheets: Iterable[Sheet], max_size: int = SPOOL_MAX_BYTES) -> IO[bytes]:
+    """
+    Выгрузка во временный файл, который остается в памяти до max_size байт
+    и переносится на диск, если книга больше.
+
+    Returns:
+        Файловый объект, установленный на начало (закрывает вызывающий код)
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size, suffix=".xlsx")
+    try:
+        write_workbook(sheets, spool)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
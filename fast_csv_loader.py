@@ -1,14 +1,35 @@
-import pandas as pd
+import csv
 import sqlite3
 import time
-import csv
-import re
-import os
+from itertools import zip_longest
+
+from funnel_schema import FUNNEL_DIMENSIONS, FUNNEL_STAR_COLUMNS, DimensionEncoder, create_star_tables
+from load_pipeline import finalize_load
+
+# Колонки выгрузки воронки и их типы (порядок значений в строках iter_funnel_rows)
+FUNNEL_COLUMNS = [
+    ('date', 'TEXT'),
+    ('traffic_source', 'TEXT'),
+    ('utm_campaign', 'TEXT'),
+    ('utm_source', 'TEXT'),
+    ('utm_medium', 'TEXT'),
+    ('utm_content', 'TEXT'),
+    ('utm_term', 'TEXT'),
+    ('visit_id', 'TEXT'),
+    ('submits', 'REAL'),
+    ('res', 'REAL'),
+    ('subs_all', 'REAL'),
+    ('account_num', 'INTEGER'),
+    ('created_flag', 'INTEGER'),
+    ('call_answered_flag', 'INTEGER'),
+    ('quality_flag', 'INTEGER'),
+    ('quality', 'INTEGER'),
+]
 
 def parse_csv_line(line):
     """Парсит строку CSV с вложенными кавычками"""
-    # Убираем лишние кавычки по краям
-    line = line.strip()
+    # Убираем BOM, хвост ";;;;" выгрузки и лишние кавычки по краям
+    line = line.strip().lstrip('\ufeff').rstrip(';')
     if line.startswith('"') and line.endswith('"'):
         line = line[1:-1]
     
@@ -43,34 +64,35 @@ def parse_csv_line(line):
     result.append(current.strip())
     return result
 
-def preprocess_csv_manual(input_path, output_path):
-    """Создаёт очищенную версию CSV с ручным парсингом"""
-    with open(input_path, 'r', encoding='utf-8') as fin, open(output_path, 'w', encoding='utf-8', newline='') as fout:
-        for line_num, line in enumerate(fin, 1):
-            if line_num == 1:
-                # Обрабатываем заголовок
-                parsed = parse_csv_line(line)
-                # Берем только первые 15 столбцов (основные данные)
-                header = parsed[:15]
-                # Очищаем заголовки от лишних кавычек
-                clean_header = []
-                for col in header:
-                    col = col.replace('""', '"')
-                    col = re.sub(r'^"|"$', '', col)
-                    clean_header.append(col)
-                fout.write(','.join(clean_header) + '\n')
-            else:
-                # Обрабатываем данные
-                parsed = parse_csv_line(line)
-                # Берем только первые 15 столбцов
-                data = parsed[:15]
-                # Очищаем данные от лишних кавычек
-                clean_data = []
-                for val in data:
-                    val = val.replace('""', '"')
-                    val = re.sub(r'^"|"$', '', val)
-                    clean_data.append(val)
-                fout.write(','.join(clean_data) + '\n')
+class FunnelExportDialect(csv.Dialect):
+    """
+    Внешний слой выгрузки воронки: строка целиком в кавычках, "" внутри,
+    хвост из пустых полей через ";". Первое поле - обычная CSV строка.
+    """
+    delimiter = ';'
+    quotechar = '"'
+    doublequote = True
+    skipinitialspace = False
+    lineterminator = '\n'
+    quoting = csv.QUOTE_MINIMAL
+
+def parse_export_block(lines):
+    """
+    Разбирает пачку строк выгрузки двумя проходами модуля csv (оба на C).
+
+    Первый проход (FunnelExportDialect) снимает внешние кавычки и хвост
+    ";;;;" и раскрывает "", второй разбирает получившиеся CSV строки.
+    """
+    inner = [row[0] for row in csv.reader(lines, FunnelExportDialect) if row and row[0]]
+    return list(csv.reader(inner))
+
+def iter_export_blocks(f, block_bytes=1 << 16):
+    """Читает открытый файл пачками строк примерно по block_bytes и разбирает каждую пачку"""
+    while True:
+        lines = f.readlines(block_bytes)
+        if not lines:
+            return
+        yield parse_export_block(lines)
 
 def get_column_mapping(columns):
     """Возвращает маппинг колонок CSV -> funnel_data"""
@@ -101,87 +123,122 @@ def get_column_mapping(columns):
     }
     return {col: mapping[col] for col in columns if col in mapping}
 
-def create_funnel_table(conn):
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS funnel_data (
-            date TEXT,
-            traffic_source TEXT,
-            utm_campaign TEXT,
-            utm_source TEXT,
-            utm_medium TEXT,
-            utm_content TEXT,
-            utm_term TEXT,
-            visit_id TEXT,
-            submits REAL,
-            res REAL,
-            subs_all REAL,
-            account_num INTEGER,
-            created_flag INTEGER,
-            call_answered_flag INTEGER,
-            quality_flag INTEGER,
-            quality INTEGER
-        )
-    ''')
-    conn.commit()
+def _coerce(value, sql_type):
+    """Приводит значение ячейки к типу колонки; пустые значения -> NULL"""
+    if value is None or value == '':
+        return None
+    if sql_type == 'TEXT':
+        return value
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return int(number) if sql_type == 'INTEGER' else number
+
+_CONVERTERS = {'REAL': float, 'INTEGER': int}
+
+def _coerce_column(values, sql_type):
+    """Приводит колонку пачки к типу: быстрый путь через map, при ошибке - по значениям"""
+    if sql_type == 'TEXT':
+        return [value or None for value in values]
+    try:
+        return list(map(_CONVERTERS[sql_type], values))
+    except ValueError:
+        return [_coerce(value, sql_type) for value in values]
+
+def iter_funnel_rows(csv_file, block_bytes=1 << 16):
+    """
+    Читает выгрузку воронки пачками и отдает кортежи в порядке FUNNEL_COLUMNS.
+
+    Файл не читается целиком и не переписывается во временный файл: каждая
+    пачка строк размером около block_bytes разбирается parse_export_block,
+    транспонируется в колонки и приводится к типам поколоночно.
+    """
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+        header_rows = parse_export_block([f.readline()])
+        header = header_rows[0] if header_rows else []
+        mapping = get_column_mapping(header)
+        # Позиция колонки CSV для каждой колонки funnel_data (None - нет в файле)
+        positions = {mapping[col]: idx for idx, col in enumerate(header) if col in mapping}
+        layout = [(positions.get(name), sql_type) for name, sql_type in FUNNEL_COLUMNS]
+
+        for rows in iter_export_blocks(f, block_bytes):
+            if not rows:
+                continue
+            columns = list(zip_longest(*rows, fillvalue=''))
+            empty = [None] * len(rows)
+            typed = [
+                _coerce_column(columns[idx], sql_type) if idx is not None and idx < len(columns) else empty
+                for idx, sql_type in layout
+            ]
+            yield from zip(*typed)
 
 def fast_load_csv_to_db(csv_file, db_path='marketing_analytics.db', chunk_size=10000):
+    """
+    Потоковая загрузка выгрузки воронки в funnel_data (схема "звезда").
+
+    UTM-измерения и traffic_source кодируются в id справочников dim_<колонка>
+    на лету. Строки вставляются через executemany пачками по chunk_size в
+    одной транзакции вместе с пересозданием таблиц, поэтому память не
+    зависит от размера файла, а при ошибке в БД остаются прежние данные.
+    """
     print(f"\n🚀 Быстрая загрузка {csv_file} в funnel_data...")
     start = time.time()
     
-    # Создаем очищенный файл
-    temp_file = 'cleaned_funnel_sample.csv'
-    preprocess_csv_manual(csv_file, temp_file)
-    print(f"✅ Создан очищенный файл: {temp_file}")
-    
     conn = sqlite3.connect(db_path)
-    create_funnel_table(conn)
-    conn.execute('DELETE FROM funnel_data')
-    print("🗑️ Очищена таблица funnel_data")
+    
+    insert_sql = (
+        f"INSERT INTO funnel_data ({', '.join(name for name, _ in FUNNEL_STAR_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in FUNNEL_STAR_COLUMNS)})"
+    )
+    # Позиции измерений в строке iter_funnel_rows (после date)
+    dimension_slice = slice(1, 1 + len(FUNNEL_DIMENSIONS))
     
     total = 0
     chunk_num = 0
+    batch = []
     
-    # Читаем очищенный файл
-    reader = pd.read_csv(
-        temp_file,
-        sep=',',
-        dtype=str,
-        on_bad_lines='skip',
-        header=0
-    )
-    
-    print(f"📊 Заголовки: {list(reader.columns)}")
-    print(f"📊 Размер данных: {len(reader)} строк")
+    def write_batch():
+        encoder.flush()
+        conn.executemany(insert_sql, batch)
     
-    # Обрабатываем данные чанками
-    for chunk_start in range(0, len(reader), chunk_size):
-        chunk_num += 1
-        chunk_end = min(chunk_start + chunk_size, len(reader))
-        chunk = reader.iloc[chunk_start:chunk_end].copy()
-        
-        # Маппинг колонок
-        mapping = get_column_mapping(chunk.columns)
-        chunk = chunk.rename(columns=mapping)
+    try:
+        # DDL в sqlite3 не открывает транзакцию сам: без явного BEGIN таблицы
+        # удалялись бы сразу, и при ошибке чтения funnel_data осталась бы пустой
+        conn.execute("BEGIN")
+        create_star_tables(conn)
+        encoder = DimensionEncoder(conn)
+        print("🗑️ Пересозданы таблица funnel_data и справочники UTM")
         
-        # Оставляем только нужные колонки
-        expected = [
-            'date', 'traffic_source', 'utm_campaign', 'utm_source', 'utm_medium',
-            'utm_content', 'utm_term', 'visit_id', 'submits', 'res', 'subs_all',
-            'account_num', 'created_flag', 'call_answered_flag', 'quality_flag', 'quality'
-        ]
+        for row in iter_funnel_rows(csv_file):
+            encoded = tuple(
+                encoder.encode(dimension, value)
+                for dimension, value in zip(FUNNEL_DIMENSIONS, row[dimension_slice])
+            )
+            batch.append(row[:1] + encoded + row[dimension_slice.stop:])
+            if len(batch) >= chunk_size:
+                write_batch()
+                chunk_num += 1
+                total += len(batch)
+                print(f"📦 Чанк {chunk_num}: {len(batch)} строк (всего: {total})")
+                batch = []
         
-        for col in expected:
-            if col not in chunk.columns:
-                chunk[col] = None
+        if batch:
+            write_batch()
+            chunk_num += 1
+            total += len(batch)
+            print(f"📦 Чанк {chunk_num}: {len(batch)} строк (всего: {total})")
         
-        chunk = chunk[expected]
-        
-        # Загружаем в БД
-        chunk.to_sql('funnel_data', conn, if_exists='append', index=False, method=None)
-        total += len(chunk)
-        print(f"📦 Чанк {chunk_num}: {len(chunk)} строк (всего: {total})")
+        conn.commit()
+        # Индексы строятся один раз по загруженной таблице, а не при каждой вставке;
+        # вместе с ними - новая версия данных, rollup-таблицы и скетчи визитов
+        finalize_load(conn)
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+        raise
     
-    conn.commit()
     print(f"✅ Загрузка завершена! Всего строк: {total}. Время: {time.time()-start:.1f} сек.")
     
     # Показываем примеры
@@ -190,17 +247,14 @@ def fast_load_csv_to_db(csv_file, db_path='marketing_analytics.db', chunk_size=1
     for row in sample:
         print(row)
     
-    campaigns = conn.execute('SELECT DISTINCT utm_campaign FROM funnel_data WHERE utm_campaign IS NOT NULL LIMIT 10').fetchall()
+    campaigns = conn.execute('SELECT value FROM dim_utm_campaign LIMIT 10').fetchall()
     print(f"🎯 Примеры utm_campaign: {[c[0] for c in campaigns]}")
     
-    sources = conn.execute('SELECT DISTINCT utm_source FROM funnel_data WHERE utm_source IS NOT NULL LIMIT 5').fetchall()
+    sources = conn.execute('SELECT value FROM dim_utm_source LIMIT 5').fetchall()
     print(f"🌐 Примеры utm_source: {[s[0] for s in sources]}")
     
     conn.close()
-    
-    # Удаляем временный файл
-    if os.path.exists(temp_file):
-        os.remove(temp_file)
+    return total
 
 if __name__ == "__main__":
     fast_load_csv_to_db('rko_funnel_sample-1750856109631.csv') 
\ No newline at end of file
@@ -2,6 +2,9 @@ import pandas as pd
 import sqlite3
 import csv
 
+from funnel_schema import FUNNEL_WIDE_VIEW
+from load_pipeline import finalize_load
+
 def load_fixed_csv_data():
     """Загрузка данных из CSV с правильной обработкой структуры"""
     
@@ -81,6 +84,8 @@ def load_fixed_csv_data():
         
         # Сохраняем в базу
         df.to_sql('funnel_data', conn, if_exists='replace', index=False)
+        # Схема "звезда", новая версия данных и производные таблицы
+        finalize_load(conn)
         print(f"Сохранено {len(df)} записей в funnel_data")
         
         # Проверяем данные
@@ -89,7 +94,7 @@ def load_fixed_csv_data():
         count = cursor.fetchone()[0]
         print(f"Всего записей в базе: {count}")
         
-        cursor.execute("SELECT DISTINCT utm_campaign FROM funnel_data LIMIT 5")
+        cursor.execute(f"SELECT DISTINCT utm_campaign FROM {FUNNEL_WIDE_VIEW} LIMIT 5")
         campaigns = cursor.fetchall()
         print("Уникальные кампании:")
         for campaign in campaigns:
@@ -1,6 +1,9 @@
 import sqlite3
 import pandas as pd
 
+from funnel_schema import FUNNEL_WIDE_VIEW
+from load_pipeline import finalize_load
+
 def fix_funnel_table():
     """Исправление структуры таблицы funnel_data"""
     
@@ -66,6 +69,8 @@ def fix_funnel_table():
             # Удаляем старую таблицу и создаем новую
             conn.execute("DROP TABLE IF EXISTS funnel_data")
             new_df.to_sql('funnel_data', conn, if_exists='replace', index=False)
+            # Схема "звезда", новая версия данных и производные таблицы
+            finalize_load(conn)
             
             print("Таблица funnel_data исправлена!")
             
@@ -74,7 +79,7 @@ def fix_funnel_table():
             count = cursor.fetchone()[0]
             print(f"Всего записей: {count}")
             
-            cursor.execute("SELECT DISTINCT utm_campaign FROM funnel_data LIMIT 5")
+            cursor.execute(f"SELECT DISTINCT utm_campaign FROM {FUNNEL_WIDE_VIEW} LIMIT 5")
             campaigns = cursor.fetchall()
             print("Уникальные кампании:")
             for campaign in campaigns:
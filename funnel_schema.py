@@ -0,0 +1,331 @@
+"""
+Схема "звезда" для funnel_data: справочники UTM-измерений и целочисленные ключи в строках фактов
+"""
+
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+FUNNEL_TABLE = "funnel_data"
+# Представление funnel_data с текстовыми значениями измерений (как в широкой таблице)
+FUNNEL_WIDE_VIEW = "funnel_data_wide"
+# Скетчи визитов по (date, utm_source, utm_campaign), см. visit_sketches
+FUNNEL_SKETCH_TABLE = "funnel_visit_sketches"
+# Агрегатная функция SQLite, объединяющая скетчи и возвращающая оценку числа визитов
+HLL_COUNT_FUNCTION = "hll_count"
+
+# Текстовые измерения, которые выносятся в справочники dim_<колонка>
+FUNNEL_DIMENSIONS = [
+    "traffic_source", "utm_campaign", "utm_source", "utm_medium", "utm_content", "utm_term",
+]
+
+# Колонки фактов в схеме "звезда". visit_id объявлен INTEGER: SQLite сохраняет
+# числовые идентификаторы визитов как целые, а флаги 0/1 занимают в записи 0 байт
+FUNNEL_STAR_COLUMNS: List[Tuple[str, str]] = [
+    ("date", "TEXT"),
+] + [(f"{dim}_id", "INTEGER") for dim in FUNNEL_DIMENSIONS] + [
+    ("visit_id", "INTEGER"),
+    ("submits", "REAL"),
+    ("res", "REAL"),
+    ("subs_all", "REAL"),
+    ("account_num", "INTEGER"),
+    ("created_flag", "INTEGER"),
+    ("call_answered_flag", "INTEGER"),
+    ("quality_flag", "INTEGER"),
+    ("quality", "INTEGER"),
+]
+
+LAYOUT_STAR = "star"
+LAYOUT_WIDE = "wide"
+
+
+def dim_table(dimension: str) -> str:
+    """Название справочника для измерения"""
+    return f"dim_{dimension}"
+
+
+def funnel_layout(conn: sqlite3.Connection) -> Optional[str]:
+    """Схема funnel_data: 'star', 'wide' (все колонки в строке) или None, если таблицы нет"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({FUNNEL_TABLE})")}
+    if not columns:
+        return None
+    return LAYOUT_STAR if "utm_source_id" in columns else LAYOUT_WIDE
+
+
+def create_star_tables(conn: sqlite3.Connection, table: str = FUNNEL_TABLE):
+    """Создает пустые справочники и таблицу фактов (существующие удаляются)"""
+    # Представление ссылается на справочники, и SQLite не даст переименовать
+    # таблицу, пока в схеме есть представление на удаленную funnel_data
+    conn.execute(f"DROP VIEW IF EXISTS {FUNNEL_WIDE_VIEW}")
+    for dimension in FUNNEL_DIMENSIONS:
+        conn.execute(f"DROP TABLE IF EXISTS {dim_table(dimension)}")
+        conn.execute(f"""
+            CREATE TABLE {dim_table(dimension)} (
+                id INTEGER PRIMARY KEY,
+                value TEXT NOT NULL UNIQUE
+            )
+        """)
+    columns = ", ".join(f"{name} {sql_type}" for name, sql_type in FUNNEL_STAR_COLUMNS)
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute(f"CREATE TABLE {table} ({columns})")
+
+
+class DimensionEncoder:
+    """
+    Кодирует значения измерений в id справочников при потоковой загрузке.
+
+    Словари value -> id держатся в памяти (их размер - число различных
+    значений, а не строк), новые значения дописываются в справочники
+    пачкой при flush().
+    """
+
+    def __init__(self, conn: sqlite3.Connection, load_existing: bool = False):
+        self.conn = conn
+        self._ids: Dict[str, Dict[str, int]] = {dimension: {} for dimension in FUNNEL_DIMENSIONS}
+        self._next_ids: Dict[str, int] = {dimension: 1 for dimension in FUNNEL_DIMENSIONS}
+        self._pending: Dict[str, List[Tuple[int, str]]] = {dimension: [] for dimension in FUNNEL_DIMENSIONS}
+        if load_existing:
+            # Дописывание в существующие справочники: новые id продолжают старые
+            for dimension in FUNNEL_DIMENSIONS:
+                ids = self._ids[dimension]
+                ids.update((value, value_id) for value_id, value in conn.execute(
+                    f"SELECT id, value FROM {dim_table(dimension)}"
+                ))
+                self._next_ids[dimension] = max(ids.values(), default=0) + 1
+
+    def encode(self, dimension: str, value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return None
+        ids = self._ids[dimension]
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = self._next_ids[dimension]
+            self._next_ids[dimension] = value_id + 1
+            ids[value] = value_id
+            self._pending[dimension].append((value_id, value))
+        return value_id
+
+    def flush(self):
+        """Записывает в справочники значения, появившиеся с прошлого flush()"""
+        for dimension, rows in self._pending.items():
+            if rows:
+                self.conn.executemany(f"INSERT INTO {dim_table(dimension)} (id, value) VALUES (?, ?)", rows)
+                rows.clear()
+
+
+def build_funnel_star(conn: sqlite3.Connection) -> int:
+    """
+    Переводит funnel_data, записанную целиком текстом (to_sql), в схему "звезда".
+
+    Справочники заполняются различными значениями измерений, строки фактов
+    переписываются с целочисленными ключами и приведенными типами, после чего
+    широкая таблица заменяется новой.
+
+    Returns:
+        Количество строк фактов (0, если таблицы нет или она уже в схеме "звезда")
+    """
+    if funnel_layout(conn) != LAYOUT_WIDE:
+        return 0
+
+    wide_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({FUNNEL_TABLE})")}
+    staging = f"{FUNNEL_TABLE}_star"
+    create_star_tables(conn, staging)
+
+    select = []
+    joins = []
+    for name, _ in FUNNEL_STAR_COLUMNS:
+        dimension = name[:-3] if name.endswith("_id") and name[:-3] in FUNNEL_DIMENSIONS else None
+        if dimension is not None:
+            if dimension in wide_columns:
+                conn.execute(f"""
+                    INSERT INTO {dim_table(dimension)} (value)
+                    SELECT DISTINCT {dimension} FROM {FUNNEL_TABLE} WHERE {dimension} IS NOT NULL ORDER BY 1
+                """)
+                alias = f"d_{dimension}"
+                joins.append(f"LEFT JOIN {dim_table(dimension)} {alias} ON {alias}.value = w.{dimension}")
+                select.append(f"{alias}.id")
+            else:
+                select.append("NULL")
+        elif name in wide_columns:
+            # Без CAST: числовой текст приводится аффинностью колонки,
+            # а нечисловые значения (visit_id вида 'visit_5') сохраняются как есть
+            select.append(f"w.{name}")
+        else:
+            select.append("NULL")
+
+    conn.execute(f"""
+        INSERT INTO {staging} ({', '.join(name for name, _ in FUNNEL_STAR_COLUMNS)})
+        SELECT {', '.join(select)} FROM {FUNNEL_TABLE} w {' '.join(joins)}
+    """)
+    conn.execute(f"DROP TABLE {FUNNEL_TABLE}")
+    conn.execute(f"ALTER TABLE {staging} RENAME TO {FUNNEL_TABLE}")
+    conn.commit()
+    return conn.execute(f"SELECT COUNT(*) FROM {FUNNEL_TABLE}").fetchone()[0]
+
+
+def create_wide_view(conn: sqlite3.Connection):
+    """
+    Создает представление funnel_data_wide с колонками широкой таблицы.
+
+    Скрипты проверки и ручные запросы фильтруют по текстовым utm_campaign,
+    utm_source и т.д.; в схеме "звезда" представление подставляет значения
+    из справочников, в широкой - повторяет funnel_data.
+    """
+    conn.execute(f"DROP VIEW IF EXISTS {FUNNEL_WIDE_VIEW}")
+    layout = funnel_layout(conn)
+    if layout is None:
+        return
+    if layout == LAYOUT_WIDE:
+        conn.execute(f"CREATE VIEW {FUNNEL_WIDE_VIEW} AS SELECT * FROM {FUNNEL_TABLE}")
+        return
+
+    select = []
+    joins = []
+    for name, _ in FUNNEL_STAR_COLUMNS:
+        dimension = name[:-3]
+        if name.endswith("_id") and dimension in FUNNEL_DIMENSIONS:
+            alias = f"d_{dimension}"
+            joins.append(f"LEFT JOIN {dim_table(dimension)} {alias} ON {alias}.id = f.{name}")
+            select.append(f"{alias}.value AS {dimension}")
+        else:
+            select.append(f"f.{name}")
+    conn.execute(f"""
+        CREATE VIEW {FUNNEL_WIDE_VIEW} AS
+        SELECT {', '.join(select)} FROM {FUNNEL_TABLE} f {' '.join(joins)}
+    """)
+
+
+def append_funnel_rows(conn: sqlite3.Connection, rows: Iterable[Dict[str, object]]) -> int:
+    """
+    Дописывает в funnel_data строки с колонками широкой таблицы.
+
+    Текстовые значения измерений кодируются в id справочников (новые значения
+    дописываются в справочники), колонки, которых нет в схеме "звезда",
+    отбрасываются. Широкая таблица сначала переводится в схему "звезда".
+    Коммит, новую версию данных и производные структуры выполняет
+    load_pipeline.finalize_load.
+
+    Returns:
+        Количество добавленных строк
+    """
+    layout = funnel_layout(conn)
+    if layout is None:
+        create_star_tables(conn)
+    elif layout == LAYOUT_WIDE:
+        build_funnel_star(conn)
+
+    encoder = DimensionEncoder(conn, load_existing=True)
+    names = [name for name, _ in FUNNEL_STAR_COLUMNS]
+    batch = []
+    for row in rows:
+        values = dict(row)
+        for dimension in FUNNEL_DIMENSIONS:
+            values[f"{dimension}_id"] = encoder.encode(dimension, values.get(dimension))
+        batch.append(tuple(values.get(name) for name in names))
+
+    encoder.flush()
+    conn.executemany(
+        f"INSERT INTO {FUNNEL_TABLE} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})", batch
+    )
+    return len(batch)
+
+
+EXACT_VISITS = "COUNT(DISTINCT visit_id)"
+APPROX_VISITS = f"{HLL_COUNT_FUNCTION}(visit_sketch)"
+
+# Показатели воронки: название колонки результата -> выражение над funnel_data
+FUNNEL_MEASURES = {
+    "visits": EXACT_VISITS,
+    "submits": "SUM(submits)",
+    "accounts_opened": "SUM(account_num)",
+    "created": "SUM(created_flag)",
+    "calls_answered": "SUM(call_answered_flag)",
+    "quality_leads": "SUM(quality_flag)",
+    "conversion_to_submits": f"ROUND(SUM(submits) * 100.0 / {EXACT_VISITS}, 2)",
+    "conversion_to_accounts": "ROUND(SUM(account_num) * 100.0 / SUM(submits), 2)",
+    "conversion_to_quality": "ROUND(SUM(quality_flag) * 100.0 / SUM(account_num), 2)",
+}
+
+_FULL_FUNNEL = list(FUNNEL_MEASURES)
+_BASIC = ["visits", "submits", "accounts_opened", "quality_leads"]
+
+# Шаблоны запросов агента к воронке. group - колонка группировки,
+# campaign_filter - фильтр utm_campaign = ?, not_null - исключение пустой группы
+FUNNEL_TEMPLATES = {
+    "campaign_funnel": {"label": "Воронка конверсии", "measures": _FULL_FUNNEL, "campaign_filter": True},
+    "total_funnel": {"label": "Общая воронка", "measures": _FULL_FUNNEL},
+    "sources": {
+        "group": "utm_source", "not_null": True, "order_by": "visits DESC",
+        "measures": _BASIC + ["conversion_to_submits", "conversion_to_accounts", "conversion_to_quality"],
+    },
+    "daily_campaign": {"group": "date", "order_by": "date", "measures": _BASIC, "campaign_filter": True},
+    "daily": {"group": "date", "order_by": "date", "measures": _BASIC},
+    "top_campaigns": {
+        "group": "utm_campaign", "not_null": True, "order_by": "submits DESC", "limit": 10,
+        "measures": _BASIC + ["conversion_to_submits"],
+    },
+    "totals": {"measures": ["visits", "submits", "accounts_opened", "created", "calls_answered", "quality_leads"]},
+}
+
+
+def render_funnel_sql(kind: str, layout: Optional[str] = LAYOUT_WIDE, approximate: bool = False) -> str:
+    """
+    SQL шаблона FUNNEL_TEMPLATES для схемы funnel_data.
+
+    В схеме "звезда" группировка и фильтры идут по целочисленным ключам,
+    а текстовое значение измерения подставляется из справочника уже после
+    агрегации - соединяются только итоговые группы.
+
+    При approximate=True запрос читает таблицу скетчей: суммы складываются
+    из готовых сумм групп, а COUNT(DISTINCT visit_id) заменяется объединением
+    HyperLogLog-скетчей (функция hll_count должна быть зарегистрирована в соединении).
+    """
+    template = FUNNEL_TEMPLATES[kind]
+    star = layout == LAYOUT_STAR
+    group = template.get("group")
+    source_table = FUNNEL_SKETCH_TABLE if approximate else FUNNEL_TABLE
+    measures = []
+    for name in template["measures"]:
+        expression = FUNNEL_MEASURES[name]
+        if approximate:
+            expression = expression.replace(EXACT_VISITS, APPROX_VISITS)
+        measures.append(f"{expression} as {name}")
+
+    group_column = group
+    if star and group in FUNNEL_DIMENSIONS:
+        group_column = f"{group}_id"
+
+    where = []
+    if template.get("campaign_filter"):
+        if star:
+            where.append(f"utm_campaign_id = (SELECT id FROM {dim_table('utm_campaign')} WHERE value = ?)")
+        else:
+            where.append("utm_campaign = ?")
+    if template.get("not_null"):
+        where.append(f"{group_column} IS NOT NULL")
+
+    select = []
+    if "label" in template:
+        select.append(f"'{template['label']}' as metric")
+    if group_column:
+        select.append(group_column)
+    select.extend(measures)
+
+    sql = f"SELECT {', '.join(select)} FROM {source_table}"
+    if where:
+        sql += f" WHERE {' AND '.join(where)}"
+    if group_column:
+        sql += f" GROUP BY {group_column}"
+
+    if group_column != group:
+        # Подписи измерения из справочника для уже агрегированных групп
+        outer = [f"d.value as {group}"] + [f"agg.{name}" for name in template["measures"]]
+        sql = (
+            f"SELECT {', '.join(outer)} FROM ({sql}) agg "
+            f"JOIN {dim_table(group)} d ON d.id = agg.{group_column}"
+        )
+
+    if template.get("order_by"):
+        sql += f" ORDER BY {template['order_by']}"
+    if template.get("limit"):
+        sql += f" LIMIT {template['limit']}"
+    return sql
@@ -0,0 +1,109 @@
+"""
+Нечеткое сравнение строк: ограниченное расстояние Левенштейна, в том числе
+пакетное (numpy) для множества кандидатов сразу
+"""
+
+import math
+
+import numpy as np
+
+
+def max_edits(length: int, threshold: int) -> int:
+    """Максимальное число правок, при котором сходство еще не ниже порога (в процентах)"""
+    return int(math.floor(length * (100 - threshold) / 100.0 + 1e-9))
+
+
+def encode_strings(strings) -> tuple:
+    """
+    Кодирует строки в матрицу кодов символов, дополненную -1.
+
+    Returns:
+        (матрица кодов, массив длин)
+    """
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int32, count=len(strings))
+    width = int(lengths.max()) if len(strings) else 0
+    codes = np.full((len(strings), max(width, 1)), -1, dtype=np.int32)
+    for row, s in enumerate(strings):
+        codes[row, :len(s)] = [ord(char) for char in s]
+    return codes, lengths
+
+
+def bounded_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """
+    Расстояние Левенштейна с ранним выходом.
+
+    Если расстояние больше max_distance, возвращает max_distance + 1, как только
+    минимум текущей строки матрицы превысит порог.
+    """
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if len(a) < len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            value = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            )
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return max_distance + 1
+        previous = current
+
+    distance = previous[-1]
+    return distance if distance <= max_distance else max_distance + 1
+
+
+def batch_bounded_levenshtein(term: str, codes: np.ndarray, lengths: np.ndarray,
+                              max_distances: np.ndarray) -> np.ndarray:
+    """
+    Расстояния Левенштейна от термина до набора строк одной матричной операцией на символ термина.
+
+    Строка матрицы динамики считается сразу для всех кандидатов; вставки внутри
+    строки разворачиваются через minimum.accumulate. Кандидаты, у которых
+    минимум строки превысил их порог, выбывают из расчета (ранний выход).
+
+    Args:
+        term: Термин
+        codes: Коды символов кандидатов (см. encode_strings)
+        lengths: Длины кандидатов
+        max_distances: Порог расстояния для каждого кандидата
+
+    Returns:
+        Расстояния; для кандидатов дальше порога - max_distance + 1
+    """
+    result = max_distances.astype(np.int32) + 1
+    if len(codes) == 0:
+        return result
+
+    width = codes.shape[1]
+    offsets = np.arange(width + 1, dtype=np.int32)
+    alive = np.arange(len(codes))
+    previous = np.broadcast_to(offsets, (len(codes), width + 1)).copy()
+
+    for i, char in enumerate(term, 1):
+        substitution = previous[:, :-1] + (codes[alive] != ord(char))
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        current[:, 1:] = np.minimum(previous[:, 1:] + 1, substitution)
+        current = np.minimum.accumulate(current - offsets, axis=1) + offsets
+
+        keep = current.min(axis=1) <= max_distances[alive]
+        if not keep.all():
+            alive, current = alive[keep], current[keep]
+            if len(alive) == 0:
+                return result
+        previous = current
+
+    distances = previous[np.arange(len(alive)), lengths[alive]]
+    result[alive] = np.where(distances <= max_distances[alive], distances, result[alive])
+    return result
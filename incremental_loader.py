@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Инкрементальная загрузка campaign_metrics: дописываются только новые строки,
+а rollup-таблицы обновляются по затронутым ячейкам
+"""
+
+import csv
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from campaign_index import add_campaign_names
+from data_version import bump_data_version, get_data_version
+from rollups import (
+    DIMENSION_COLUMNS, FACT_TABLE, MEASURE_COLUMNS, apply_rollup_deltas, build_rollups,
+    rollups_current, stamp_rollups
+)
+from visit_sketches import sketches_current, stamp_visit_sketches
+
+WATERMARK_TABLE = "ingest_watermark"
+
+# Колонки выгрузки, не участвующие в rollup
+EXTRA_COLUMNS = {
+    "Кампания": ["Кампания", "campaign"],
+}
+
+# Естественный ключ строки выгрузки. В rko_econometric_sample.csv на одну
+# (Дата, ID Кампании, Площадка) приходится несколько групп объявлений
+# ("Кампания"), поэтому она входит в ключ.
+KEY_COLUMNS = ("Дата", "ID Кампании", "Кампания", "Площадка")
+
+
+def _to_number(value: str):
+    """Число из ячейки CSV: пустая строка -> None, целые остаются int"""
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _read_rows(csv_path: str) -> Iterator[Dict[str, object]]:
+    """Строки выгрузки с каноническими названиями колонок и приведенными типами"""
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            record = {column: (row.get(column) or None) for column in DIMENSION_COLUMNS}
+            record["Кампания"] = row.get("Кампания") or None
+            if record["ID Кампании"] is not None:
+                record["ID Кампании"] = _to_number(record["ID Кампании"])
+            for column in MEASURE_COLUMNS:
+                record[column] = _to_number(row.get(column) or "")
+            yield record
+
+
+def _fact_columns(conn: sqlite3.Connection) -> Dict[str, str]:
+    """Канонические названия колонок -> колонки campaign_metrics (создает таблицу, если ее нет)"""
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info({FACT_TABLE})")]
+    if not existing:
+        conn.execute(f"""
+            CREATE TABLE {FACT_TABLE} (
+                "Дата" TEXT, "ID Кампании" INTEGER, "Название кампании" TEXT, "Кампания" TEXT,
+                "Площадка" TEXT, "Показы" REAL, "Клики" REAL, "Расход до НДС" REAL, "Визиты" REAL
+            )
+        """)
+        existing = [row[1] for row in conn.execute(f"PRAGMA table_info({FACT_TABLE})")]
+
+    mapping = {}
+    for canonical, names in {**DIMENSION_COLUMNS, **MEASURE_COLUMNS, **EXTRA_COLUMNS}.items():
+        for name in names:
+            if name in existing:
+                mapping[canonical] = name
+                break
+    return mapping
+
+
+def _ensure_watermark(conn: sqlite3.Connection):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            max_date TEXT,
+            rows_loaded INTEGER NOT NULL,
+            data_version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+
+def get_watermark(conn: sqlite3.Connection, table: str = FACT_TABLE) -> Optional[str]:
+    """
+    Последняя загруженная дата.
+
+    Отметка действительна, только пока версия данных не менялась: после
+    полной перезагрузки другим загрузчиком берется максимальная дата в таблице.
+    """
+    try:
+        row = conn.execute(
+            f"SELECT max_date FROM {WATERMARK_TABLE} WHERE table_name = ? AND data_version = ?",
+            (table, get_data_version(conn))
+        ).fetchone()
+        if row is not None:
+            return row[0]
+    except sqlite3.OperationalError:
+        pass
+
+    date_column = _fact_columns(conn).get("Дата")
+    if date_column is None:
+        return None
+    return conn.execute(f'SELECT MAX("{date_column}") FROM {FACT_TABLE}').fetchone()[0]
+
+
+def append_campaign_metrics(conn: sqlite3.Connection, csv_path: str) -> Dict[str, object]:
+    """
+    Дописывает в campaign_metrics строки выгрузки, которых еще нет в БД.
+
+    Строки с датой раньше отметки (watermark) считаются уже загруженными и
+    пропускаются без обращения к БД. Для строк с датой не раньше отметки из
+    БД по индексу даты читаются ключи KEY_COLUMNS, и вставляются только строки
+    с новыми ключами. Затронутые ячейки rollup-таблиц обновляются upsert-ом;
+    если rollup-таблицы устарели или отсутствуют, они перестраиваются целиком.
+    Справочник кампаний пополняется новыми названиями, после чего
+    увеличивается версия данных (только если строки добавлены) и
+    записывается новая отметка. Скетчи визитов воронки, актуальные до
+    загрузки, отмечаются новой версией: funnel_data не меняется.
+
+    Returns:
+        Статистика загрузки: прочитано, вставлено, пропущено, отметка, ячейки rollup
+    """
+    columns = _fact_columns(conn)
+    date_column = columns.get("Дата")
+    if date_column is None:
+        raise ValueError(f"В таблице {FACT_TABLE} нет колонки с датой")
+
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{FACT_TABLE}_date ON {FACT_TABLE}("{date_column}")')
+    had_current_rollups = rollups_current(conn)
+    had_current_sketches = sketches_current(conn)
+    watermark = get_watermark(conn)
+
+    rows_read = 0
+    late_rows = 0
+    candidates: List[Dict[str, object]] = []
+    for row in _read_rows(csv_path):
+        rows_read += 1
+        if watermark is not None and (row["Дата"] is None or row["Дата"] < watermark):
+            late_rows += 1
+            continue
+        candidates.append(row)
+
+    # Ключи, уже загруженные за даты не раньше отметки
+    key_columns = [column for column in KEY_COLUMNS if column in columns]
+    existing_keys = set()
+    if candidates and watermark is not None:
+        select_keys = ", ".join(f'"{columns[column]}"' for column in key_columns)
+        existing_keys = {
+            tuple(key) for key in conn.execute(
+                f'SELECT {select_keys} FROM {FACT_TABLE} WHERE "{date_column}" >= ?', (watermark,)
+            )
+        }
+
+    new_rows = [
+        row for row in candidates
+        if tuple(row[column] for column in key_columns) not in existing_keys
+    ]
+
+    insert_columns = list(columns)
+    quoted = [f'"{columns[column]}"' for column in insert_columns]
+    conn.executemany(
+        f"INSERT INTO {FACT_TABLE} ({', '.join(quoted)}) VALUES ({', '.join('?' * len(quoted))})",
+        [tuple(row.get(column) for column in insert_columns) for row in new_rows]
+    )
+    add_campaign_names(conn, (row["Название кампании"] for row in new_rows))
+
+    touched = {}
+    if had_current_rollups:
+        touched = apply_rollup_deltas(conn, new_rows)
+
+    if new_rows:
+        # bump_data_version фиксирует транзакцию: факты, справочник и ячейки rollup вместе
+        version = bump_data_version(conn)
+        if had_current_rollups:
+            stamp_rollups(conn)
+        if had_current_sketches:
+            stamp_visit_sketches(conn)
+    else:
+        # Данные не изменились - кэши агента и скетчи остаются действительными
+        conn.commit()
+        version = get_data_version(conn)
+    if not had_current_rollups:
+        touched = build_rollups(conn)
+
+    new_dates = [row["Дата"] for row in new_rows if row["Дата"]]
+    new_watermark = max(new_dates + ([watermark] if watermark else []), default=None)
+    _ensure_watermark(conn)
+    conn.execute(f"""
+        INSERT INTO {WATERMARK_TABLE} (table_name, max_date, rows_loaded, data_version, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(table_name) DO UPDATE SET
+            max_date = excluded.max_date,
+            rows_loaded = rows_loaded + excluded.rows_loaded,
+            data_version = excluded.data_version,
+            updated_at = excluded.updated_at
+    """, (FACT_TABLE, new_watermark, len(new_rows), version, datetime.now().isoformat()))
+    conn.commit()
+
+    return {
+        "rows_read": rows_read,
+        "rows_inserted": len(new_rows),
+        "rows_skipped": rows_read - len(new_rows),
+        "late_rows": late_rows,
+        "watermark": new_watermark,
+        "rollup_cells": touched,
+    }
+
+
+def load_incremental(csv_path: str = 'rko_econometric_sample.csv', db_path: str = 'marketing_analytics.db'):
+    """Инкрементальная загрузка выгрузки кампаний в БД"""
+    if not os.path.exists(csv_path):
+        print(f"❌ Файл {csv_path} не найден")
+        return
+
+    print(f"🔄 Инкрементальная загрузка {csv_path}...")
+    conn = sqlite3.connect(db_path)
+    try:
+        stats = append_campaign_metrics(conn, csv_path)
+    finally:
+        conn.close()
+
+    print(f"✅ Прочитано строк: {stats['rows_read']}, добавлено: {stats['rows_inserted']}, "
+          f"пропущено: {stats['rows_skipped']} (раньше отметки: {stats['late_rows']})")
+    print(f"📅 Отметка загрузки: {stats['watermark']}")
+    for table, cells in stats["rollup_cells"].items():
+        print(f"📊 {table}: {cells} ячеек")
+
+
+if __name__ == "__main__":
+    load_incremental(*sys.argv[1:3])
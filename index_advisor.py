@@ -0,0 +1,269 @@
+"""
+Покрывающие индексы под запросы агента к funnel_data и campaign_metrics
+"""
+
+import re
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from campaign_index import get_campaign_lookup_table
+from campaign_report import (
+    REPORT_MEASURES, render_campaign_day_sql, render_campaign_report_sql, render_general_stats_sql,
+    render_name_conditions
+)
+from funnel_schema import (
+    FUNNEL_DIMENSIONS, FUNNEL_MEASURES, FUNNEL_STAR_COLUMNS, FUNNEL_TABLE, FUNNEL_TEMPLATES,
+    LAYOUT_STAR, funnel_layout, render_funnel_sql
+)
+from rollups import ROLLUPS, choose_table
+
+INDEX_PREFIX = "idx_cover_"
+
+# Колонки campaign_metrics и rollup-таблиц в шаблонах агента
+NAME_COLUMN = "Название кампании"
+PLATFORM_COLUMN = "Площадка"
+CAMPAIGN_ID_COLUMN = "ID Кампании"
+DATE_COLUMN = "Дата"
+
+
+class QueryShape(NamedTuple):
+    """
+    Форма запроса агента: колонки с фильтром на равенство, колонки группировки,
+    остальные читаемые колонки и сам SQL для проверки плана
+    """
+    name: str
+    table: str
+    equality: Tuple[str, ...]
+    group: Tuple[str, ...]
+    columns: Tuple[str, ...]
+    sql: str
+
+
+class IndexSpec(NamedTuple):
+    """Покрывающий индекс: key_size ключевых колонок, затем колонки, которые читаются из индекса"""
+    table: str
+    columns: Tuple[str, ...]
+    key_size: int
+
+    @property
+    def name(self) -> str:
+        # Имя по таблице и ключу - понятно в EXPLAIN QUERY PLAN
+        key = "_".join(re.sub(r"\W+", "_", column).strip("_") for column in self.columns[:self.key_size])
+        return f"{INDEX_PREFIX}{self.table}_{key}"
+
+
+def _funnel_columns(expression: str) -> List[str]:
+    """Колонки funnel_data, упомянутые в выражении показателя"""
+    known = {name for name, _ in FUNNEL_STAR_COLUMNS}
+    return [word for word in re.findall(r"[a-z_]+", expression) if word in known]
+
+
+def funnel_query_shapes(layout: str) -> List[QueryShape]:
+    """Формы запросов FUNNEL_TEMPLATES для схемы funnel_data"""
+    def column(name: str) -> str:
+        return f"{name}_id" if layout == LAYOUT_STAR and name in FUNNEL_DIMENSIONS else name
+
+    shapes = []
+    for kind, template in FUNNEL_TEMPLATES.items():
+        measures = []
+        for measure in template["measures"]:
+            measures.extend(_funnel_columns(FUNNEL_MEASURES[measure]))
+        shapes.append(QueryShape(
+            name=f"funnel|{kind}",
+            table=FUNNEL_TABLE,
+            equality=(column("utm_campaign"),) if template.get("campaign_filter") else (),
+            group=(column(template["group"]),) if template.get("group") else (),
+            columns=tuple(dict.fromkeys(measures)),
+            sql=render_funnel_sql(kind, layout),
+        ))
+    return shapes
+
+
+def campaign_query_shapes(conn: sqlite3.Connection) -> List[QueryShape]:
+    """
+    Формы запросов агента к campaign_metrics: SQL строится теми же функциями
+    campaign_report, что и в generate_sql_query и выгрузках, по таблице,
+    которую выбрал бы RollupRouter (rollup-таблица или таблица фактов).
+    Шаблоны агента используют русские названия колонок, поэтому таблица
+    фактов с английскими заголовками читается только через rollup-таблицы.
+    """
+    measures = tuple(REPORT_MEASURES.values())
+    # Поиск кампании по термину: через справочник или LIKE по самой таблице
+    lookup_table = get_campaign_lookup_table(conn)
+    if lookup_table:
+        name_filter = render_name_conditions(["L"], lookup_table)
+        equality: Tuple[str, ...] = (NAME_COLUMN,)
+    else:
+        name_filter = render_name_conditions(["U"])
+        equality = ()
+
+    report_table = choose_table(conn, ["campaign", "platform"])
+    general_table = choose_table(conn, ["campaign"])
+    day_table = choose_table(conn, ["campaign", "date"])
+    return [
+        QueryShape(
+            name="campaigns|report",
+            table=report_table,
+            equality=equality,
+            group=(NAME_COLUMN, PLATFORM_COLUMN),
+            columns=measures,
+            sql=render_campaign_report_sql(report_table, name_filter),
+        ),
+        QueryShape(
+            name="campaigns|general",
+            table=general_table,
+            equality=(),
+            group=(),
+            columns=(CAMPAIGN_ID_COLUMN,) + measures,
+            sql=render_general_stats_sql(general_table),
+        ),
+        QueryShape(
+            name="campaigns|by_day",
+            table=day_table,
+            equality=(NAME_COLUMN,),
+            group=(DATE_COLUMN, NAME_COLUMN),
+            columns=measures,
+            sql=render_campaign_day_sql(day_table, 1),
+        ),
+    ]
+
+
+def advise_indexes(shapes: List[QueryShape]) -> List[IndexSpec]:
+    """
+    Минимальный набор покрывающих индексов для форм запросов.
+
+    Ключ индекса - колонки равенства, затем группировки: фильтр становится
+    поиском по индексу, а группы читаются подряд без временного B-дерева.
+    Форма, ключ которой является префиксом ключа уже выбранного индекса,
+    обслуживается этим индексом, и ее колонки дописываются в его хвост.
+    Формы без ключа (итоги по всей таблице) читают любой покрывающий индекс
+    вместо строк таблицы.
+    """
+    specs: Dict[Tuple[str, Tuple[str, ...]], List[str]] = {}
+    keyless: Dict[str, List[str]] = {}
+
+    ordered = sorted(shapes, key=lambda shape: len(shape.equality) + len(shape.group), reverse=True)
+    for shape in ordered:
+        key = tuple(dict.fromkeys(shape.equality + shape.group))
+        if not key:
+            keyless.setdefault(shape.table, []).extend(shape.columns)
+            continue
+        target = next(
+            (spec_key for spec_key in specs if spec_key[0] == shape.table and spec_key[1][:len(key)] == key),
+            None
+        )
+        if target is None:
+            target = (shape.table, key)
+            specs[target] = []
+        specs[target].extend(shape.columns)
+
+    for table, columns in keyless.items():
+        table_specs = [spec_key for spec_key in specs if spec_key[0] == table]
+        if table_specs:
+            specs[table_specs[0]].extend(columns)
+        else:
+            # Запросы к таблице только без ключа - индекс по всем читаемым колонкам
+            columns = list(dict.fromkeys(columns))
+            specs[(table, (columns[0],))] = columns[1:]
+
+    return [
+        IndexSpec(table, tuple(dict.fromkeys(key + tuple(include))), len(key))
+        for (table, key), include in specs.items()
+    ]
+
+
+def create_indexes(conn: sqlite3.Connection, specs: List[IndexSpec]) -> List[str]:
+    """
+    Создает индексы советника, удаляя прежние индексы советника на тех же
+    таблицах и обычные индексы, которые стали префиксом нового покрывающего.
+
+    Returns:
+        Имена созданных индексов
+    """
+    tables = {spec.table for spec in specs}
+    for table in tables:
+        for name, unique, origin in _table_indexes(conn, table):
+            columns = _index_columns(conn, name)
+            redundant = not unique and origin == "c" and any(
+                spec.table == table and spec.columns[:len(columns)] == columns for spec in specs
+            )
+            if name.startswith(INDEX_PREFIX) or redundant:
+                conn.execute(f'DROP INDEX "{name}"')
+
+    for spec in specs:
+        columns = ", ".join(f'"{column}"' for column in spec.columns)
+        conn.execute(f'CREATE INDEX "{spec.name}" ON {spec.table} ({columns})')
+
+    # Статистика нужна планировщику, чтобы из нескольких индексов выбрать подходящий
+    for table in tables:
+        conn.execute(f"ANALYZE {table}")
+    conn.commit()
+    return [spec.name for spec in specs]
+
+
+def _table_indexes(conn: sqlite3.Connection, table: str) -> List[Tuple[str, int, str]]:
+    return [(row[1], row[2], row[3]) for row in conn.execute(f"PRAGMA index_list({table})")]
+
+
+def _index_columns(conn: sqlite3.Connection, index_name: str) -> Tuple[str, ...]:
+    return tuple(row[2] for row in conn.execute(f'PRAGMA index_info("{index_name}")'))
+
+
+def full_scans(conn: sqlite3.Connection, shape: QueryShape) -> List[str]:
+    """Шаги EXPLAIN QUERY PLAN, читающие таблицу формы целиком без индекса"""
+    if shape.table in ROLLUPS and not (shape.equality or shape.group):
+        # Итог по rollup-таблице: она сама и есть предагрегированная копия,
+        # покрывающий индекс по всем ее колонкам не короче таблицы
+        return []
+    params = [None] * shape.sql.count("?")
+    details = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {shape.sql}", params)]
+    scan = re.compile(rf"^SCAN (TABLE )?{re.escape(shape.table)}\b")
+    return [detail for detail in details if scan.match(detail) and "INDEX" not in detail]
+
+
+def verify_indexes(conn: sqlite3.Connection, shapes: List[QueryShape]) -> Dict[str, List[str]]:
+    """Формы запросов, план которых все еще читает таблицу целиком"""
+    problems = {}
+    for shape in shapes:
+        scans = full_scans(conn, shape)
+        if scans:
+            problems[shape.name] = scans
+    return problems
+
+
+def agent_query_shapes(conn: sqlite3.Connection) -> List[QueryShape]:
+    """Формы запросов агента к таблицам, которые есть в БД (со всеми нужными колонками)"""
+    shapes = campaign_query_shapes(conn)
+    layout: Optional[str] = funnel_layout(conn)
+    if layout is not None:
+        shapes += funnel_query_shapes(layout)
+
+    existing = {}
+    for table in {shape.table for shape in shapes}:
+        existing[table] = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    return [
+        shape for shape in shapes
+        if set(shape.equality + shape.group + shape.columns) <= existing[shape.table]
+    ]
+
+
+def ensure_query_indexes(conn: sqlite3.Connection) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Создает покрывающие индексы под запросы агента и проверяет планы.
+
+    Вызывается загрузчиками после записи таблиц.
+
+    Returns:
+        Имена созданных индексов и формы запросов, которые остались с полным сканированием
+    """
+    shapes = agent_query_shapes(conn)
+    names = create_indexes(conn, advise_indexes(shapes))
+    return names, verify_indexes(conn, shapes)
+
+
+def print_query_indexes(names: List[str], problems: Dict[str, List[str]]):
+    """Вывод результата ensure_query_indexes для скриптов загрузки"""
+    for name in names:
+        print(f"Индекс {name} создан")
+    for shape_name, scans in problems.items():
+        print(f"⚠️ Запрос {shape_name} читает таблицу целиком: {'; '.join(scans)}")
@@ -6,6 +6,8 @@ import sqlite3
 import pandas as pd
 from pathlib import Path
 
+from load_pipeline import finalize_load
+
 def init_database():
     """Инициализация базы данных при развертывании"""
     
@@ -101,11 +103,8 @@ def init_database():
                     )
                 """)
         
-        # Создаем индексы для оптимизации
-        print("Создание индексов...")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_campaign_name ON campaign_metrics(campaign_name)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_platform ON campaign_metrics(platform)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_date ON campaign_metrics(date)")
+        # Схема воронки, справочник кампаний, версия данных, агрегаты, скетчи и индексы
+        finalize_load(conn)
         
         print("База данных успешно создана!")
         
@@ -0,0 +1,255 @@
+"""
+Версионирование векторного индекса базы знаний: эмбеддинги хранятся вместе
+с хешами содержимого элементов и отпечатком (модель + содержимое), после
+правки базы знаний заново кодируются только измененные элементы.
+Тип индекса (точный, квантованный, HNSW, IVF-PQ) выбирается из INDEX_KINDS
+"""
+
+import hashlib
+import math
+import os
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# Типы индекса: строка faiss.index_factory (метрика - скалярное произведение,
+# векторы нормализованы) и параметры поиска. Выбор - RAG_INDEX в окружении.
+INDEX_KINDS = {
+    "flat": ("Flat", {}),                               # точный поиск
+    "fp16": ("SQfp16", {}),                             # float16, память x0.5
+    "sq8": ("SQ8", {}),                                 # int8, память x0.25
+    "hnsw": ("HNSW32", {"efSearch": 64}),               # граф, без обучения
+    "ivfpq": ("IVF{nlist},PQ{m}", {"nprobe": 16}),      # кластеры + product quantization
+}
+DEFAULT_INDEX_KIND = "flat"
+# Меньше векторов - IVF-PQ не обучить, используется точный индекс
+IVFPQ_MIN_TRAIN = 1000
+
+
+def index_kind_from_env() -> str:
+    kind = os.environ.get("RAG_INDEX", DEFAULT_INDEX_KIND).lower()
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Неизвестный тип индекса RAG_INDEX={kind}, доступны: {', '.join(INDEX_KINDS)}")
+    return kind
+
+
+def index_spec(kind: str, dim: int, count: int) -> str:
+    """Строка index_factory для kind с параметрами под размерность и число векторов"""
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Неизвестный тип индекса {kind}, доступны: {', '.join(INDEX_KINDS)}")
+    spec = INDEX_KINDS[kind][0]
+    if kind != "ivfpq":
+        return spec
+    if count < IVFPQ_MIN_TRAIN:
+        print(f"⚠️ {count} векторов недостаточно для обучения IVF-PQ, используется точный индекс")
+        return INDEX_KINDS["flat"][0]
+    # ~4*sqrt(n) кластеров, но не меньше 39 обучающих векторов на кластер
+    nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+    # Подвекторы PQ по ~8 измерений; m должно делить размерность
+    m = max(divisor for divisor in range(1, max(dim // 8, 1) + 1) if dim % divisor == 0)
+    return spec.format(nlist=nlist, m=m)
+
+
+def tune_index(index, kind: str):
+    """Параметры поиска (nprobe, efSearch) - они не все сохраняются в файле индекса"""
+    if not INDEX_KINDS[kind][1]:
+        return
+    space = faiss.ParameterSpace()
+    for name, value in INDEX_KINDS[kind][1].items():
+        try:
+            space.set_index_parameter(index, name, value)
+        except RuntimeError:
+            # IVF-PQ на малой базе построен как Flat - параметра нет
+            pass
+
+
+def build_index(kind: str, embeddings: np.ndarray):
+    """Индекс kind по нормализованным векторам: обучение (если нужно) и добавление"""
+    if not FAISS_AVAILABLE:
+        raise RuntimeError("faiss не установлен: pip install faiss-cpu")
+    count, dim = embeddings.shape
+    index = faiss.index_factory(dim, index_spec(kind, dim, count), faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    tune_index(index, kind)
+    return index
+
+
+def evaluate_index(index, embeddings: np.ndarray, queries: np.ndarray, k: int = 10) -> Dict[str, float]:
+    """
+    Качество и стоимость индекса относительно точного поиска по тем же
+    векторам: recall@k, задержка на запрос и размер сериализованного индекса
+    """
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    exact.add(embeddings)
+    _, expected = exact.search(queries, k)
+
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    elapsed = time.perf_counter() - start
+
+    hits = sum(len(set(row[row >= 0]) & set(truth[truth >= 0])) for row, truth in zip(found, expected))
+    total = int((expected >= 0).sum())
+    return {
+        "recall_at_k": hits / total if total else 1.0,
+        "latency_ms": elapsed * 1000 / len(queries),
+        "memory_bytes": int(faiss.serialize_index(index).size),
+    }
+
+
+def item_hash(text: str) -> str:
+    """Хеш текста элемента базы знаний (то, что кодируется моделью)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def knowledge_fingerprint(model_name: str, hashes: List[str]) -> str:
+    """Отпечаток индекса: модель и содержимое всех элементов по порядку"""
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    for value in hashes:
+        digest.update(b"\n" + value.encode("ascii"))
+    return digest.hexdigest()
+
+
+class EmbeddingSync(NamedTuple):
+    """Результат синхронизации эмбеддингов с базой знаний"""
+    embeddings: np.ndarray
+    encoded: List[int]              # позиции элементов, закодированных заново
+    appended_from: Optional[int]    # прежнее число элементов, если новые только добавлены в конец
+
+
+class KnowledgeEmbeddings:
+    """
+    Файл .npz с нормализованными эмбеддингами элементов, их хешами,
+    именем модели и отпечатком. Файл заменяется атомарно (os.replace),
+    поэтому хеши всегда описывают лежащие рядом векторы.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self.embeddings: Optional[np.ndarray] = None
+        self.hashes: List[str] = []
+        self.fingerprint = ""
+        # Тип FAISS индекса, записанного вместе с этим файлом
+        self.index_kind = DEFAULT_INDEX_KIND
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model_name:
+                    # Векторы другой модели не переиспользуются
+                    return
+                self.embeddings = data["embeddings"]
+                self.hashes = data["hashes"].tolist()
+                self.fingerprint = str(data["fingerprint"])
+                if "index_kind" in data.files:
+                    self.index_kind = str(data["index_kind"])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ Файл эмбеддингов {self.path} не прочитан, будет создан заново: {e}")
+            self.embeddings, self.hashes, self.fingerprint = None, [], ""
+
+    def fingerprint_for(self, texts: List[str]) -> str:
+        return knowledge_fingerprint(self.model_name, [item_hash(text) for text in texts])
+
+    def is_current(self, texts: List[str]) -> bool:
+        return bool(self.fingerprint) and self.fingerprint == self.fingerprint_for(texts)
+
+    def sync(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> EmbeddingSync:
+        """
+        Эмбеддинги для текущих texts: векторы неизмененных элементов берутся
+        из файла по хешу, encode вызывается только для новых и измененных
+        (должен возвращать нормализованные векторы). Файл не сохраняется -
+        вызывающий код сохраняет его через save() после записи индекса.
+        """
+        hashes = [item_hash(text) for text in texts]
+        previous = {}
+        if self.embeddings is not None:
+            previous = {value: row for row, value in enumerate(self.hashes)}
+
+        encoded = [position for position, value in enumerate(hashes) if value not in previous]
+        fresh = None
+        if encoded:
+            fresh = np.asarray(encode([texts[position] for position in encoded]), dtype=np.float32)
+
+        if self.embeddings is not None and self.embeddings.shape[0]:
+            dim = self.embeddings.shape[1]
+        else:
+            dim = fresh.shape[1] if fresh is not None else 0
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        reused = [(position, previous[value]) for position, value in enumerate(hashes) if value in previous]
+        if reused:
+            positions, rows = map(list, zip(*reused))
+            embeddings[positions] = self.embeddings[rows]
+        if encoded:
+            embeddings[encoded] = fresh
+
+        old_count = len(self.hashes)
+        appended = self.embeddings is not None and hashes[:old_count] == self.hashes and len(hashes) >= old_count
+        self.embeddings = embeddings
+        self.hashes = hashes
+        self.fingerprint = knowledge_fingerprint(self.model_name, hashes)
+        return EmbeddingSync(embeddings, encoded, old_count if appended else None)
+
+    def save(self):
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(
+            tmp_path, embeddings=self.embeddings, hashes=np.array(self.hashes, dtype="U32"),
+            model=np.array(self.model_name), fingerprint=np.array(self.fingerprint),
+            index_kind=np.array(self.index_kind),
+        )
+        os.replace(tmp_path, self.path)
+
+
+def sync_faiss_index(index_file: str, store: KnowledgeEmbeddings, texts: List[str],
+                     encode: Callable[[List[str]], np.ndarray], kind: str = DEFAULT_INDEX_KIND):
+    """
+    FAISS индекс типа kind (INDEX_KINDS), согласованный с texts.
+
+    Если отпечаток и тип совпадают - индекс читается с диска. Если элементы
+    только добавлены в конец - к прочитанному индексу добавляются их векторы
+    (обученные квантизаторы не переобучаются). Иначе индекс собирается из
+    сохраненных векторов без повторного кодирования неизмененных элементов.
+    Индекс записывается раньше файла эмбеддингов: после сбоя между записями
+    отпечаток не совпадет и индекс пересоберется.
+    """
+    if not FAISS_AVAILABLE:
+        raise RuntimeError("faiss не установлен: pip install faiss-cpu")
+
+    same_kind = store.index_kind == kind
+    if same_kind and store.is_current(texts) and os.path.exists(index_file):
+        index = faiss.read_index(index_file)
+        if index.ntotal == len(texts):
+            tune_index(index, kind)
+            return index
+
+    sync = store.sync(texts, encode)
+    index = None
+    if same_kind and sync.appended_from is not None and os.path.exists(index_file):
+        index = faiss.read_index(index_file)
+        if index.ntotal == sync.appended_from and index.d == sync.embeddings.shape[1]:
+            index.add(sync.embeddings[sync.appended_from:])
+            tune_index(index, kind)
+            print(f"✅ Индекс дополнен: {len(texts) - sync.appended_from} новых элементов")
+        else:
+            index = None
+    if index is None:
+        index = build_index(kind, sync.embeddings)
+        print(f"✅ Индекс {kind} собран: {len(texts)} элементов, закодировано заново {len(sync.encoded)}")
+
+    tmp_file = index_file + ".tmp"
+    faiss.write_index(index, tmp_file)
+    os.replace(tmp_file, index_file)
+    store.index_kind = kind
+    store.save()
+    return index
@@ -3,6 +3,8 @@ import sqlite3
 import os
 from datetime import datetime
 
+from load_pipeline import finalize_load
+
 def load_compact_data_to_db():
     """Загружает компактную версию данных из CSV файлов"""
     
@@ -59,6 +61,9 @@ def load_compact_data_to_db():
     print("✅ Создана пустая таблица воронки")
     
     conn.commit()
+    
+    # Схема воронки, справочник кампаний, версия данных, агрегаты, скетчи и индексы
+    finalize_load(conn)
     conn.close()
     
     # Проверяем размер файла
@@ -0,0 +1,77 @@
+"""
+Завершающий шаг загрузчиков: структуры, которые выводятся из загруженных таблиц
+"""
+
+import sqlite3
+from typing import Dict, Optional
+
+from campaign_index import build_campaign_index
+from data_version import bump_data_version
+from funnel_schema import build_funnel_star, create_wide_view
+from index_advisor import ensure_query_indexes, print_query_indexes
+from rollups import build_rollups
+from visit_sketches import approximate_visits_enabled, build_visit_sketches, drop_visit_sketches
+
+
+def finalize_load(conn: sqlite3.Connection, build_sketches: Optional[bool] = None) -> Dict[str, object]:
+    """
+    Вызывается загрузчиками после записи campaign_metrics и funnel_data.
+
+    Скетчи визитов нужны только агенту с приближенным подсчетом визитов, а
+    их построение хеширует каждый визит, поэтому по умолчанию (build_sketches
+    =None) они строятся, только если задано FUNNEL_APPROX_VISITS=1.
+
+    Порядок шагов важен: rollup-таблицы и скетчи визитов привязаны к версии
+    данных, поэтому строятся после bump_data_version, а покрывающие индексы
+    создаются последними - они ставятся и на только что пересозданные
+    rollup-таблицы, которые выбирает агент.
+
+    Returns:
+        Результаты шагов: строки воронки, кампании, rollup-таблицы, группы скетчей, индексы
+    """
+    conn.commit()
+
+    # Воронка: справочники UTM и целочисленные ключи вместо повторяющегося текста
+    funnel_rows = build_funnel_star(conn)
+    if funnel_rows:
+        print(f"Таблица funnel_data переведена в схему со справочниками: {funnel_rows} записей")
+    # Текстовые колонки воронки для скриптов проверки и ручных запросов
+    create_wide_view(conn)
+
+    # Справочник кампаний для быстрого поиска по названию
+    campaigns_count = build_campaign_index(conn)
+    print(f"Справочник кампаний создан: {campaigns_count} кампаний")
+
+    # Отмечаем новую версию данных, чтобы агент сбросил кэши
+    version = bump_data_version(conn)
+
+    # Агрегаты по кампаниям/площадкам/дням для типовых отчетов
+    rollups = build_rollups(conn)
+    for table, rows_count in rollups.items():
+        print(f"Таблица {table} создана с {rows_count} записями")
+
+    # Скетчи визитов воронки для приближенного подсчета
+    if build_sketches is None:
+        build_sketches = approximate_visits_enabled()
+    if build_sketches:
+        sketches_count = build_visit_sketches(conn)
+        print(f"Скетчи визитов воронки созданы: {sketches_count} групп")
+    else:
+        # Скетчи прежней версии данных все равно не читаются агентом
+        drop_visit_sketches(conn)
+        sketches_count = 0
+
+    # Покрывающие индексы под запросы агента
+    print("Создание индексов...")
+    index_names, full_scans = ensure_query_indexes(conn)
+    print_query_indexes(index_names, full_scans)
+
+    return {
+        "data_version": version,
+        "funnel_rows": funnel_rows,
+        "campaigns": campaigns_count,
+        "rollups": rollups,
+        "sketches": sketches_count,
+        "indexes": index_names,
+        "full_scans": full_scans,
+    }
@@ -3,6 +3,8 @@ import sqlite3
 import os
 from datetime import datetime
 
+from load_pipeline import finalize_load
+
 def load_real_data_to_db():
     """Загружает реальные данные из CSV файлов в SQLite базу"""
     
@@ -59,6 +61,9 @@ def load_real_data_to_db():
     print("✅ Создана пустая таблица воронки")
     
     conn.commit()
+    
+    # Схема воронки, справочник кампаний, версия данных, агрегаты, скетчи и индексы
+    finalize_load(conn)
     conn.close()
     
     # Проверяем размер файла
@@ -2,6 +2,9 @@ import pandas as pd
 import sqlite3
 import os
 
+from funnel_schema import FUNNEL_WIDE_VIEW
+from load_pipeline import finalize_load
+
 def load_real_funnel_data():
     """Загрузка реальных данных из CSV в таблицу funnel_data"""
     
@@ -70,24 +73,26 @@ def load_real_funnel_data():
         
         # Сохраняем в базу данных
         df.to_sql('funnel_data', conn, if_exists='replace', index=False)
+        # Схема "звезда", новая версия данных и производные таблицы
+        finalize_load(conn)
         
         print(f"Добавлено {len(df)} записей в funnel_data")
         
         # Проверяем данные для rko_spring2024
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM funnel_data WHERE utm_campaign LIKE '%rko%' OR utm_campaign LIKE '%spring%'")
+        cursor.execute(f"SELECT COUNT(*) FROM {FUNNEL_WIDE_VIEW} WHERE utm_campaign LIKE '%rko%' OR utm_campaign LIKE '%spring%'")
         count = cursor.fetchone()[0]
         print(f"Записей с RKO/spring кампаниями: {count}")
         
         # Показываем уникальные UTM кампании
-        cursor.execute("SELECT DISTINCT utm_campaign FROM funnel_data LIMIT 10")
+        cursor.execute(f"SELECT DISTINCT utm_campaign FROM {FUNNEL_WIDE_VIEW} LIMIT 10")
         campaigns = cursor.fetchall()
         print("\nУникальные UTM кампании:")
         for campaign in campaigns:
             print(f"  - {campaign[0]}")
         
         # Показываем пример данных
-        cursor.execute("SELECT * FROM funnel_data LIMIT 3")
+        cursor.execute(f"SELECT * FROM {FUNNEL_WIDE_VIEW} LIMIT 3")
         data = cursor.fetchall()
         print("\nПример данных:")
         for row in data:
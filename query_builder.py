@@ -0,0 +1,115 @@
+"""
+Параметризованные SQL запросы и кэш шаблонов запросов
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+
+def _render_value(value) -> str:
+    """Представление значения параметра в виде SQL литерала"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def render_sql(sql: str, params: Iterable = ()) -> str:
+    """Подставляет параметры вместо '?' (вне кавычек) - только для отображения"""
+    params = list(params)
+    if not params:
+        return sql
+
+    result = []
+    param_idx = 0
+    quote = None
+    for char in sql:
+        if quote:
+            if char == quote:
+                quote = None
+            result.append(char)
+        elif char in ("'", '"'):
+            quote = char
+            result.append(char)
+        elif char == '?' and param_idx < len(params):
+            result.append(_render_value(params[param_idx]))
+            param_idx += 1
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+class SQLQuery(str):
+    """
+    SQL запрос со связанными параметрами.
+
+    Строковое значение - SQL с подставленными значениями (для показа
+    пользователю и обратной совместимости), а на выполнение уходит
+    шаблон `sql` с плейсхолдерами `?` и кортеж `params`.
+    """
+
+    def __new__(cls, sql: str, params: Iterable = (), template_key: str = ""):
+        params = tuple(params)
+        obj = super().__new__(cls, render_sql(sql, params))
+        obj.sql = sql
+        obj.params = params
+        obj.template_key = template_key or sql
+        return obj
+
+    def render(self) -> str:
+        """SQL с подставленными значениями"""
+        return str.__str__(self)
+
+
+class QueryPlanCache:
+    """
+    LRU кэш текстов SQL по каноническому ключу шаблона.
+
+    Одинаковая форма вопроса ("отчет по кампании X") дает один и тот же
+    текст запроса, поэтому sqlite3 находит уже скомпилированное выражение
+    в кэше соединения и только заново связывает значения.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._plans: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, template_key: str, builder: Callable[[], str]) -> str:
+        """Возвращает SQL шаблона из кэша или строит его через builder()"""
+        with self._lock:
+            sql = self._plans.get(template_key)
+            if sql is not None:
+                self._plans.move_to_end(template_key)
+                self.hits += 1
+                return sql
+
+            self.misses += 1
+            sql = builder()
+            self._plans[template_key] = sql
+            if len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+            return sql
+
+    def get(self, template_key: str) -> Optional[str]:
+        """SQL шаблона из кэша без построения (None, если его нет)"""
+        with self._lock:
+            sql = self._plans.get(template_key)
+            if sql is not None:
+                self._plans.move_to_end(template_key)
+            return sql
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика попаданий в кэш"""
+        return {"size": len(self._plans), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._plans)
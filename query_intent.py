@@ -0,0 +1,181 @@
+"""
+Разбор намерения вопроса за один проход: все списки ключевых слов агента
+собраны в одно регулярное выражение-префиксное дерево
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Признаки вопроса и ключевые слова (подстроки вопроса в нижнем регистре)
+FUNNEL = "funnel"
+UTM = "utm"
+GENERAL_STATS = "general_stats"
+ALL_CAMPAIGNS = "all_campaigns"
+GENERAL_REPORT = "general_report"
+ORDER_COST = "order_cost"
+ORDER_IMPRESSIONS = "order_impressions"
+ORDER_CLICKS = "order_clicks"
+LIMIT_TOP = "limit_top"
+LIMIT_FIRST = "limit_first"
+CAMPAIGN_SPECIFIC = "campaign_specific"
+PRODUCT = "product"
+PLATFORM = "platform"
+PERFORMANCE = "performance"
+TREND = "trend"
+TERMS = "terms"
+FUNNEL_TOTAL = "funnel_total"
+FUNNEL_SOURCES = "funnel_sources"
+FUNNEL_DAILY = "funnel_daily"
+
+INTENT_KEYWORDS: Dict[str, List[str]] = {
+    FUNNEL: [
+        'воронка', 'воронку', 'конверсия', 'конверсии', 'заявки', 'заявок',
+        'лиды', 'лидов', 'счета', 'счетов', 'регистрации', 'регистраций',
+        'визиты', 'визитов', 'submits', 'account_num', 'created_flag',
+        'call_answered_flag', 'quality_flag', 'quality', 'динамика', 'тренд',
+    ],
+    UTM: [
+        'utm', 'utm_campaign', 'utm_source', 'utm_medium', 'utm_content', 'utm_term',
+        'метки', 'метка', 'параметры', 'параметр',
+    ],
+    GENERAL_STATS: [
+        "общая статистика", "общие показатели", "всего", "итого",
+        "общий расход", "общие показы", "общие клики", "покажи общую статистику",
+        "все кампании", "всех кампаний",
+    ],
+    ALL_CAMPAIGNS: [
+        "все кампании", "всех кампаний", "общая статистика", "общие показы", "общие клики", "покажи общую статистику",
+    ],
+    GENERAL_REPORT: [
+        "общая статистика", "общие показатели", "всего", "итого",
+        "общий расход", "общие показы", "общие клики", "покажи общую статистику",
+    ],
+    ORDER_COST: ["дорогой", "расход", "стоимость"],
+    ORDER_IMPRESSIONS: ["показы", "трафик"],
+    ORDER_CLICKS: ["клики"],
+    LIMIT_TOP: ["топ", "лучшие", "лучший"],
+    LIMIT_FIRST: ["первые", "первые 5"],
+    CAMPAIGN_SPECIFIC: ["по кампании", "кампания", "отчет по", "статистика по", "сделай отчет по", "покажи отчет по"],
+    PRODUCT: ["по продукту", "продукт", "рко", "рбидос", "бизнес-карты", "бизнес-кредиты"],
+    PLATFORM: ["по площадкам", "площадки", "платформа", "эффективность площадок"],
+    PERFORMANCE: ["эффективность", "конверсия", "результат", "лучший", "лучшие", "топ"],
+    TREND: ["по дням", "тренд", "динамика", "время", "дата", "график"],
+    TERMS: ['что такое', 'что означает', 'определение', 'расшифровка', 'ctr', 'cpc', 'cpm', 'конверсия'],
+    FUNNEL_TOTAL: ['воронка', 'воронку', 'конверсия'],
+    FUNNEL_SOURCES: ['сравни', 'сравнение', 'источники', 'каналы'],
+    FUNNEL_DAILY: ['динамика', 'тренд', 'по дням', 'график'],
+}
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Регулярное выражение из префиксного дерева слов: общие префиксы
+    записаны один раз, поэтому в каждой позиции текста проверяется путь по
+    дереву, а не каждое слово словаря. Необязательные хвосты жадные, так
+    что в позиции находится самое длинное слово.
+    """
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node: Dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if terminal:
+            return f"(?:{body})?"
+        return body
+
+    return render(trie)
+
+
+class IntentParser:
+    """
+    Поиск всех ключевых слов INTENT_KEYWORDS одним проходом по вопросу.
+
+    Выражение (?=(...)) проверяется в каждой позиции, поэтому находятся и
+    перекрывающиеся вхождения; слово, найденное в позиции, приносит признаки
+    всех ключевых слов, которые являются его подстроками. Результат совпадает
+    с any(word in question for word in ...) для каждого списка.
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]] = INTENT_KEYWORDS):
+        words = sorted({word for group in keywords.values() for word in group})
+        flags_by_word = {word: {flag for flag, group in keywords.items() if word in group} for word in words}
+        # Признаки найденного слова: его собственные и признаки слов-подстрок
+        self._flags: Dict[str, FrozenSet[str]] = {}
+        for word in words:
+            flags = set()
+            for other in words:
+                if other in word:
+                    flags |= flags_by_word[other]
+            self._flags[word] = frozenset(flags)
+        self._pattern = re.compile(f"(?=({_trie_pattern(words)}))")
+
+    def scan(self, text: str) -> FrozenSet[str]:
+        """Признаки вопроса (text - в нижнем регистре)"""
+        flags = set()
+        for match in self._pattern.finditer(text):
+            flags |= self._flags[match.group(1)]
+        return frozenset(flags)
+
+    def parse(self, question: str, campaign_name: str = "",
+              utm_params: Optional[Dict[str, str]] = None) -> "QueryIntent":
+        text = question.lower()
+        return QueryIntent(question, text, self.scan(text), campaign_name or "",
+                           tuple(sorted((utm_params or {}).items())))
+
+
+@dataclass(frozen=True)
+class QueryIntent:
+    """
+    Разобранный вопрос, который передается по конвейеру агента
+    (generate_sql_query -> analyze_data -> generate_report) вместо
+    повторных проверок ключевых слов
+    """
+    question: str
+    text: str
+    flags: FrozenSet[str]
+    campaign_name: str = ""
+    utm_params: Tuple[Tuple[str, str], ...] = ()
+
+    def has(self, flag: str) -> bool:
+        return flag in self.flags
+
+    @property
+    def is_funnel(self) -> bool:
+        """Запрос к воронке или UTM-меткам (таблица funnel_data)"""
+        return FUNNEL in self.flags or UTM in self.flags
+
+    @property
+    def utm(self) -> Dict[str, str]:
+        return dict(self.utm_params)
+
+    @property
+    def order_by(self) -> Optional[str]:
+        """Сортировка отчета по кампаниям, заданная вопросом"""
+        if ORDER_COST in self.flags:
+            return "cost DESC"
+        if ORDER_IMPRESSIONS in self.flags:
+            return "impressions DESC"
+        if ORDER_CLICKS in self.flags:
+            return "clicks DESC"
+        return None
+
+    @property
+    def limit(self) -> Optional[int]:
+        if LIMIT_TOP in self.flags:
+            return 10
+        if LIMIT_FIRST in self.flags:
+            return 5
+        return None
+
+
+# Автомат собирается один раз при импорте модуля
+INTENT_PARSER = IntentParser()
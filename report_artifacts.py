@@ -0,0 +1,139 @@
+"""
+Ленивые артефакты ответа агента: файл отчета (Excel/CSV) и данные дашборда
+строятся при первом обращении, а не на каждый вопрос
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple
+
+EXCEL_EXTENSION = "xlsx"
+CSV_EXTENSION = "csv"
+
+# Расширение файла -> (MIME тип, подпись кнопки скачивания)
+REPORT_FORMATS = {
+    EXCEL_EXTENSION: ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "📊 Скачать Excel отчет"),
+    CSV_EXTENSION: ("text/csv", "📊 Скачать CSV отчет"),
+}
+
+
+class ArtifactStore:
+    """
+    Учет построенных артефактов с вытеснением по LRU.
+
+    Хранилище держит ссылки только на артефакты с построенным значением:
+    при превышении max_items или max_bytes у самых давно использованных
+    значение освобождается (release), а сам артефакт остается рабочим и
+    при следующем обращении строится заново.
+    """
+
+    def __init__(self, max_items: int = 16, max_bytes: int = 64 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._sizes: "OrderedDict[int, Tuple[LazyArtifact, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def touch(self, artifact: "LazyArtifact", size: int = 0):
+        """Отмечает использование артефакта и вытесняет лишние"""
+        evicted = []
+        with self._lock:
+            previous = self._sizes.pop(id(artifact), None)
+            if previous is not None:
+                self._total_bytes -= previous[1]
+            self._sizes[id(artifact)] = (artifact, size)
+            self._total_bytes += size
+            # Последний использованный артефакт не вытесняется, даже если он один больше лимита
+            while len(self._sizes) > 1 and (
+                len(self._sizes) > self.max_items or self._total_bytes > self.max_bytes
+            ):
+                _, (old, old_size) = self._sizes.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old)
+            self.evicted += len(evicted)
+        for old in evicted:
+            old.release()
+
+    def discard(self, artifact: "LazyArtifact"):
+        with self._lock:
+            entry = self._sizes.pop(id(artifact), None)
+            if entry is not None:
+                self._total_bytes -= entry[1]
+
+    def stats(self) -> dict:
+        return {"size": len(self._sizes), "bytes": self._total_bytes, "evicted": self.evicted}
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+
+def _value_size(value: Any) -> int:
+    return len(value) if isinstance(value, (bytes, bytearray)) else 0
+
+
+class LazyArtifact:
+    """Значение, которое строится функцией builder при первом get() и запоминается"""
+
+    def __init__(self, builder: Callable[[], Any], store: Optional[ArtifactStore] = None):
+        self._builder = builder
+        self._store = store
+        self._value = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """Построено ли значение (и не вытеснено ли оно)"""
+        return self._ready
+
+    def _build(self) -> Any:
+        return self._builder()
+
+    def get(self) -> Any:
+        with self._lock:
+            if not self._ready:
+                self._value = self._build()
+                self._ready = True
+            value = self._value
+        if self._store is not None:
+            self._store.touch(self, _value_size(value))
+        return value
+
+    def release(self):
+        """Освобождает построенное значение (вызывается хранилищем при вытеснении)"""
+        with self._lock:
+            self._value = None
+            self._ready = False
+
+
+class ReportFile(LazyArtifact):
+    """
+    Файл отчета для кнопки скачивания. builder возвращает (содержимое,
+    расширение): формат становится известен только после построения,
+    потому что при ошибке Excel отчет выгружается в CSV.
+    """
+
+    def __init__(self, builder: Callable[[], Tuple[bytes, str]], store: Optional[ArtifactStore] = None,
+                 name_prefix: str = "отчет"):
+        super().__init__(builder, store)
+        self.extension: Optional[str] = None
+        # Время ответа, а не скачивания: имя файла не меняется между перерисовками
+        self.file_name_stem = f"{name_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    def _build(self) -> bytes:
+        data, self.extension = self._builder()
+        return data
+
+    @property
+    def file_name(self) -> str:
+        return f"{self.file_name_stem}.{self.extension or EXCEL_EXTENSION}"
+
+    @property
+    def mime(self) -> str:
+        return REPORT_FORMATS[self.extension or EXCEL_EXTENSION][0]
+
+    @property
+    def label(self) -> str:
+        return REPORT_FORMATS[self.extension or EXCEL_EXTENSION][1]
@@ -0,0 +1,72 @@
+"""
+Кэш результатов обработки вопросов с ограничением по времени жизни и размеру
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def normalize_question(question: str) -> str:
+    """Нормализация вопроса для ключа кэша: регистр, пробелы и завершающая пунктуация"""
+    return re.sub(r"\s+", " ", question.lower()).strip(" ?!.")
+
+
+class ResultCache:
+    """
+    LRU кэш с временем жизни записей (TTL).
+
+    Ключ составляет вызывающий код; для ответов агента это нормализованный
+    вопрос, шаблон SQL с параметрами, версия данных и настройки агента,
+    поэтому после перезагрузки данных старые записи просто перестают
+    находиться и вытесняются по LRU.
+    """
+
+    def __init__(self, maxsize: int = 64, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Значение по ключу или None, если записи нет или она устарела"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Сохраняет значение, вытесняя самые давно использованные записи"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика попаданий в кэш"""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "expired": self.expired}
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,292 @@
+"""
+Предагрегированные таблицы (rollup) по campaign_metrics и выбор таблицы для запроса
+"""
+
+import sqlite3
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from connection_pool import SQLiteConnectionPool
+from data_version import get_data_version
+
+FACT_TABLE = "campaign_metrics"
+ROLLUP_CATALOG_TABLE = "rollup_catalog"
+
+# Колонки rollup-таблиц называются как в исходном CSV, поэтому SQL агента
+# одинаково работает и с таблицей фактов, и с любой из rollup-таблиц.
+# Для каждой колонки перечислены возможные названия в campaign_metrics.
+DIMENSION_COLUMNS = {
+    "Дата": ["Дата", "date"],
+    "ID Кампании": ["ID Кампании", "campaign_id"],
+    "Название кампании": ["Название кампании", "campaign_name"],
+    "Площадка": ["Площадка", "platform"],
+}
+MEASURE_COLUMNS = {
+    "Показы": ["Показы", "impressions"],
+    "Клики": ["Клики", "clicks"],
+    "Расход до НДС": ["Расход до НДС", "cost_before_vat"],
+    "Визиты": ["Визиты", "visits"],
+}
+
+# Измерения запроса -> колонки, которые должны быть в таблице
+DIMENSIONS = {
+    "campaign": ("ID Кампании", "Название кампании"),
+    "platform": ("Площадка",),
+    "date": ("Дата",),
+}
+
+# Rollup-таблицы и измерения, по которым они сгруппированы
+ROLLUPS = {
+    "rollup_campaign_platform": ("campaign", "platform"),
+    "rollup_campaign_day": ("campaign", "date"),
+    "rollup_platform_day": ("platform", "date"),
+}
+
+
+def resolve_columns(conn: sqlite3.Connection, candidates: Dict[str, List[str]]) -> Dict[str, str]:
+    """Сопоставляет канонические названия колонок с реальными колонками campaign_metrics"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({FACT_TABLE})")}
+    resolved = {}
+    for canonical, names in candidates.items():
+        for name in names:
+            if name in existing:
+                resolved[canonical] = name
+                break
+    return resolved
+
+
+def fact_fingerprint(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """
+    Отпечаток campaign_metrics: число строк и максимальный rowid.
+
+    Меняется при дописывании, удалении и замене таблицы другим числом строк,
+    поэтому rollup-таблицы не используются после записи в campaign_metrics
+    в обход загрузчиков, даже если версия данных не увеличена.
+    """
+    try:
+        row = conn.execute(f"SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM {FACT_TABLE}").fetchone()
+    except sqlite3.OperationalError:
+        return (0, 0)
+    return (row[0], row[1])
+
+
+def _ensure_catalog(conn: sqlite3.Connection):
+    # Каталог без колонок отпечатка (из прежних версий) пересоздается
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({ROLLUP_CATALOG_TABLE})")}
+    if columns and "fact_max_rowid" not in columns:
+        conn.execute(f"DROP TABLE {ROLLUP_CATALOG_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ROLLUP_CATALOG_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            dimensions TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            data_version INTEGER NOT NULL,
+            fact_rows INTEGER NOT NULL,
+            fact_max_rowid INTEGER NOT NULL
+        )
+    """)
+
+
+def build_rollups(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Строит rollup-таблицы по campaign_metrics и регистрирует их в rollup_catalog.
+
+    Вызывается загрузчиками после bump_data_version: в каталоге запоминаются
+    текущая версия данных и отпечаток campaign_metrics, и агент берет rollup
+    только пока совпадают оба, поэтому загрузчик, который не перестроил rollup
+    (или запись в campaign_metrics без новой версии), не даст устаревших ответов.
+
+    Returns:
+        Количество строк в каждой построенной таблице
+    """
+    dimensions = resolve_columns(conn, DIMENSION_COLUMNS)
+    measures = resolve_columns(conn, MEASURE_COLUMNS)
+    if not measures:
+        print("Таблица campaign_metrics не найдена или без метрик, rollup-таблицы не созданы")
+        return {}
+
+    _ensure_catalog(conn)
+    version = get_data_version(conn)
+    fingerprint = fact_fingerprint(conn)
+    built = {}
+
+    for table, rollup_dims in ROLLUPS.items():
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(f"DELETE FROM {ROLLUP_CATALOG_TABLE} WHERE table_name = ?", (table,))
+
+        columns = [column for dim in rollup_dims for column in DIMENSIONS[dim]]
+        if any(column not in dimensions for column in columns):
+            continue
+
+        select_dims = [f'"{dimensions[column]}" AS "{column}"' for column in columns]
+        select_measures = [f'SUM("{source}") AS "{column}"' for column, source in measures.items()]
+        group_by = [f'"{dimensions[column]}"' for column in columns]
+        conn.execute(f"""
+            CREATE TABLE {table} AS
+            SELECT {', '.join(select_dims + select_measures)}
+            FROM {FACT_TABLE}
+            GROUP BY {', '.join(group_by)}
+        """)
+        # Ключ ячейки нужен для upsert при инкрементальной загрузке
+        key_columns = ", ".join(f'"{column}"' for column in columns)
+        conn.execute(f"CREATE UNIQUE INDEX idx_{table}_key ON {table}({key_columns})")
+        if "campaign" in rollup_dims:
+            conn.execute(f'CREATE INDEX idx_{table}_name ON {table}("Название кампании")')
+
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        conn.execute(
+            f"INSERT INTO {ROLLUP_CATALOG_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+            (table, ",".join(rollup_dims), row_count, version) + fingerprint
+        )
+        built[table] = row_count
+
+    conn.commit()
+    return built
+
+
+def rollups_current(conn: sqlite3.Connection) -> bool:
+    """Построены ли все rollup-таблицы для текущей версии данных и строк campaign_metrics"""
+    return len(_catalog_rollups(conn, get_data_version(conn), fact_fingerprint(conn))) == len(ROLLUPS)
+
+
+def apply_rollup_deltas(conn: sqlite3.Connection, rows: Iterable[Dict[str, object]]) -> Dict[str, int]:
+    """
+    Добавляет новые строки фактов в rollup-таблицы через upsert.
+
+    Строки задаются каноническими названиями колонок (DIMENSION_COLUMNS,
+    MEASURE_COLUMNS). Дельты сначала суммируются по ячейкам в памяти, затем
+    каждая затронутая ячейка обновляется одним INSERT ... ON CONFLICT, поэтому
+    стоимость пропорциональна числу новых строк, а не размеру истории.
+    Коммит и отметку версии (stamp_rollups) выполняет вызывающий код.
+
+    Returns:
+        Количество затронутых ячеек в каждой таблице
+    """
+    rows = list(rows)
+    measures = list(MEASURE_COLUMNS)
+    touched = {}
+
+    for table, rollup_dims in ROLLUPS.items():
+        columns = [column for dim in rollup_dims for column in DIMENSIONS[dim]]
+        cells: Dict[Tuple, List[float]] = {}
+        for row in rows:
+            cell = cells.setdefault(tuple(row.get(column) for column in columns), [0] * len(measures))
+            for i, measure in enumerate(measures):
+                value = row.get(measure)
+                if value is not None:
+                    cell[i] += value
+
+        quoted = [f'"{column}"' for column in columns + measures]
+        insert_sql = f"INSERT INTO {table} ({', '.join(quoted)}) VALUES ({', '.join('?' * len(quoted))})"
+        updates = [f'"{m}" = COALESCE("{m}", 0) + excluded."{m}"' for m in measures]
+        conn.executemany(f"""
+            {insert_sql}
+            ON CONFLICT({', '.join(quoted[:len(columns)])}) DO UPDATE SET {', '.join(updates)}
+        """, [key + tuple(values) for key, values in cells.items() if None not in key])
+
+        # Уникальный индекс считает NULL различными, и ON CONFLICT для ключа
+        # с NULL (например, без площадки) не срабатывает - такие ячейки
+        # обновляются по IS, а вставляются, только если ячейки еще нет
+        update_sql = (
+            f"UPDATE {table} SET {', '.join(f'{q} = COALESCE({q}, 0) + ?' for q in quoted[len(columns):])} "
+            f"WHERE {' AND '.join(f'{q} IS ?' for q in quoted[:len(columns)])}"
+        )
+        for key, values in cells.items():
+            if None in key and conn.execute(update_sql, tuple(values) + key).rowcount == 0:
+                conn.execute(insert_sql, key + tuple(values))
+        touched[table] = len(cells)
+
+    return touched
+
+
+def stamp_rollups(conn: sqlite3.Connection):
+    """Отмечает rollup-таблицы актуальными для текущей версии данных и строк campaign_metrics"""
+    version = get_data_version(conn)
+    fact_rows, fact_max_rowid = fact_fingerprint(conn)
+    for table in ROLLUPS:
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        conn.execute(
+            f"UPDATE {ROLLUP_CATALOG_TABLE} SET row_count = ?, data_version = ?, fact_rows = ?, "
+            f"fact_max_rowid = ? WHERE table_name = ?",
+            (row_count, version, fact_rows, fact_max_rowid, table)
+        )
+    conn.commit()
+
+
+def _catalog_rollups(conn: sqlite3.Connection, version: int,
+                     fingerprint: Tuple[int, int]) -> List[Tuple[int, str, FrozenSet[str]]]:
+    """
+    Rollup-таблицы, построенные для версии данных version и отпечатка
+    campaign_metrics fingerprint, от меньшей к большей: (строк, таблица, измерения)
+    """
+    try:
+        rows = conn.execute(
+            f"SELECT table_name, dimensions, row_count FROM {ROLLUP_CATALOG_TABLE} "
+            f"WHERE data_version = ? AND fact_rows = ? AND fact_max_rowid = ?", (version,) + fingerprint
+        ).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    return sorted(
+        (row_count, table, frozenset(dimensions.split(",")))
+        for table, dimensions, row_count in rows
+    )
+
+
+def _smallest_table(rollups: List[Tuple[int, str, FrozenSet[str]]], dimensions: Iterable[str]) -> str:
+    needed = frozenset(dimensions)
+    for _, table, rollup_dims in rollups:
+        if needed <= rollup_dims:
+            return table
+    return FACT_TABLE
+
+
+def choose_table(conn: sqlite3.Connection, dimensions: Iterable[str]) -> str:
+    """То же, что RollupRouter.choose, по одному соединению без кэша каталога"""
+    return _smallest_table(_catalog_rollups(conn, get_data_version(conn), fact_fingerprint(conn)), dimensions)
+
+
+class RollupRouter:
+    """
+    Выбирает самую маленькую таблицу, которая может ответить на запрос.
+
+    Запрос описывается набором измерений (campaign, platform, date), по
+    которым он группирует или фильтрует. Подходит любая rollup-таблица,
+    содержащая все эти измерения и построенная для текущей версии данных
+    и текущих строк campaign_metrics; из подходящих берется таблица с
+    наименьшим числом строк, иначе - campaign_metrics.
+    """
+
+    def __init__(self, pool: SQLiteConnectionPool):
+        self.pool = pool
+        self.version: Optional[int] = None
+        self.fingerprint: Optional[Tuple[int, int]] = None
+        self._rollups: List[Tuple[int, str, FrozenSet[str]]] = []
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Перечитывает rollup_catalog; True, если выбор таблиц изменился"""
+        with self.pool.connection() as conn:
+            version = get_data_version(conn)
+            # Отпечаток проверяется при каждом выборе: скрипт, записавший
+            # campaign_metrics без новой версии данных, иначе оставил бы
+            # агенту устаревшие rollup-таблицы. Каталог - несколько строк,
+            # он перечитывается вместе с отпечатком
+            fingerprint = fact_fingerprint(conn)
+            rollups = _catalog_rollups(conn, version, fingerprint)
+
+        with self._lock:
+            changed = force or (version, fingerprint, rollups) != (self.version, self.fingerprint, self._rollups)
+            self._rollups = rollups
+            self.version = version
+            self.fingerprint = fingerprint
+        return changed
+
+    def choose(self, dimensions: Iterable[str]) -> str:
+        """Таблица для запроса по заданным измерениям"""
+        self.refresh()
+        return _smallest_table(self._rollups, dimensions)
+
+    def tables(self) -> List[str]:
+        """Доступные rollup-таблицы от меньшей к большей"""
+        self.refresh()
+        return [table for _, table, _ in self._rollups]
@@ -1,21 +1,89 @@
+import importlib.util
+import threading
+from concurrent.futures import Future
 import numpy as np
 import faiss
 import pickle
 import os
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from embedding_cache import EmbeddingCache
+from knowledge_embeddings import KnowledgeEmbeddings, index_kind_from_env, sync_faiss_index
+from term_index import TermIndex
+
+# sentence_transformers (и torch) импортируется только при загрузке модели,
+# здесь лишь проверяем, что пакет установлен
+if importlib.util.find_spec("sentence_transformers") is None:
+    raise ImportError("sentence_transformers не установлен: pip install sentence-transformers")
 
 class SimpleVectorRAG:
-    def __init__(self):
-        """Простая векторная RAG система"""
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')  # Быстрая модель
+    def __init__(self, query_cache_file: Optional[str] = "simple_rag_query_cache.npy",
+                 background: bool = False, index_kind: Optional[str] = None):
+        """
+        Простая векторная RAG система.
+
+        Модель загружается при первом вычислении эмбеддинга: при готовом
+        индексе на диске и повторных или словарных запросах она не нужна.
+        С background=True индекс и модель загружаются в фоновом потоке,
+        конструктор не блокируется; готовность - future ready.
+        index_kind - тип FAISS индекса (knowledge_embeddings.INDEX_KINDS),
+        по умолчанию из RAG_INDEX в окружении.
+        """
+        self.model_name = 'all-MiniLM-L6-v2'  # Быстрая модель
+        self._model = None
+        self._model_lock = threading.Lock()
         self.index = None
         self.knowledge_items = []
         self.index_file = "simple_rag_index.faiss"
+        self.embeddings_file = "simple_rag_embeddings.npz"
+        self.index_kind = index_kind or index_kind_from_env()
+        self.query_cache_file = query_cache_file
+        self.query_cache = None
         
         # Загружаем знания
         self._load_knowledge()
+        
+        # Вопросы об определениях отвечаются по словарю терминов
+        self.terms = TermIndex(self.knowledge_items)
+        
+        # Результат - сама система, когда индекс (и в фоновом режиме модель) загружены
+        self.ready: Future = Future()
+        if background:
+            threading.Thread(target=self._warm_up, name="rag-warm-up", daemon=True).start()
+        else:
+            self._prepare_index()
+            self.ready.set_result(self)
+    
+    def _prepare_index(self):
         self._build_index()
+        # Эмбеддинги запросов: LRU в памяти и memmap-файл между запусками
+        self.query_cache = EmbeddingCache(self.query_cache_file, self.index.d, namespace=self.model_name)
+    
+    def _warm_up(self):
+        """Фоновая загрузка индекса и модели"""
+        try:
+            self._prepare_index()
+            self.model
+        except Exception as e:
+            print(f"Ошибка загрузки RAG системы: {e}")
+            self.ready.set_exception(e)
+        else:
+            print("✅ RAG система готова")
+            self.ready.set_result(self)
+    
+    def is_ready(self) -> bool:
+        """Поиск не будет ждать загрузки"""
+        return self.ready.done() and self.ready.exception() is None
+    
+    @property
+    def model(self):
+        # Блокировка: фоновая загрузка и синхронный поиск не грузят модель дважды
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                print("🔄 Загрузка модели эмбеддингов...")
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
     
     def _load_knowledge(self):
         """Загружает базу знаний"""
@@ -71,59 +139,91 @@ class SimpleVectorRAG:
             {"term": "Бизнес-кредиты кампании", "definition": "Рекламные кампании для продвижения кредитных продуктов для бизнеса"}
         ]
     
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Нормализованные (для косинусного сходства) эмбеддинги текстов"""
+        embeddings = self.model.encode(texts, show_progress_bar=len(texts) > 16)
+        return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype('float32')
+    
     def _build_index(self):
-        """Создает векторный индекс"""
-        if os.path.exists(self.index_file):
-            print("🔄 Загрузка существующего индекса...")
-            self.index = faiss.read_index(self.index_file)
-            return
-        
-        print("🔄 Создание векторного индекса...")
-        
-        # Создаем тексты для эмбеддингов
-        texts = []
-        for item in self.knowledge_items:
-            text = f"{item['term']} {item['definition']}"
-            texts.append(text)
-        
-        # Создаем эмбеддинги
-        embeddings = self.model.encode(texts, show_progress_bar=True)
-        
-        # Нормализуем для косинусного сходства
-        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-        
-        # Создаем FAISS индекс
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)
-        self.index.add(embeddings.astype('float32'))
-        
-        # Сохраняем индекс
-        faiss.write_index(self.index, self.index_file)
-        print(f"✅ Индекс создан: {len(self.knowledge_items)} элементов")
-    
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Семантический поиск"""
-        # Создаем эмбеддинг для запроса
-        query_embedding = self.model.encode([query])
-        query_embedding = query_embedding / np.linalg.norm(query_embedding, axis=1, keepdims=True)
-        
-        # Ищем похожие векторы
-        similarities, indices = self.index.search(query_embedding.astype('float32'), top_k)
+        """
+        Загружает векторный индекс или приводит его в соответствие с
+        knowledge_items: файл эмбеддингов помечен отпечатком модели и
+        содержимого, модель кодирует только новые и измененные элементы
+        """
+        texts = [f"{item['term']} {item['definition']}" for item in self.knowledge_items]
+        store = KnowledgeEmbeddings(self.embeddings_file, self.model_name)
+        if not store.is_current(texts):
+            print("🔄 Обновление векторного индекса...")
+        self.index = sync_faiss_index(self.index_file, store, texts, self._encode_texts, self.index_kind)
+    
+    def _query_embeddings(self, queries: List[str]) -> np.ndarray:
+        """
+        Нормализованные эмбеддинги запросов (n x d): найденные в кэше берутся
+        из него, остальные (без повторов) кодируются одним вызовом model.encode
+        """
+        embeddings = np.empty((len(queries), self.index.d), dtype='float32')
+        missing: Dict[str, List[int]] = {}
+        for row, query in enumerate(queries):
+            cached = self.query_cache.get(query)
+            if cached is None:
+                missing.setdefault(query, []).append(row)
+            else:
+                embeddings[row] = cached
         
-        # Возвращаем результаты
+        if missing:
+            encoded = self._encode_texts(list(missing))
+            for embedding, (query, rows) in zip(encoded, missing.items()):
+                embeddings[rows] = embedding
+                self.query_cache.put(query, embedding)
+        return embeddings
+    
+    def _hits(self, indices: np.ndarray, similarities: np.ndarray) -> List[Dict]:
+        """Элементы знаний по строке результата FAISS (без -1 при нехватке элементов)"""
         results = []
-        for idx, similarity in zip(indices[0], similarities[0]):
-            if idx < len(self.knowledge_items):
+        for idx, similarity in zip(indices, similarities):
+            if 0 <= idx < len(self.knowledge_items):
                 item = self.knowledge_items[idx].copy()
                 item['similarity'] = float(similarity)
                 results.append(item)
-        
         return results
     
-    def enhance_report(self, report: str, question: str) -> str:
-        """Улучшает отчет с помощью векторного поиска"""
-        results = self.search(question, top_k=2)
+    def search(self, query: str, top_k: int = 3, wait: bool = True) -> List[Dict]:
+        """
+        Поиск: сначала точное совпадение терминов, затем семантический.
+        wait=False - пока система загружается, семантический поиск
+        пропускается (пустой результат) вместо ожидания.
+        """
+        if not wait and not self.is_ready() and not self.terms.lookup(query):
+            return []
+        return self.search_batch([query], top_k)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 3) -> List[List[Dict]]:
+        """
+        Поиск по списку запросов: словарные запросы отвечаются по терминам,
+        остальные кодируются одним батчем и ищутся одним index.search
+        по матрице (n x d). Результаты - в порядке queries.
+        """
+        results: List[List[Dict]] = [[] for _ in queries]
+        semantic = []
+        for position, query in enumerate(queries):
+            # "что такое CTR" - термин находится по словарю, модель не нужна
+            exact = self.terms.lookup(query)
+            if exact:
+                results[position] = [dict(self.knowledge_items[idx], similarity=1.0) for idx in exact[:top_k]]
+            else:
+                semantic.append(position)
+        
+        if semantic:
+            # Ошибка фоновой загрузки пробрасывается отсюда
+            self.ready.result()
+            query_embeddings = self._query_embeddings([queries[position] for position in semantic])
+            similarities, indices = self.index.search(query_embeddings, top_k)
+            for row, position in enumerate(semantic):
+                results[position] = self._hits(indices[row], similarities[row])
         
+        return results
+    
+    def _with_context(self, report: str, results: List[Dict]) -> str:
         if not results:
             return report
         
@@ -135,6 +235,17 @@ class SimpleVectorRAG:
             enhanced += f"   📊 Релевантность: {item['similarity']:.2f}\n\n"
         
         return enhanced
+    
+    def enhance_report(self, report: str, question: str, wait: bool = True) -> str:
+        """Улучшает отчет с помощью векторного поиска"""
+        return self._with_context(report, self.search(question, top_k=2, wait=wait))
+    
+    def enhance_reports_batch(self, reports: List[str], questions: List[str]) -> List[str]:
+        """Улучшает пакет отчетов (например, регламентный прогон вопросов) одним батч-поиском"""
+        if len(reports) != len(questions):
+            raise ValueError("Число отчетов и вопросов должно совпадать")
+        results = self.search_batch(questions, top_k=2)
+        return [self._with_context(report, hits) for report, hits in zip(reports, results)]
 
 # Тестирование
 if __name__ == "__main__":
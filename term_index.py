@@ -0,0 +1,56 @@
+"""
+Точный поиск терминов базы знаний: вопрос вида "что такое CTR"
+находится по словарю терминов без обращения к модели эмбеддингов
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# Слова, из которых (кроме самих терминов) может состоять вопрос-запрос определения
+GLOSSARY_WORDS = frozenset([
+    "что", "такое", "это", "означает", "значит", "обозначает", "определение", "расшифровка",
+    "расшифруй", "расшифровать", "термин", "аббревиатура", "объясни", "поясни", "как", "понимать",
+    "кто", "такие", "и", "а", "или", "про", "о", "об", "метрика", "показатель",
+])
+
+
+class TermIndex:
+    """
+    Индекс терминов knowledge_items.
+
+    Все термины собраны в одно регулярное выражение: более длинные идут
+    раньше ("РКО кампании" находится целиком, а не как "РКО"), границы -
+    не буквы и не цифры, поэтому "CR" не находится внутри "CTR".
+    """
+
+    def __init__(self, knowledge_items: List[Dict]):
+        self._by_term: Dict[str, int] = {}
+        for index, item in enumerate(knowledge_items):
+            self._by_term.setdefault(item["term"].casefold(), index)
+        terms = sorted(self._by_term, key=len, reverse=True)
+        self._pattern = re.compile(
+            r"(?<!\w)(" + "|".join(re.escape(term) for term in terms) + r")(?!\w)", re.IGNORECASE
+        ) if terms else None
+
+    def find(self, text: str) -> List[int]:
+        """Номера терминов, упомянутых в тексте, в порядке упоминания (без повторов)"""
+        if self._pattern is None:
+            return []
+        found = dict.fromkeys(self._by_term[match.group(1).casefold()] for match in self._pattern.finditer(text))
+        return list(found)
+
+    def lookup(self, query: str) -> Optional[List[int]]:
+        """
+        Номера терминов, если запрос - только термины и слова вопроса
+        об определении ("что такое CTR и CPC?"), иначе None: такой запрос
+        нужно искать семантически.
+        """
+        if self._pattern is None:
+            return None
+        found = self.find(query)
+        if not found:
+            return None
+        rest = re.findall(r"\w+", self._pattern.sub(" ", query).lower())
+        if any(word not in GLOSSARY_WORDS for word in rest):
+            return None
+        return found
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки движков запросов агента (SQLite и DuckDB)
+"""
+
+import numbers
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from analytics_backend import DuckDBBackend, SQLiteBackend, build_columnar_store, create_backend
+from campaign_index import build_campaign_index, get_campaign_lookup_table
+from campaign_report import (
+    render_campaign_day_sql, render_campaign_report_sql, render_general_stats_sql, render_name_conditions
+)
+from connection_pool import SQLiteConnectionPool
+from data_version import bump_data_version
+from funnel_schema import FUNNEL_TEMPLATES, LAYOUT_STAR, build_funnel_star, render_funnel_sql
+from incremental_loader import append_campaign_metrics
+from rollups import FACT_TABLE, ROLLUPS
+
+DAY_CAMPAIGNS = ["Годовая кампания. Самозанятые ИП 2025", "Годовой Performance РКО + ОТР (eCom)"]
+
+
+def _create_db(path):
+    conn = sqlite3.connect(path)
+    append_campaign_metrics(conn, "rko_econometric_sample.csv")
+    build_campaign_index(conn)
+    conn.execute("""
+        CREATE TABLE funnel_data (date, traffic_source, utm_campaign, utm_source, utm_medium, utm_content,
+                                  utm_term, visit_id, submits, res, subs_all, account_num, created_flag,
+                                  call_answered_flag, quality_flag, quality)
+    """)
+    # visit_id и числа, и текст - в DuckDB колонка станет VARCHAR
+    conn.executemany("INSERT INTO funnel_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (f"2025-05-{i % 30 + 1:02d}", "Ad traffic", f"rko_{i % 7}", ["yandex", "vk", None][i % 3], "cpc", "c", "t",
+         i if i % 2 else f"visit_{i}", float(i % 5), 0.0, 0.0, i % 2, 0, 0, i % 3 == 0, 0)
+        for i in range(3000)
+    ])
+    build_funnel_star(conn)
+    bump_data_version(conn)
+    conn.close()
+
+
+def _normalize(df):
+    """Строки результата с округлением - движки по-разному представляют числа"""
+    def value(item):
+        if isinstance(item, numbers.Real):
+            return None if item != item else round(float(item), 6)
+        return item
+    return sorted((tuple(value(item) for item in row) for row in df.itertuples(index=False)), key=repr)
+
+
+def _agent_queries(conn):
+    """
+    SQL, который выполняет агент: шаблоны воронки и отчеты по кампаниям
+    (CTE с ROW_NUMBER, UNION ALL и HAVING) по таблице фактов и rollup-таблицам
+    """
+    queries = []
+    for kind, template in FUNNEL_TEMPLATES.items():
+        params = ["rko_1"] if template.get("campaign_filter") else []
+        queries.append((f"funnel|{kind}", render_funnel_sql(kind, LAYOUT_STAR), params))
+
+    lookup_table = get_campaign_lookup_table(conn)
+    assert lookup_table
+    for table in [FACT_TABLE] + list(ROLLUPS):
+        dims = ROLLUPS.get(table, ("campaign", "platform", "date"))
+        if "campaign" not in dims:
+            continue
+        queries.append((f"{table}|general", render_general_stats_sql(table), []))
+        if "date" in dims:
+            queries.append((f"{table}|by_day", render_campaign_day_sql(table, len(DAY_CAMPAIGNS)), DAY_CAMPAIGNS))
+        if "platform" not in dims:
+            continue
+        queries += [
+            (f"{table}|report", render_campaign_report_sql(table), []),
+            (f"{table}|report_lookup", render_campaign_report_sql(
+                table, render_name_conditions(["L"], lookup_table), "cost DESC", 5
+            ), ["%РКО%"]),
+            (f"{table}|report_like", render_campaign_report_sql(
+                table, render_name_conditions(["UN"]), "clicks DESC", 3
+            ), ["%РКО%", "%РКО%"]),
+        ]
+    return queries
+
+
+def test_sqlite_backend():
+    print("🧪 Тестирование движка SQLite")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "backend.db")
+        _create_db(db_path)
+        pool = SQLiteConnectionPool(db_path)
+        backend = create_backend("sqlite", pool)
+        assert isinstance(backend, SQLiteBackend)
+        df = backend.read_sql("SELECT COUNT(*) AS rows_count FROM funnel_data WHERE date = ?", ["2025-05-01"])
+        assert df["rows_count"][0] == 100
+        try:
+            create_backend("parquet", pool)
+            assert False, "ожидалась ошибка"
+        except ValueError:
+            pass
+        pool.close_all()
+    print("✅ SQLite выполняет параметризованные шаблоны")
+
+
+def test_duckdb_matches_sqlite():
+    print("🧪 Тестирование колоночного движка DuckDB")
+    pytest.importorskip("duckdb")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "backend.db")
+        _create_db(db_path)
+
+        conn = sqlite3.connect(db_path)
+        queries = _agent_queries(conn)
+        conn.close()
+
+        copied = build_columnar_store(db_path)
+        assert copied["funnel_data"] == 3000
+        # Служебные таблицы FTS5 не переносятся, сама таблица поиска - переносится
+        assert not any(table.startswith("campaign_name_fts_") for table in copied)
+
+        pool = SQLiteConnectionPool(db_path)
+        sqlite_backend = SQLiteBackend(pool)
+        duckdb_backend = DuckDBBackend(pool)
+        for name, sql, params in queries:
+            expected = _normalize(sqlite_backend.read_sql(sql, params))
+            assert expected, name
+            assert _normalize(duckdb_backend.read_sql(sql, params)) == expected, name
+
+        # Новая версия данных в SQLite - хранилище перестраивается при следующем запросе
+        writer = sqlite3.connect(db_path)
+        writer.execute("DELETE FROM funnel_data WHERE date = '2025-05-01'")
+        bump_data_version(writer)
+        writer.close()
+        df = duckdb_backend.read_sql("SELECT COUNT(*) AS rows_count FROM funnel_data")
+        assert df["rows_count"][0] == 2900
+
+        duckdb_backend.close()
+        pool.close_all()
+    print("✅ Результаты шаблонов совпадают на обоих движках")
+
+
+if __name__ == "__main__":
+    test_sqlite_backend()
+    test_duckdb_matches_sqlite()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки векторизованного анализа результатов запросов
+"""
+
+import pandas as pd
+
+from ai_agent import MarketingAnalyticsAgent
+
+
+def _agent():
+    # Анализ не обращается к БД и моделям - агент без инициализации
+    return MarketingAnalyticsAgent.__new__(MarketingAnalyticsAgent)
+
+
+def test_campaign_analysis():
+    print("🧪 Тестирование анализа кампаний")
+    df = pd.DataFrame({
+        "campaign_name": ["A", "A", "B", "C", "D", "E", "F"],
+        "platform": ["VK", "Яндекс", "VK", "VK", "Яндекс", "VK", "VK"],
+        "impressions": [1000, 2000, 500, 800, 100, 300, 0],
+        "clicks": [10, 50, 5, 40, 1, 6, 0],
+        "cost": [100.0, 400.0, 50.0, 300.0, 10.0, 60.0, 0.0],
+        "visits": [8, 30, 2, 20, 1, 3, 0],
+        "ctr": [1.0, 2.5, 1.0, 5.0, 1.0, 2.0, None],
+        "cpc": [10.0, 8.0, 10.0, 7.5, 10.0, 10.0, None],
+    })
+    summary = _agent().analyze_data(df, "Покажи кампании")["summary"]
+
+    assert summary["total_impressions"] == 4700 and summary["total_clicks"] == 112
+    assert summary["avg_ctr"] == round(112 / 4700 * 100, 2)
+    assert summary["avg_cpc"] == round(920 / 112, 2)
+    assert summary["campaigns_count"] == 6
+    assert len(summary["campaigns"]) == 7
+    assert summary["campaigns"][0] == {
+        "campaign_name": "A", "platform": "VK", "impressions": 1000, "clicks": 10,
+        "cost": 100.0, "visits": 8, "ctr": 1.0, "cpc": 10.0,
+    }
+    # По CTR по убыванию, при равенстве - в порядке результата
+    assert [(c["campaign_name"], c["platform"]) for c in summary["top_campaigns"]] == [
+        ("C", "VK"), ("A", "Яндекс"), ("E", "VK"), ("A", "VK"), ("B", "VK"),
+    ]
+    assert {p["platform"]: p["impressions"] for p in summary["platforms"]} == {"VK": 2600, "Яндекс": 2100}
+    # CTR площадки - отношение сумм
+    assert {p["platform"]: p["ctr"] for p in summary["platforms"]} == {"VK": round(61 / 2600 * 100, 2), "Яндекс": round(51 / 2100 * 100, 2)}
+    print("✅ Итоги, записи кампаний, топ по CTR и площадки")
+
+
+def test_report_levels_analysis():
+    print("🧪 Тестирование анализа результата с уровнями отчета")
+    df = pd.DataFrame({
+        "level": ["campaign", "campaign", "platform", "platform", "total"],
+        "row_rank": [1, 2, 0, 0, 0],
+        "campaign_name": ["A", "B", None, None, None],
+        "platform": ["VK", "Яндекс", "VK", "Яндекс", None],
+        "impressions": [1000, 3000, 1000, 3000, 4000],
+        "clicks": [10, 90, 10, 90, 100],
+        "cost": [100.0, 500.0, 100.0, 500.0, 600.0],
+        "visits": [8, 60, 8, 60, 68],
+        "ctr": [1.0, 3.0, 1.0, 3.0, 2.5],
+        "cpc": [10.0, 5.56, 10.0, 5.56, 6.0],
+        "campaigns_count": [None, None, 1, 1, 2],
+    })
+    summary = _agent().analyze_data(df, "Покажи кампании")["summary"]
+
+    # Итоги и CTR/CPC берутся из строки total, а не пересчитываются
+    assert summary["total_impressions"] == 4000 and summary["avg_ctr"] == 2.5 and summary["avg_cpc"] == 6.0
+    assert summary["campaigns_count"] == 2
+    assert [c["campaign_name"] for c in summary["campaigns"]] == ["A", "B"]
+    assert [c["campaign_name"] for c in summary["top_campaigns"]] == ["B", "A"]
+    assert summary["platforms"] == [
+        {"platform": "VK", "impressions": 1000, "clicks": 10, "cost": 100.0, "visits": 8, "ctr": 1.0, "cpc": 10.0},
+        {"platform": "Яндекс", "impressions": 3000, "clicks": 90, "cost": 500.0, "visits": 60, "ctr": 3.0, "cpc": 5.56},
+    ]
+    print("✅ Сводка, кампании и площадки собраны из блоков SQL")
+
+
+def test_funnel_analysis():
+    print("🧪 Тестирование анализа воронки")
+    agent = _agent()
+    total = pd.DataFrame([{"metric": "Общая воронка", "visits": 100, "submits": 30.0, "accounts_opened": 12}])
+    summary = agent._analyze_funnel_data(total, "воронка")["summary"]
+    # Колонок нет в результате - значения по умолчанию
+    assert summary["visits"] == 100 and summary["accounts_opened"] == 12 and summary["quality_leads"] == 0
+
+    daily = pd.DataFrame({"date": ["2025-05-01", "2025-05-02"], "visits": [5, 7], "submits": [1.0, 2.0]})
+    trends = agent._analyze_funnel_data(daily, "динамика")["summary"]["daily_trends"]
+    assert trends == [
+        {"date": "2025-05-01", "visits": 5, "submits": 1.0, "accounts_opened": 0, "quality_leads": 0},
+        {"date": "2025-05-02", "visits": 7, "submits": 2.0, "accounts_opened": 0, "quality_leads": 0},
+    ]
+
+    sources = pd.DataFrame({"utm_source": ["yandex"], "visits": [10], "conversion_to_submits": [12.5]})
+    comparison = agent._analyze_funnel_data(sources, "сравни источники")["summary"]["sources_comparison"]
+    assert comparison[0]["utm_source"] == "yandex" and comparison[0]["conversion_to_submits"] == 12.5
+    print("✅ Записи воронки собираются без обхода строк")
+
+
+if __name__ == "__main__":
+    test_campaign_analysis()
+    test_report_levels_analysis()
+    test_funnel_analysis()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки резидентного каталога кампаний
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from campaign_catalog import CampaignCatalog
+from campaign_index import build_campaign_index
+from connection_pool import SQLiteConnectionPool
+from data_version import bump_data_version, get_data_version
+
+
+def _create_db(path, names):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE campaign_metrics ("Название кампании" TEXT, "Показы" REAL)')
+    conn.executemany("INSERT INTO campaign_metrics VALUES (?, 1)", [(name,) for name in names])
+    build_campaign_index(conn)
+    bump_data_version(conn)
+    return conn
+
+
+def test_data_version():
+    print("🧪 Тестирование версии данных")
+    conn = sqlite3.connect(":memory:")
+    assert get_data_version(conn) == 0
+    assert bump_data_version(conn) == 1
+    assert bump_data_version(conn) == 2
+    conn.close()
+    print("✅ Версия увеличивается при каждой загрузке")
+
+
+def test_campaign_catalog():
+    print("🧪 Тестирование каталога кампаний")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "catalog.db")
+        conn = _create_db(db_path, [
+            "ФРК4 Бизнес-Фест, апрель-декабрь 2025",
+            "Годовой performance. РКО 2025.",
+            "Годовой Performance РКО + ОТР (eCom)",
+        ])
+        pool = SQLiteConnectionPool(db_path)
+        catalog = CampaignCatalog(pool)
+
+        assert len(catalog.names()) == 3
+        assert catalog.search("фрк-4") == ["ФРК4 Бизнес-Фест, апрель-декабрь 2025"]
+        assert len(catalog.search("PERFORMANCE")) == 2
+        assert set(catalog.search("РКО")) == {"Годовой performance. РКО 2025.", "Годовой Performance РКО + ОТР (eCom)"}
+        assert catalog.search("ZZZ") == []
+        print("✅ Поиск по подстроке работает через n-граммный индекс")
+
+        # Без изменения версии каталог не перечитывается
+        assert catalog.refresh() is False
+
+        # Загрузчик заменил данные и увеличил версию
+        conn.execute('DELETE FROM campaign_metrics WHERE "Название кампании" LIKE \'ФРК4%\'')
+        conn.execute('INSERT INTO campaign_metrics VALUES (\'СберБизнес Старт\', 1)')
+        build_campaign_index(conn)
+        bump_data_version(conn)
+
+        assert catalog.search("СБЕРБИЗНЕС") == ["СберБизнес Старт"]
+        assert catalog.search("ФРК4") == []
+        assert len(catalog) == 3
+        print("✅ Каталог обновляется по версии данных")
+
+        conn.close()
+        pool.close_all()
+
+    print("\n✅ Тестирование завершено!")
+
+
+if __name__ == "__main__":
+    test_data_version()
+    test_campaign_catalog()
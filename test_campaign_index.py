@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки справочника кампаний
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from campaign_index import (
+    build_campaign_index, ensure_campaign_index, normalize_campaign_name,
+    CAMPAIGN_DIM_TABLE
+)
+
+
+def _create_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE campaign_metrics (
+            "Дата" TEXT, "ID Кампании" INTEGER, "Название кампании" TEXT, "Площадка" TEXT,
+            "Показы" REAL, "Клики" REAL, "Расход до НДС" REAL, "Визиты" INTEGER
+        )
+    """)
+    rows = []
+    for day in range(1, 31):
+        rows.append((f"2025-05-{day:02d}", 1, "ФРК4 Бизнес-Фест, апрель-декабрь 2025", "Telegram Ads", 100, 2, 50.0, 1))
+        rows.append((f"2025-05-{day:02d}", 2, "Годовой performance. РКО 2025.", "Яндекс.Директ", 200, 4, 90.0, 3))
+    conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    return conn
+
+
+def test_normalize_campaign_name():
+    print("🧪 Тестирование нормализации названий")
+    assert normalize_campaign_name("ФРК-4 бизнес_фест") == "ФРК4БИЗНЕСФЕСТ"
+    assert normalize_campaign_name("Годовой performance") == "ГОДОВОЙPERFORMANCE"
+    print("✅ Кириллица приводится к верхнему регистру, разделители удаляются")
+
+
+def test_build_campaign_index():
+    print("🧪 Тестирование построения справочника")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "index.db")
+        conn = _create_db(db_path)
+
+        assert build_campaign_index(conn) == 2
+        names = conn.execute(
+            f"SELECT campaign_name FROM {CAMPAIGN_DIM_TABLE} WHERE normalized_name LIKE ?", ("%ФРК4БИЗНЕС%",)
+        ).fetchall()
+        assert names == [("ФРК4 Бизнес-Фест, апрель-декабрь 2025",)]
+
+        # Таблица фактов читается по индексу, а не полным сканированием
+        plan = conn.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT SUM("Показы") FROM campaign_metrics
+            WHERE "Название кампании" IN (SELECT campaign_name FROM campaign_dim WHERE normalized_name LIKE ?)
+        """, ("%ГОДОВОЙ%",)).fetchall()
+        details = " ".join(row[3] for row in plan)
+        assert "SEARCH campaign_metrics USING INDEX idx_campaign_metrics_name" in details
+        conn.close()
+
+        # Повторный вызов на готовой БД ничего не перестраивает
+        assert ensure_campaign_index(db_path) in ("campaign_name_fts", "campaign_dim")
+    print("✅ Справочник построен, поиск идет по индексу")
+
+
+def test_ensure_campaign_index():
+    print("🧪 Тестирование создания справочника в существующей БД")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "legacy.db")
+        _create_db(db_path).close()
+        lookup_table = ensure_campaign_index(db_path)
+        assert lookup_table in ("campaign_name_fts", "campaign_dim")
+
+        conn = sqlite3.connect(db_path)
+        count = conn.execute(f"SELECT COUNT(*) FROM {lookup_table}").fetchone()[0]
+        conn.close()
+        assert count == 2
+
+        assert ensure_campaign_index(os.path.join(tmp, "missing.db")) is None
+    print("✅ Справочник создается для старых БД")
+
+
+if __name__ == "__main__":
+    test_normalize_campaign_name()
+    test_build_campaign_index()
+    test_ensure_campaign_index()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки отчета по кампаниям одним SQL запросом
+"""
+
+import sqlite3
+
+from campaign_report import LEVEL_CAMPAIGN, LEVEL_PLATFORM, LEVEL_TOTAL, render_campaign_report_sql
+
+ROWS = [
+    # Название кампании, Площадка, Показы, Клики, Расход до НДС, Визиты
+    ("A", "VK", 1000, 10, 100.0, 8),
+    ("A", "VK", 1000, 30, 200.0, 12),
+    ("A", "Яндекс", 2000, 50, 400.0, 30),
+    ("B", "VK", 500, 5, 50.0, 2),
+    ("C", "VK", 800, 40, 300.0, 20),
+    ("D", "Яндекс", 0, 0, 0.0, 0),
+]
+
+
+def _create_db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE campaign_metrics ("Название кампании" TEXT, "Площадка" TEXT, '
+                 '"Показы" INTEGER, "Клики" INTEGER, "Расход до НДС" REAL, "Визиты" INTEGER)')
+    conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?, ?, ?, ?, ?)", ROWS)
+    return conn
+
+
+def _rows(conn, sql, params=()):
+    cursor = conn.execute(sql, params)
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+def test_levels_in_one_query():
+    print("🧪 Тестирование блоков кампаний, площадок и итога")
+    conn = _create_db()
+    rows = _rows(conn, render_campaign_report_sql("campaign_metrics"))
+
+    assert [row["level"] for row in rows] == [LEVEL_CAMPAIGN] * 5 + [LEVEL_PLATFORM] * 2 + [LEVEL_TOTAL]
+    campaigns = [(row["campaign_name"], row["platform"]) for row in rows if row["level"] == LEVEL_CAMPAIGN]
+    assert campaigns == [("A", "VK"), ("A", "Яндекс"), ("B", "VK"), ("C", "VK"), ("D", "Яндекс")]
+    assert rows[0]["impressions"] == 2000 and rows[0]["ctr"] == 2.0 and rows[0]["cpc"] == 7.5
+    # Пустая кампания: CTR и CPC не определены
+    assert rows[4]["ctr"] is None and rows[4]["cpc"] is None
+
+    platforms = {row["platform"]: row for row in rows if row["level"] == LEVEL_PLATFORM}
+    # CTR площадки - отношение сумм, а не среднее CTR кампаний
+    assert platforms["VK"]["clicks"] == 85 and platforms["VK"]["impressions"] == 3300
+    assert platforms["VK"]["ctr"] == round(85 * 100 / 3300, 2)
+    assert platforms["VK"]["cpc"] == round(650 / 85, 2)
+    assert platforms["VK"]["campaigns_count"] == 3
+
+    total = rows[-1]
+    assert (total["impressions"], total["clicks"], total["cost"], total["visits"]) == (5300, 135, 1050.0, 72)
+    assert total["ctr"] == round(135 * 100 / 5300, 2) and total["cpc"] == round(1050 / 135, 2)
+    assert total["campaigns_count"] == 4
+    conn.close()
+    print("✅ Все уровни отчета получены одним запросом")
+
+
+def test_limit_and_filter():
+    print("🧪 Тестирование ограничения и фильтра")
+    conn = _create_db()
+    sql = render_campaign_report_sql("campaign_metrics", ['"Площадка" = ?'], "cost DESC", limit=2)
+    rows = _rows(conn, sql, ["VK"])
+
+    campaigns = [row for row in rows if row["level"] == LEVEL_CAMPAIGN]
+    # Расход A и C на VK одинаковый - порядок по названию
+    assert [(row["campaign_name"], row["row_rank"]) for row in campaigns] == [("A", 1), ("C", 2)]
+    # Ограничение действует только на кампании, итог - по всем найденным строкам
+    assert [row["platform"] for row in rows if row["level"] == LEVEL_PLATFORM] == ["VK"]
+    assert rows[-1]["level"] == LEVEL_TOTAL and rows[-1]["impressions"] == 3300
+
+    # Без найденных строк нет и итоговой строки
+    assert _rows(conn, sql, ["Telegram"]) == []
+    conn.close()
+    print("✅ LIMIT ограничивает блок кампаний, итоги считаются по всем строкам")
+
+
+if __name__ == "__main__":
+    test_levels_in_one_query()
+    test_limit_and_filter()
+    print("\n✅ Тестирование завершено!")
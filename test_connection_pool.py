@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки пула соединений SQLite
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+
+from connection_pool import SQLiteConnectionPool
+
+
+def _create_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE campaign_metrics (\"Название кампании\" TEXT, \"Показы\" INTEGER)")
+    conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?)", [("ФРК4", 10), ("РКО", 20)])
+    conn.commit()
+    conn.close()
+
+
+def _query(pool):
+    with pool.connection() as conn:
+        conn.execute("SELECT COUNT(*) FROM campaign_metrics").fetchone()
+
+
+def test_connection_pool():
+    print("🧪 Тестирование пула соединений")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "pool.db")
+        _create_db(db_path)
+        pool = SQLiteConnectionPool(db_path)
+
+        # Возвращенное соединение выдается снова
+        with pool.connection() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("SELECT SUM(\"Показы\") FROM campaign_metrics").fetchone()[0] == 30
+        with pool.connection() as again:
+            assert again is conn
+        print("✅ Соединение переиспользуется, WAL включен")
+
+        # Соединения только для чтения
+        try:
+            with pool.connection() as c:
+                c.execute("DELETE FROM campaign_metrics")
+            raise AssertionError("соединение пула должно быть только для чтения")
+        except sqlite3.OperationalError:
+            pass
+
+        # Одновременные запросы получают разные соединения
+        seen = []
+        barrier = threading.Barrier(4)
+
+        def worker():
+            with pool.connection() as c:
+                c.execute("SELECT COUNT(*) FROM campaign_metrics").fetchone()
+                seen.append(id(c))
+                barrier.wait()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(set(seen)) == 4
+        assert len(pool) == 4
+        print(f"✅ Потоков: {len(threads)}, соединений в пуле: {len(pool)}")
+
+        pool.close_all()
+        assert len(pool) == 0
+        with pool.connection() as c:
+            assert c is not conn
+            assert c.execute("SELECT COUNT(*) FROM campaign_metrics").fetchone()[0] == 2
+
+        pool.close_all()
+
+
+def test_bounded_pool():
+    print("🧪 Тестирование ограничения числа соединений")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "pool.db")
+        _create_db(db_path)
+        pool = SQLiteConnectionPool(db_path, max_connections=2, timeout=0.2)
+
+        # Каждый вопрос Streamlit приходит в новом потоке - соединения не копятся
+        for _ in range(20):
+            t = threading.Thread(target=_query, args=(pool,))
+            t.start()
+            t.join()
+        assert len(pool) == 1
+
+        # Все соединения заняты - ожидание ограничено timeout
+        with pool.connection(), pool.connection():
+            assert len(pool) == 2
+            try:
+                with pool.connection():
+                    pass
+                raise AssertionError("пул должен быть ограничен max_connections")
+            except sqlite3.OperationalError:
+                pass
+        with pool.connection():
+            pass
+        assert len(pool) == 2
+
+        pool.close_all()
+    print("✅ Соединений не больше max_connections, потоки их не удерживают")
+
+
+def test_abandoned_rows_return_connection():
+    print("🧪 Тестирование возврата соединения при прерванной выгрузке")
+    from ai_agent import MarketingAnalyticsAgent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "agent.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE campaign_metrics (
+                "Дата" TEXT, "ID Кампании" INTEGER, "Название кампании" TEXT, "Площадка" TEXT,
+                "Показы" REAL, "Клики" REAL, "Расход до НДС" REAL, "Визиты" INTEGER
+            )
+        """)
+        conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            (f"2025-05-{day:02d}", 1, "ФРК4", "Telegram Ads", 100, 2, 50.0, 1) for day in range(1, 31)
+        ])
+        conn.commit()
+        conn.close()
+
+        agent = MarketingAnalyticsAgent(db_path)
+        agent.pool.close_all()
+        agent.pool = agent.rollups.pool = SQLiteConnectionPool(db_path, max_connections=1, timeout=0.2)
+        analysis = {"summary": {"campaigns": [{"campaign_name": "ФРК4"}]}}
+
+        # Выгрузка упала, прочитав одну строку; итератор остался жив
+        abandoned = []
+        try:
+            with agent._report_detail_rows(analysis) as rows:
+                abandoned.append(rows)
+                next(rows)
+                raise ValueError("ошибка записи листа")
+        except ValueError:
+            pass
+        # Единственное соединение пула свободно, хотя итератор не дочитан и не собран
+        with agent.pool.connection() as c:
+            assert c.execute("SELECT COUNT(*) FROM campaign_metrics").fetchone()[0] == 30
+
+        # Дочитанные пачками строки совпадают с запросом целиком
+        with agent._report_detail_rows(analysis) as rows:
+            assert len(list(rows)) == 30
+        agent.pool.close_all()
+    print("✅ Соединение возвращается в пул, даже если строки не дочитаны")
+
+
+if __name__ == "__main__":
+    test_connection_pool()
+    test_bounded_pool()
+    test_abandoned_rows_return_connection()
+    print("\n✅ Тестирование завершено!")
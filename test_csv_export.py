@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки выгрузки отчета в CSV через csv.writer
+"""
+
+import csv
+import io
+
+from csv_export import CSV_ENCODING, export_csv, iter_csv, write_csv
+from excel_export import CAMPAIGN_COLUMNS, CAMPAIGN_SUMMARY_LABELS, Heading, Sheet, records_sheet, summary_rows
+
+
+def _sheets(detail_count=3):
+    return [
+        Sheet("Общая статистика", None, summary_rows("Отчет по запросу: РКО", {
+            "campaigns_count": 2, "total_impressions": 1234567, "total_cost": 98765.4, "avg_ctr": float("nan"),
+        }, CAMPAIGN_SUMMARY_LABELS)),
+        records_sheet("Детальная статистика", CAMPAIGN_COLUMNS[:4], [
+            {"campaign_name": 'Кампания "Весна", РКО', "platform": "VK", "impressions": 1234567, "clicks": 1000},
+        ]),
+        Sheet("Детализация по дням", ["Дата", "Показы"], ((f"2025-05-{i % 28 + 1:02d}", i) for i in range(detail_count))),
+        Sheet("Инсайты и рекомендации", None, iter([Heading("Ключевые инсайты"), ("• Высокий CTR",)])),
+    ]
+
+
+def test_csv_sections():
+    print("🧪 Тестирование секций CSV")
+    data = export_csv(_sheets())
+    assert data.startswith(b"\xef\xbb\xbf")
+    rows = list(csv.reader(io.StringIO(data.decode(CSV_ENCODING))))
+
+    assert rows[0] == ["ОБЩАЯ СТАТИСТИКА"] and rows[1] == ["Отчет по запросу: РКО"]
+    # Числа без разделителей разрядов: ячейка остается числом
+    assert ["Общие показы", "1234567"] in rows
+    assert ["Общий расход (₽)", "98765.4"] in rows
+    # NaN не попадает в файл
+    assert ["Средний CTR (%)", ""] in rows
+
+    campaigns = rows.index(["ДЕТАЛЬНАЯ СТАТИСТИКА"])
+    assert rows[campaigns + 1] == ["Кампания", "Площадка", "Показы", "Клики"]
+    # Кавычки и запятые в названии экранируются
+    assert rows[campaigns + 2] == ['Кампания "Весна", РКО', "VK", "1234567", "1000"]
+
+    detail = rows.index(["ДЕТАЛИЗАЦИЯ ПО ДНЯМ"])
+    assert rows[detail + 1:detail + 5] == [["Дата", "Показы"], ["2025-05-01", "0"], ["2025-05-02", "1"], ["2025-05-03", "2"]]
+    assert rows[-3:] == [["Ключевые инсайты"], ["• Высокий CTR"], []]
+    print("✅ Секции записаны csv.writer с типизированными значениями")
+
+
+def test_streaming_chunks():
+    print("🧪 Тестирование потоковой выгрузки")
+    chunks = list(iter_csv(_sheets(detail_count=20000), chunk_chars=4096))
+    # Граница куска - пачка строк WRITE_BATCH_ROWS
+    assert len(chunks) >= 4
+    # BOM только в первом куске
+    assert chunks[0].startswith(b"\xef\xbb\xbf") and not any(chunk.startswith(b"\xef\xbb\xbf") for chunk in chunks[1:])
+    assert b"".join(chunks) == export_csv(_sheets(detail_count=20000))
+
+    target = io.BytesIO()
+    assert write_csv(_sheets(detail_count=20000), target) == len(target.getvalue())
+    rows = target.getvalue().decode(CSV_ENCODING).splitlines()
+    assert "2025-05-08,19999" in rows
+
+    # Пустой отчет - только BOM
+    assert export_csv([]) == b"\xef\xbb\xbf"
+    print("✅ Файл отдается кусками, результат совпадает с выгрузкой целиком")
+
+
+if __name__ == "__main__":
+    test_csv_sections()
+    test_streaming_chunks()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша эмбеддингов запросов (LRU + memmap)
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache, query_key
+
+
+def _vector(seed, dim=8):
+    return np.random.default_rng(seed).random(dim).astype(np.float32)
+
+
+def test_memory_cache():
+    print("🧪 Тестирование кэша в памяти")
+    cache = EmbeddingCache(None, dim=8, memory_items=2)
+    assert cache.get("Что такое CTR?") is None
+    cache.put("Что такое CTR?", _vector(1))
+    # Регистр, пробелы и знаки в конце не меняют ключ
+    assert np.array_equal(cache.get("  что такое   ctr"), _vector(1))
+    cache.put("b", _vector(2))
+    cache.put("c", _vector(3))
+    assert cache.get("что такое ctr") is None
+    assert cache.stats() == {"memory_size": 2, "disk_size": 0, "memory_hits": 1, "disk_hits": 0, "misses": 2}
+    # Другая модель - другой ключ
+    assert query_key("ctr", "model-a") != query_key("ctr", "model-b")
+    print("✅ LRU вытесняет старые запросы")
+
+
+def test_persistent_cache():
+    print("🧪 Тестирование постоянного кэша")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "queries.npy")
+        cache = EmbeddingCache(path, dim=8, capacity=3, memory_items=1, namespace="m")
+        for i, query in enumerate(["a", "b", "c"]):
+            cache.put(query, _vector(i))
+        # "a" читается с диска и становится самым свежим, вытесняется "b"
+        assert np.array_equal(cache.get("a"), _vector(0))
+        cache.put("d", _vector(3))
+        assert len(cache) == 3
+        del cache
+
+        # После перезапуска векторы читаются из файла
+        reopened = EmbeddingCache(path, dim=8, capacity=3, memory_items=1, namespace="m")
+        assert reopened.get("b") is None
+        for i, query in [(0, "a"), (2, "c"), (3, "d")]:
+            assert np.array_equal(reopened.get(query), _vector(i))
+        assert reopened.stats()["disk_hits"] == 3
+        # Ключи другой модели не находятся
+        assert EmbeddingCache(path, dim=8, capacity=3, namespace="other").get("a") is None
+
+        # Другая размерность - файл создается заново
+        resized = EmbeddingCache(path, dim=4, capacity=3, namespace="m")
+        assert len(resized) == 0 and resized.get("a") is None
+    print("✅ Векторы переживают перезапуск, несовместимый файл пересоздается")
+
+
+if __name__ == "__main__":
+    test_memory_cache()
+    test_persistent_cache()
+    print("\n✅ Тестирование завершено!")
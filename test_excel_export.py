@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки потоковой выгрузки отчета в Excel
+"""
+
+import sqlite3
+
+from campaign_report import render_campaign_day_sql
+from excel_export import (
+    CAMPAIGN_COLUMNS, CAMPAIGN_DAY_HEADER, CAMPAIGN_SUMMARY_LABELS, OPENPYXL_AVAILABLE, Heading, Sheet,
+    _column_widths, export_to_spool, records_sheet, summary_rows
+)
+
+
+def test_sheet_rows():
+    print("🧪 Тестирование строк листов")
+    sheet = records_sheet("Кампании", CAMPAIGN_COLUMNS[:3], [
+        {"campaign_name": "РКО", "platform": "VK", "impressions": 100, "ctr": 1.5},
+        {"campaign_name": "ФРК4 Бизнес-Фест", "impressions": 2000},
+    ])
+    assert sheet.header == ["Кампания", "Площадка", "Показы"]
+    assert list(sheet.rows) == [("РКО", "VK", 100), ("ФРК4 Бизнес-Фест", None, 2000)]
+
+    rows = list(summary_rows("Отчет", {"total_clicks": 5}, CAMPAIGN_SUMMARY_LABELS[:3]))
+    assert rows[0] == "Отчет" and isinstance(rows[0], Heading)
+    assert rows[2:] == [("Всего кампаний", 0), ("Общие показы", 0), ("Общие клики", 5)]
+    assert list(summary_rows("Отчет", {"total_clicks": 5}, CAMPAIGN_SUMMARY_LABELS[:3], defaults=False))[2:] == [
+        ("Общие клики", 5)
+    ]
+
+    # Ширина по заголовку и образцу строк, строки-заголовки разделов не учитываются
+    assert _column_widths(["Дата", "Кампания"], [Heading("x" * 80), ("2025-05-01", "РКО")]) == [12, 10]
+    print("✅ Записи анализа превращаются в строки листов")
+
+
+def test_campaign_day_sql():
+    print("🧪 Тестирование детализации кампаний по дням")
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE campaign_metrics ("Дата" TEXT, "Название кампании" TEXT, "Площадка" TEXT, '
+                 '"Показы" INTEGER, "Клики" INTEGER, "Расход до НДС" REAL, "Визиты" INTEGER)')
+    conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        ("2025-05-02", "A", "VK", 100, 10, 50.0, 5),
+        ("2025-05-01", "A", "VK", 100, 5, 50.0, 4),
+        ("2025-05-01", "A", "Яндекс", 300, 15, 100.0, 6),
+        ("2025-05-01", "B", "VK", 100, 0, 0.0, 0),
+        ("2025-05-01", "C", "VK", 100, 1, 1.0, 1),
+    ])
+    rows = conn.execute(render_campaign_day_sql("campaign_metrics", 2), ["A", "B"]).fetchall()
+    assert rows == [
+        ("2025-05-01", "A", 400, 20, 150.0, 10, 5.0, 7.5),
+        ("2025-05-01", "B", 100, 0, 0.0, 0, 0.0, None),
+        ("2025-05-02", "A", 100, 10, 50.0, 5, 10.0, 5.0),
+    ]
+    assert len(rows[0]) == len(CAMPAIGN_DAY_HEADER)
+    conn.close()
+    print("✅ Строки детализации соответствуют заголовку листа")
+
+
+def test_streamed_workbook():
+    print("🧪 Тестирование записи книги в режиме write_only")
+    if not OPENPYXL_AVAILABLE:
+        print("⚠️ openpyxl не установлен, тест пропущен")
+        return
+    from openpyxl import load_workbook
+
+    detail = ((f"2025-05-{i % 28 + 1:02d}", f"Кампания {i % 7}", i, i // 10, float("nan")) for i in range(5000))
+    sheets = [
+        Sheet("Общая статистика", None, summary_rows("Отчет по запросу: РКО", {"total_clicks": 12},
+                                                     CAMPAIGN_SUMMARY_LABELS)),
+        Sheet("Детализация по дням", CAMPAIGN_DAY_HEADER[:5], detail),
+    ]
+    # Маленький порог: книга переносится на диск
+    with export_to_spool(sheets, max_size=1024) as spool:
+        workbook = load_workbook(spool, read_only=True)
+        assert workbook.sheetnames == ["Общая статистика", "Детализация по дням"]
+
+        summary = list(workbook["Общая статистика"].values)
+        assert summary[0][0] == "Отчет по запросу: РКО"
+        assert ("Общие клики", 12) in [row[:2] for row in summary]
+
+        rows = list(workbook["Детализация по дням"].values)
+        assert list(rows[0]) == CAMPAIGN_DAY_HEADER[:5]
+        assert len(rows) == 5001
+        # NaN записан пустой ячейкой (read_only отбрасывает пустые ячейки в конце строки)
+        assert rows[5000][:4] == ("2025-05-16", "Кампания 1", 4999, 499) and not any(rows[5000][4:])
+        workbook.close()
+    print("✅ Листы записаны потоком, книга читается openpyxl")
+
+
+if __name__ == "__main__":
+    test_sheet_rows()
+    test_campaign_day_sql()
+    test_streamed_workbook()
+    print("\n✅ Тестирование завершено!")
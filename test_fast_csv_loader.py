@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки потоковой загрузки выгрузки воронки
+"""
+
+import os
+import sqlite3
+import tempfile
+import tracemalloc
+
+from fast_csv_loader import fast_load_csv_to_db, iter_funnel_rows, parse_csv_line, parse_export_block
+
+SAMPLE_CSV = "head_funnel_sample.csv"
+
+
+def _write_funnel_csv(path, rows_count):
+    """Синтетическая выгрузка в формате head_funnel_sample.csv"""
+    with open(SAMPLE_CSV, encoding="utf-8") as f:
+        header = f.readline()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(header)
+        for i in range(rows_count):
+            f.write(
+                f'"2025-05-{i % 28 + 1:02d},Ad traffic,""rko_{i % 50}"",yandex,cpc,'
+                f'""content_{i}"",term,{i},1.0,0.0,1.0,{i % 2},0,0,{i % 3 == 0:d},0";;;;\n'
+            )
+
+
+def test_parse_export_line():
+    print("🧪 Тестирование разбора строки выгрузки")
+    line = '"2025-05-01,Ad traffic,""06133744"",yandex,cpc,""14313890_2xtno4"",rle1hmy,1,0.0,0.0,0.0,0,0,0,0,0";;;;\n'
+    values = parse_csv_line(line)
+    assert len(values) == 16
+    assert values[:4] == ["2025-05-01", "Ad traffic", "06133744", "yandex"]
+
+    with open(SAMPLE_CSV, encoding="utf-8") as f:
+        header = parse_csv_line(f.readline())
+    assert header[0] == "date" and header[-1] == "quality"
+    print("✅ Внешние кавычки, \"\" и хвост ;;;; разбираются")
+
+
+def test_block_parser_matches_line_parser():
+    print("🧪 Тестирование пачечного разбора")
+    with open(SAMPLE_CSV, encoding="utf-8-sig") as f:
+        lines = f.readlines()
+    # Последняя строка файла обрезана на середине поля
+    expected = [parse_csv_line(line) for line in lines[:-1]]
+    assert parse_export_block(lines[:-1]) == expected
+
+    # Кавычка и запятая внутри значения
+    line = '"2025-05-02,Ad traffic,""a,""""b"""""",vk";;;;\n'
+    assert parse_export_block([line]) == [["2025-05-02", "Ad traffic", 'a,"b"', "vk"]]
+    assert parse_export_block(["\n", ";;;;\n"]) == []
+    print("✅ Пачечный разбор совпадает с построчным")
+
+
+def test_iter_funnel_rows():
+    print("🧪 Тестирование приведения типов")
+    rows = list(iter_funnel_rows(SAMPLE_CSV))
+    assert len(rows) == 9
+    first = rows[0]
+    assert first[:3] == ("2025-05-01", "Ad traffic", "06133744")
+    assert first[7] == "1"
+    assert first[8] == 0.0 and isinstance(first[8], float)
+    assert first[11] == 0 and isinstance(first[11], int)
+    print("✅ Строки приводятся к типам колонок funnel_data")
+
+
+def test_streaming_load():
+    print("🧪 Тестирование потоковой загрузки")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "funnel.csv")
+        db_path = os.path.join(tmp, "funnel.db")
+        _write_funnel_csv(csv_path, 20000)
+
+        tracemalloc.start()
+        total = fast_load_csv_to_db(csv_path, db_path, chunk_size=1000)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert total == 20000
+        # В памяти одна пачка строк, а не весь файл
+        assert peak < 4 * 1024 * 1024, f"пиковая память {peak} байт"
+
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*), SUM(account_num), SUM(quality_flag) FROM funnel_data").fetchone() == (20000, 10000, 6667)
+        assert conn.execute("SELECT typeof(submits), typeof(account_num) FROM funnel_data LIMIT 1").fetchone() == ("real", "integer")
+        conn.close()
+
+        # Повторная загрузка заменяет данные, а не дописывает
+        assert fast_load_csv_to_db(csv_path, db_path, chunk_size=5000) == 20000
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*) FROM funnel_data").fetchone()[0] == 20000
+        conn.close()
+        assert not os.path.exists("cleaned_funnel_sample.csv")
+    print(f"✅ 20000 строк загружены, пиковая память {peak / 1024:.0f} КБ")
+
+
+def test_failed_load_keeps_data():
+    print("🧪 Тестирование неудачной загрузки поверх загруженных данных")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "funnel.csv")
+        broken_path = os.path.join(tmp, "broken.csv")
+        db_path = os.path.join(tmp, "funnel.db")
+        _write_funnel_csv(csv_path, 500)
+        assert fast_load_csv_to_db(csv_path, db_path) == 500
+
+        # Файла нет: ошибка при открытии, уже после пересоздания таблиц
+        try:
+            fast_load_csv_to_db(os.path.join(tmp, "missing.csv"), db_path)
+            assert False, "ожидался FileNotFoundError"
+        except FileNotFoundError:
+            pass
+
+        # Ошибка в середине файла, после записи нескольких пачек
+        _write_funnel_csv(broken_path, 5000)
+        with open(broken_path, "ab") as f:
+            f.write(b"\xff\xfe broken\n")
+        try:
+            fast_load_csv_to_db(broken_path, db_path, chunk_size=1000)
+            assert False, "ожидался UnicodeDecodeError"
+        except UnicodeDecodeError:
+            pass
+
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*) FROM funnel_data").fetchone()[0] == 500
+        assert conn.execute("SELECT COUNT(*) FROM dim_utm_campaign").fetchone()[0] == 50
+        conn.close()
+    print("✅ При ошибке загрузки в БД остаются прежние данные")
+
+
+if __name__ == "__main__":
+    test_parse_export_line()
+    test_block_parser_matches_line_parser()
+    test_iter_funnel_rows()
+    test_streaming_load()
+    test_failed_load_keeps_data()
+    print("\n✅ Тестирование завершено!")
@@ -6,6 +6,7 @@
 import sqlite3
 import pandas as pd
 from ai_agent import MarketingAnalyticsAgent
+from funnel_schema import FUNNEL_WIDE_VIEW
 
 def test_funnel_queries():
     """Тестируем различные запросы по воронке и UTM"""
@@ -42,22 +43,22 @@ def test_funnel_queries():
     print(f"Всего записей в funnel_data: {total_rows}")
     
     # Проверяем примеры данных
-    cursor.execute('SELECT * FROM funnel_data LIMIT 3')
+    cursor.execute(f'SELECT * FROM {FUNNEL_WIDE_VIEW} LIMIT 3')
     sample_data = cursor.fetchall()
     print("Примеры данных:")
     for i, row in enumerate(sample_data, 1):
         print(f"  {i}. {row}")
     
     # Проверяем уникальные значения UTM
-    cursor.execute('SELECT DISTINCT utm_campaign FROM funnel_data WHERE utm_campaign IS NOT NULL LIMIT 5')
+    cursor.execute(f'SELECT DISTINCT utm_campaign FROM {FUNNEL_WIDE_VIEW} WHERE utm_campaign IS NOT NULL LIMIT 5')
     campaigns = cursor.fetchall()
     print(f"Примеры utm_campaign: {[c[0] for c in campaigns]}")
     
-    cursor.execute('SELECT DISTINCT utm_source FROM funnel_data WHERE utm_source IS NOT NULL LIMIT 5')
+    cursor.execute(f'SELECT DISTINCT utm_source FROM {FUNNEL_WIDE_VIEW} WHERE utm_source IS NOT NULL LIMIT 5')
     sources = cursor.fetchall()
     print(f"Примеры utm_source: {[s[0] for s in sources]}")
     
-    cursor.execute('SELECT DISTINCT utm_medium FROM funnel_data WHERE utm_medium IS NOT NULL LIMIT 5')
+    cursor.execute(f'SELECT DISTINCT utm_medium FROM {FUNNEL_WIDE_VIEW} WHERE utm_medium IS NOT NULL LIMIT 5')
     mediums = cursor.fetchall()
     print(f"Примеры utm_medium: {[m[0] for m in mediums]}")
     
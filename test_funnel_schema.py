@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки схемы "звезда" для funnel_data
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+
+from fast_csv_loader import fast_load_csv_to_db
+from funnel_schema import (
+    FUNNEL_TEMPLATES, FUNNEL_WIDE_VIEW, LAYOUT_STAR, LAYOUT_WIDE, append_funnel_rows, build_funnel_star,
+    create_wide_view, funnel_layout, render_funnel_sql
+)
+
+WIDE_COLUMNS = [
+    "date", "traffic_source", "utm_campaign", "utm_source", "utm_medium", "utm_content", "utm_term",
+    "visit_id", "submits", "res", "subs_all", "account_num", "created_flag", "call_answered_flag",
+    "quality_flag", "quality",
+]
+
+
+def _create_wide_db(path, rows_count=5000):
+    """funnel_data в том виде, в каком ее пишет to_sql: все значения текстом"""
+    random.seed(7)
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE funnel_data ({', '.join(f'{c} TEXT' for c in WIDE_COLUMNS)})")
+    rows = []
+    for i in range(rows_count):
+        campaign = f"rko_{i % 40}"
+        rows.append((
+            f"2025-05-{i % 30 + 1:02d}", "Ad traffic", campaign, random.choice(["yandex", "vk", "telegram", None]),
+            random.choice(["cpc", "cpm"]),
+            f"|cid|{i % 40}|gid|5471099176|ad|16331752758_16331752758|src|none_search|geo|{i % 7}|",
+            # submits различаются по кампаниям, чтобы топ-10 был однозначным
+            f"сбербанк для ип {i % 5}", str(i // 2), str(float(i % 40)), "0.0", "0.0",
+            str(i % 2), str(i % 4 == 0), "0", str(int(i % 6 == 0)), "0",
+        ))
+    conn.executemany(f"INSERT INTO funnel_data VALUES ({', '.join('?' * len(WIDE_COLUMNS))})", rows)
+    conn.commit()
+    return conn
+
+
+def _page_count(conn):
+    conn.execute("VACUUM")
+    return conn.execute("PRAGMA page_count").fetchone()[0]
+
+
+def test_templates_match_on_both_layouts():
+    print("🧪 Тестирование шаблонов воронки на обеих схемах")
+    with tempfile.TemporaryDirectory() as tmp:
+        wide = _create_wide_db(os.path.join(tmp, "wide.db"))
+        star = _create_wide_db(os.path.join(tmp, "star.db"))
+        assert funnel_layout(wide) == LAYOUT_WIDE
+
+        assert build_funnel_star(star) == 5000
+        assert funnel_layout(star) == LAYOUT_STAR
+        # Повторный вызов ничего не делает
+        assert build_funnel_star(star) == 0
+
+        for kind in FUNNEL_TEMPLATES:
+            params = ["rko_3"] if FUNNEL_TEMPLATES[kind].get("campaign_filter") else []
+            wide_rows = wide.execute(render_funnel_sql(kind, LAYOUT_WIDE), params).fetchall()
+            star_rows = star.execute(render_funnel_sql(kind, LAYOUT_STAR), params).fetchall()
+            assert wide_rows, kind
+            assert sorted(star_rows, key=repr) == sorted(wide_rows, key=repr), kind
+
+        # Группировка идет по целочисленному ключу
+        sources_sql = render_funnel_sql("sources", LAYOUT_STAR)
+        assert "GROUP BY utm_source_id" in sources_sql
+        assert star.execute("SELECT typeof(utm_source_id), typeof(visit_id), typeof(quality_flag) "
+                            "FROM funnel_data WHERE utm_source_id IS NOT NULL LIMIT 1").fetchone() == \
+            ("integer", "integer", "integer")
+
+        wide_pages, star_pages = _page_count(wide), _page_count(star)
+        assert star_pages * 2 < wide_pages, (wide_pages, star_pages)
+        wide.close()
+        star.close()
+    print(f"✅ Результаты совпадают, размер воронки: {wide_pages} -> {star_pages} страниц")
+
+
+def test_text_visit_ids_survive_conversion():
+    print("🧪 Тестирование нечисловых visit_id")
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE funnel_data (date TEXT, utm_campaign TEXT, visit_id TEXT, submits TEXT)")
+    conn.executemany("INSERT INTO funnel_data VALUES (?, ?, ?, ?)", [
+        ("2025-01-01", "rko", "visit_1", "1.0"), ("2025-01-01", "rko", "visit_2", "2"), ("2025-01-02", "rko", "7", None),
+    ])
+    assert build_funnel_star(conn) == 3
+    assert conn.execute("SELECT COUNT(DISTINCT visit_id), SUM(submits) FROM funnel_data").fetchone() == (3, 3.0)
+    assert conn.execute("SELECT typeof(visit_id) FROM funnel_data WHERE date = '2025-01-02'").fetchone()[0] == "integer"
+    conn.close()
+    print("✅ Числовые значения приводятся к типу колонки, остальные сохраняются")
+
+
+def test_fast_loader_writes_star():
+    print("🧪 Тестирование загрузки выгрузки сразу в схему \"звезда\"")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "funnel.db")
+        assert fast_load_csv_to_db("head_funnel_sample.csv", db_path) == 9
+
+        conn = sqlite3.connect(db_path)
+        assert funnel_layout(conn) == LAYOUT_STAR
+        assert conn.execute("SELECT COUNT(*) FROM dim_utm_source").fetchone()[0] == 2
+        rows = conn.execute(render_funnel_sql("sources", LAYOUT_STAR)).fetchall()
+        assert [row[0] for row in rows] == ["yandex", "vsp"]
+        conn.close()
+    print("✅ Измерения закодированы при загрузке")
+
+
+def test_wide_view_and_append():
+    print("🧪 Тестирование представления funnel_data_wide и дописывания строк")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _create_wide_db(os.path.join(tmp, "funnel.db"), rows_count=200)
+        create_wide_view(conn)
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({FUNNEL_WIDE_VIEW})")]
+        assert columns == WIDE_COLUMNS
+        query = f"SELECT utm_campaign, utm_source, COUNT(*) FROM {FUNNEL_WIDE_VIEW} GROUP BY 1, 2"
+        before = sorted(conn.execute(query).fetchall(), key=repr)
+
+        # После перевода в "звезду" представление отдает те же текстовые значения
+        build_funnel_star(conn)
+        create_wide_view(conn)
+        assert [row[1] for row in conn.execute(f"PRAGMA table_info({FUNNEL_WIDE_VIEW})")] == columns
+        assert sorted(conn.execute(query).fetchall(), key=repr) == before
+
+        # Строки в широком виде дописываются через справочники, лишние колонки отбрасываются
+        sources = conn.execute("SELECT COUNT(*) FROM dim_utm_source").fetchone()[0]
+        rows = [
+            {"date": "2025-06-01", "utm_campaign": "rko_spring2024", "utm_source": "yandex",
+             "visit_id": f"visit_{i}", "submits": 1, "step_name": "Этап воронки"}
+            for i in range(5)
+        ]
+        assert append_funnel_rows(conn, rows) == 5
+        assert conn.execute(
+            f"SELECT COUNT(*), SUM(submits) FROM {FUNNEL_WIDE_VIEW} "
+            f"WHERE utm_campaign = 'rko_spring2024' AND utm_source = 'yandex'"
+        ).fetchone() == (5, 5.0)
+        assert conn.execute("SELECT COUNT(*) FROM dim_utm_source").fetchone()[0] == sources
+        rows = conn.execute(render_funnel_sql("campaign_funnel", LAYOUT_STAR), ["rko_spring2024"]).fetchall()
+        assert rows[0][1] == 5
+        conn.close()
+    print("✅ Скрипты с текстовыми UTM читают и пишут воронку в схеме \"звезда\"")
+
+
+if __name__ == "__main__":
+    test_templates_match_on_both_layouts()
+    test_text_visit_ids_survive_conversion()
+    test_fast_loader_writes_star()
+    test_wide_view_and_append()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки нечеткого поиска кампаний
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from campaign_catalog import CampaignCatalog
+from campaign_index import build_campaign_index
+from connection_pool import SQLiteConnectionPool
+from data_version import bump_data_version
+from fuzzy_match import batch_bounded_levenshtein, bounded_levenshtein, encode_strings
+
+
+def _create_catalog(path, names):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE campaign_metrics ("Название кампании" TEXT, "Показы" REAL)')
+    conn.executemany("INSERT INTO campaign_metrics VALUES (?, 1)", [(name,) for name in names])
+    build_campaign_index(conn)
+    bump_data_version(conn)
+    conn.close()
+    pool = SQLiteConnectionPool(path)
+    return pool, CampaignCatalog(pool)
+
+
+def test_bounded_levenshtein():
+    print("🧪 Тестирование расстояния Левенштейна")
+    assert bounded_levenshtein("ГОДОВЙ", "ГОДОВОЙ", 2) == 1
+    assert bounded_levenshtein("СБЕРБИЗНЕСС", "СБЕРБИЗНЕС", 1) == 1
+    assert bounded_levenshtein("KITTEN", "SITTING", 3) == 3
+    # При превышении порога возвращается max_distance + 1
+    assert bounded_levenshtein("KITTEN", "SITTING", 2) == 3
+    assert bounded_levenshtein("РКО", "PERFORMANCE", 2) == 3
+    print("✅ Расстояние считается с ранним выходом")
+
+
+def test_batch_bounded_levenshtein():
+    print("🧪 Тестирование пакетного расчета расстояний")
+    rnd = random.Random(1)
+    alphabet = "АБВГДЕ"
+    words = ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 9))) for _ in range(300)]
+    codes, lengths = encode_strings(words)
+    for term in ["АБВГ", "ГДЕАБВ", "ББ"]:
+        limits = [rnd.randint(0, 3) for _ in words]
+        distances = batch_bounded_levenshtein(term, codes, lengths, np.array(limits))
+        expected = [bounded_levenshtein(term, word, limit) for word, limit in zip(words, limits)]
+        assert distances.tolist() == expected
+    print("✅ Пакетный расчет совпадает с построчным")
+
+
+def test_fuzzy_search():
+    print("🧪 Тестирование нечеткого поиска по каталогу")
+    with tempfile.TemporaryDirectory() as tmp:
+        pool, catalog = _create_catalog(os.path.join(tmp, "fuzzy.db"), [
+            "ФРК4 Бизнес-Фест, апрель-декабрь 2025",
+            "Годовой performance. РКО 2025.",
+            "Годовой performance. Сбер Бизнес",
+            "Кафе O'Key",
+        ])
+
+        # Опечатки находятся без словаря синонимов
+        names = [name for name, _ in catalog.fuzzy_search("годовй")]
+        assert set(names) == {"Годовой performance. РКО 2025.", "Годовой performance. Сбер Бизнес"}
+        assert catalog.fuzzy_search("perfomance")[0][1] >= 80
+        assert catalog.fuzzy_search("бизнесфст")[0][0] == "ФРК4 Бизнес-Фест, апрель-декабрь 2025"
+
+        # Точное вхождение получает максимальную оценку и идет первым
+        results = catalog.fuzzy_search("РКО 2025")
+        assert results[0] == ("Годовой performance. РКО 2025.", 100.0)
+
+        # Порог действительно отсекает слабые совпадения
+        assert catalog.fuzzy_search("годовй", threshold=95) == []
+        assert catalog.fuzzy_search("покажи") == []
+        assert len(catalog.fuzzy_search("годовой", limit=1)) == 1
+        pool.close_all()
+    print("✅ Порог учитывается, результаты ранжированы по оценке")
+
+
+def test_fuzzy_search_speed():
+    print("🧪 Тестирование скорости на большом каталоге")
+    rnd = random.Random(0)
+    words = ["Годовой", "performance", "РКО", "Бизнес", "Фест", "Сбер", "Кредиты", "Карты",
+             "ОТР", "eCom", "Telegram", "Весна", "Осень", "Промо", "Регионы", "Москва"]
+    names = {" ".join(rnd.sample(words, 4)) + f" {number}" for number in range(30000)}
+    with tempfile.TemporaryDirectory() as tmp:
+        pool, catalog = _create_catalog(os.path.join(tmp, "large.db"), sorted(names))
+        catalog.refresh()
+        catalog.fuzzy_search("прромо")
+
+        started = time.perf_counter()
+        for term in ["прромо", "кредиты", "telegarm", "регоины"]:
+            catalog.fuzzy_search(term, limit=20)
+        elapsed = (time.perf_counter() - started) / 4 * 1000
+        pool.close_all()
+    print(f"✅ {len(names)} названий, {elapsed:.1f} мс на термин")
+
+
+if __name__ == "__main__":
+    test_bounded_levenshtein()
+    test_batch_bounded_levenshtein()
+    test_fuzzy_search()
+    test_fuzzy_search_speed()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки инкрементальной загрузки campaign_metrics
+"""
+
+import csv
+import os
+import sqlite3
+import tempfile
+
+from campaign_index import build_campaign_index, CAMPAIGN_DIM_TABLE
+from data_version import bump_data_version, get_data_version
+from incremental_loader import append_campaign_metrics, get_watermark
+from rollups import ROLLUPS, build_rollups, rollups_current
+from visit_sketches import build_visit_sketches, sketches_current
+
+SAMPLE_CSV = "rko_econometric_sample.csv"
+
+ROLLUP_TOTALS_SQL = """
+    SELECT SUM("Показы"), SUM("Клики"), ROUND(SUM("Расход до НДС"), 2), SUM("Визиты"), COUNT(*) FROM {table}
+"""
+
+
+def _write_part(path, max_date):
+    """Часть выгрузки с датами не позже max_date"""
+    with open(SAMPLE_CSV, encoding="utf-8", newline="") as src, open(path, "w", encoding="utf-8", newline="") as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst)
+        writer.writerow(next(reader))
+        rows = [row for row in reader if row[0] <= max_date]
+        writer.writerows(rows)
+    return len(rows)
+
+
+def _rollup_totals(conn):
+    return {table: conn.execute(ROLLUP_TOTALS_SQL.format(table=table)).fetchone() for table in ROLLUPS}
+
+
+def test_incremental_load():
+    print("🧪 Тестирование инкрементальной загрузки")
+    with tempfile.TemporaryDirectory() as tmp:
+        first_part = os.path.join(tmp, "part1.csv")
+        first_rows = _write_part(first_part, "2025-05-20")
+
+        conn = sqlite3.connect(os.path.join(tmp, "incremental.db"))
+        stats = append_campaign_metrics(conn, first_part)
+        assert stats["rows_inserted"] == first_rows
+        assert stats["watermark"] == "2025-05-20"
+        # Первая загрузка строит rollup-таблицы целиком
+        assert rollups_current(conn)
+        build_campaign_index(conn)
+        # Воронка загружена другим загрузчиком, скетчи визитов построены
+        conn.execute("CREATE TABLE funnel_data (date TEXT, utm_source TEXT, utm_campaign TEXT, visit_id TEXT)")
+        conn.execute("INSERT INTO funnel_data VALUES ('2025-05-01', 'yandex', 'rko', '1')")
+        build_visit_sketches(conn)
+        assert sketches_current(conn)
+
+        # Вторая выгрузка содержит всю историю: добавляются только новые дни
+        stats = append_campaign_metrics(conn, SAMPLE_CSV)
+        total_rows = conn.execute("SELECT COUNT(*) FROM campaign_metrics").fetchone()[0]
+        assert total_rows == 9795
+        assert stats["rows_inserted"] == total_rows - first_rows
+        assert stats["late_rows"] > 0
+        assert stats["watermark"] == "2025-05-31"
+        assert set(stats["rollup_cells"]) == set(ROLLUPS)
+        assert rollups_current(conn)
+        # Версия данных выросла, но funnel_data та же - скетчи остаются актуальными
+        assert sketches_current(conn)
+
+        # Новые названия попали в справочник
+        dim_count = conn.execute(f"SELECT COUNT(*) FROM {CAMPAIGN_DIM_TABLE}").fetchone()[0]
+        names_count = conn.execute('SELECT COUNT(DISTINCT "Название кампании") FROM campaign_metrics').fetchone()[0]
+        assert dim_count == names_count
+
+        # Ячейки, обновленные upsert-ом, совпадают с полной перестройкой
+        incremental_totals = _rollup_totals(conn)
+        build_rollups(conn)
+        assert _rollup_totals(conn) == incremental_totals
+
+        # Повторная загрузка той же выгрузки ничего не добавляет и не меняет версию данных
+        version = get_data_version(conn)
+        stats = append_campaign_metrics(conn, SAMPLE_CSV)
+        assert stats["rows_inserted"] == 0
+        assert get_data_version(conn) == version
+        assert rollups_current(conn) and get_watermark(conn) == "2025-05-31"
+        conn.close()
+    print("✅ Добавлены только новые строки, rollup совпадает с полной перестройкой")
+
+
+def test_watermark_after_full_reload():
+    print("🧪 Тестирование отметки после полной перезагрузки")
+    with tempfile.TemporaryDirectory() as tmp:
+        part = os.path.join(tmp, "part.csv")
+        _write_part(part, "2025-05-10")
+
+        conn = sqlite3.connect(os.path.join(tmp, "reload.db"))
+        append_campaign_metrics(conn, SAMPLE_CSV)
+        assert get_watermark(conn) == "2025-05-31"
+
+        # Другой загрузчик заменил таблицу и сменил версию данных
+        conn.execute("DELETE FROM campaign_metrics WHERE \"Дата\" > '2025-05-10'")
+        bump_data_version(conn)
+        assert get_watermark(conn) == "2025-05-10"
+
+        # Rollup устарели - после загрузки они перестраиваются целиком
+        assert not rollups_current(conn)
+        stats = append_campaign_metrics(conn, SAMPLE_CSV)
+        assert conn.execute("SELECT COUNT(*) FROM campaign_metrics").fetchone()[0] == 9795
+        assert rollups_current(conn)
+        assert stats["rollup_cells"]["rollup_campaign_platform"] > 0
+        conn.close()
+    print("✅ Устаревшая отметка не приводит к пропуску строк")
+
+
+if __name__ == "__main__":
+    test_incremental_load()
+    test_watermark_after_full_reload()
+    print("\n✅ Тестирование завершено!")
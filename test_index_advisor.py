@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки покрывающих индексов под запросы агента
+"""
+
+import csv
+import sqlite3
+
+from campaign_index import build_campaign_index
+from campaign_report import render_campaign_report_sql, render_name_conditions
+from data_version import bump_data_version
+from funnel_schema import FUNNEL_TEMPLATES, build_funnel_star
+from incremental_loader import append_campaign_metrics
+from index_advisor import (
+    advise_indexes, agent_query_shapes, ensure_query_indexes, verify_indexes
+)
+from rollups import ROLLUPS, build_rollups
+
+SAMPLE_CSV = "rko_econometric_sample.csv"
+ENGLISH_COLUMNS = {
+    "Дата": "date", "ID Кампании": "campaign_id", "Название кампании": "campaign_name", "Кампания": "campaign",
+    "Площадка": "platform", "Показы": "impressions", "Клики": "clicks", "Расход до НДС": "cost_before_vat",
+    "Визиты": "visits",
+}
+
+
+def _add_funnel(conn, rows_count=2000):
+    columns = [
+        "date", "traffic_source", "utm_campaign", "utm_source", "utm_medium", "utm_content", "utm_term",
+        "visit_id", "submits", "res", "subs_all", "account_num", "created_flag", "call_answered_flag",
+        "quality_flag", "quality",
+    ]
+    conn.execute(f"CREATE TABLE funnel_data ({', '.join(columns)})")
+    conn.executemany(f"INSERT INTO funnel_data VALUES ({', '.join('?' * len(columns))})", [
+        (f"2025-05-{i % 30 + 1:02d}", "Ad traffic", f"rko_{i % 40}", ["yandex", "vk"][i % 2], "cpc", "c", "t",
+         i, 1.0, 0.0, 0.0, i % 2, 0, 0, i % 3 == 0, 0)
+        for i in range(rows_count)
+    ])
+    conn.commit()
+
+
+def _assert_no_full_scans(conn):
+    shapes = agent_query_shapes(conn)
+    assert verify_indexes(conn, shapes) == {}
+    for shape in shapes:
+        if shape.table in ROLLUPS and not (shape.equality or shape.group):
+            # Итог по rollup-таблице читает ее саму
+            continue
+        plan = " | ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {shape.sql}", [None] * shape.sql.count("?")))
+        assert "COVERING INDEX idx_cover_" in plan, (shape.name, plan)
+    return shapes
+
+
+def test_covering_indexes():
+    print("🧪 Тестирование покрывающих индексов")
+    conn = sqlite3.connect(":memory:")
+    append_campaign_metrics(conn, SAMPLE_CSV)
+    build_campaign_index(conn)
+    _add_funnel(conn)
+
+    shapes = agent_query_shapes(conn)
+    assert len(shapes) == len(FUNNEL_TEMPLATES) + 3
+    # Формы - тот самый SQL агента по таблице, которую выбрал бы RollupRouter
+    report = next(shape for shape in shapes if shape.name == "campaigns|report")
+    assert report.table == "rollup_campaign_platform"
+    assert report.sql == render_campaign_report_sql(
+        "rollup_campaign_platform", render_name_conditions(["L"], "campaign_name_fts")
+    )
+    # Без индексов итоги и группировки читают таблицы целиком
+    assert "funnel|daily" in verify_indexes(conn, shapes)
+
+    names, problems = ensure_query_indexes(conn)
+    assert problems == {}
+    # Ключи (utm_campaign, date), utm_source и date обслуживают все шаблоны воронки
+    assert sorted(names) == [
+        "idx_cover_funnel_data_date",
+        "idx_cover_funnel_data_utm_campaign_date",
+        "idx_cover_funnel_data_utm_source",
+        "idx_cover_rollup_campaign_day_Название_кампании_Дата",
+        "idx_cover_rollup_campaign_platform_Название_кампании_Площадка",
+    ]
+    _assert_no_full_scans(conn)
+
+    # Индекс по названию стал префиксом покрывающего и удален
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "idx_rollup_campaign_platform_name" not in indexes
+
+    # Повторный вызов пересоздает тот же набор
+    assert sorted(ensure_query_indexes(conn)[0]) == sorted(names)
+
+    # После перевода воронки в схему "звезда" ключи - целочисленные колонки
+    build_funnel_star(conn)
+    names, problems = ensure_query_indexes(conn)
+    assert problems == {}
+    assert "idx_cover_funnel_data_utm_campaign_id_date" in names
+    _assert_no_full_scans(conn)
+
+    # Rollup-таблицы устарели - агент и советник читают таблицу фактов
+    bump_data_version(conn)
+    names, problems = ensure_query_indexes(conn)
+    assert problems == {}
+    assert "idx_cover_campaign_metrics_Название_кампании_Площадка" in names
+    assert {shape.table for shape in agent_query_shapes(conn) if shape.name.startswith("campaigns|")} == {"campaign_metrics"}
+    _assert_no_full_scans(conn)
+    conn.close()
+    print("✅ Ни один шаблон не читает таблицу целиком")
+
+
+def test_english_columns():
+    print("🧪 Тестирование таблицы с английскими названиями колонок")
+    conn = sqlite3.connect(":memory:")
+    with open(SAMPLE_CSV, encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = [ENGLISH_COLUMNS[column] for column in next(reader)]
+        conn.execute(f"CREATE TABLE campaign_metrics ({', '.join(header)})")
+        conn.executemany(f"INSERT INTO campaign_metrics VALUES ({', '.join('?' * len(header))})", reader)
+
+    # Шаблоны агента написаны по русским названиям - таблицу фактов они не читают
+    assert advise_indexes(agent_query_shapes(conn)) == []
+
+    # Rollup-таблицы переименовывают колонки - запросы идут к ним
+    bump_data_version(conn)
+    build_rollups(conn)
+    shapes = agent_query_shapes(conn)
+    assert {shape.table for shape in shapes} == {"rollup_campaign_platform", "rollup_campaign_day"}
+    specs = advise_indexes(shapes)
+    assert sorted(spec.columns[:2] for spec in specs) == [
+        ("Название кампании", "Дата"), ("Название кампании", "Площадка")
+    ]
+    assert ensure_query_indexes(conn)[1] == {}
+    conn.close()
+    print("✅ Индексы строятся под SQL, который агент выполняет")
+
+
+if __name__ == "__main__":
+    test_covering_indexes()
+    test_english_columns()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки версионирования эмбеддингов базы знаний
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from knowledge_embeddings import (
+    FAISS_AVAILABLE, INDEX_KINDS, KnowledgeEmbeddings, build_index, evaluate_index, index_kind_from_env, index_spec,
+    knowledge_fingerprint, sync_faiss_index
+)
+
+
+class _Encoder:
+    """Детерминированные векторы по тексту, запоминает, что кодировалось"""
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        vectors = np.array([
+            np.random.default_rng(sum(text.encode("utf-8"))).random(self.dim) for text in texts
+        ], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_incremental_sync():
+    print("🧪 Тестирование кодирования только измененных элементов")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "kb.npz")
+        encode = _Encoder()
+        texts = ["CTR клики", "CPC стоимость", "РКО обслуживание"]
+
+        store = KnowledgeEmbeddings(path, "model-a")
+        assert not store.is_current(texts)
+        first = store.sync(texts, encode)
+        store.save()
+        assert first.encoded == [0, 1, 2] and first.appended_from is None
+
+        store = KnowledgeEmbeddings(path, "model-a")
+        assert store.is_current(texts)
+
+        # Правка одного элемента и перестановка: кодируется только измененный
+        edited = ["РКО обслуживание", "CTR клики, показы", "CPC стоимость"]
+        sync = store.sync(edited, encode)
+        assert sync.encoded == [1] and encode.calls[-1] == ["CTR клики, показы"]
+        assert sync.appended_from is None
+        assert np.array_equal(sync.embeddings[0], first.embeddings[2])
+        assert np.array_equal(sync.embeddings[2], first.embeddings[1])
+        assert np.allclose(sync.embeddings[1], encode(["CTR клики, показы"])[0])
+        store.save()
+
+        # Новые элементы в конце - индекс можно дополнить
+        sync = KnowledgeEmbeddings(path, "model-a").sync(edited + ["ДМИК департамент"], encode)
+        assert sync.encoded == [3] and sync.appended_from == 3
+
+        # Другая модель - все элементы кодируются заново
+        other = KnowledgeEmbeddings(path, "model-b")
+        assert not other.is_current(edited)
+        assert other.sync(edited, encode).encoded == [0, 1, 2]
+        assert knowledge_fingerprint("a", ["x"]) != knowledge_fingerprint("b", ["x"])
+
+        # Поврежденный файл не ломает загрузку
+        with open(path, "wb") as f:
+            f.write(b"not a zip")
+        assert KnowledgeEmbeddings(path, "model-a").sync(texts, encode).encoded == [0, 1, 2]
+    print("✅ После правки базы знаний заново кодируются только измененные элементы")
+
+
+def test_faiss_index_sync():
+    print("🧪 Тестирование согласования FAISS индекса")
+    if not FAISS_AVAILABLE:
+        print("⚠️ faiss не установлен, тест пропущен")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, "kb.faiss")
+        store_file = os.path.join(tmp, "kb.npz")
+        encode = _Encoder()
+        texts = ["CTR клики", "CPC стоимость"]
+
+        index = sync_faiss_index(index_file, KnowledgeEmbeddings(store_file, "m"), texts, encode)
+        assert index.ntotal == 2 and len(encode.calls) == 1
+
+        # Отпечаток совпал - без кодирования
+        index = sync_faiss_index(index_file, KnowledgeEmbeddings(store_file, "m"), texts, encode)
+        assert index.ntotal == 2 and len(encode.calls) == 1
+
+        # Добавление в конец дополняет индекс
+        texts.append("РКО обслуживание")
+        index = sync_faiss_index(index_file, KnowledgeEmbeddings(store_file, "m"), texts, encode)
+        assert index.ntotal == 3 and encode.calls[-1] == ["РКО обслуживание"]
+
+        # Удаление элемента: индекс пересобирается, номера совпадают с элементами
+        texts = texts[1:]
+        index = sync_faiss_index(index_file, KnowledgeEmbeddings(store_file, "m"), texts, encode)
+        assert index.ntotal == 2 and len(encode.calls) == 2
+        _, ids = index.search(encode(["РКО обслуживание"]), 1)
+        assert ids[0][0] == 1
+    print("✅ Индекс соответствует базе знаний")
+
+
+def test_index_spec():
+    print("🧪 Тестирование выбора типа индекса")
+    assert index_spec("flat", 384, 40) == "Flat"
+    assert index_spec("sq8", 384, 40) == "SQ8"
+    # На малой базе IVF-PQ не обучить - точный индекс
+    assert index_spec("ivfpq", 384, 40) == "Flat"
+    # 4*sqrt(n) кластеров, подвекторы по 8 измерений
+    assert index_spec("ivfpq", 384, 40000) == "IVF800,PQ48"
+    # Не меньше 39 векторов на кластер
+    assert index_spec("ivfpq", 384, 2000) == "IVF51,PQ48"
+    assert index_spec("ivfpq", 100, 40000) == "IVF800,PQ10"
+    try:
+        index_spec("lsh", 384, 40)
+        assert False, "неизвестный тип должен отклоняться"
+    except ValueError:
+        pass
+
+    previous = os.environ.get("RAG_INDEX")
+    os.environ["RAG_INDEX"] = "HNSW"
+    assert index_kind_from_env() == "hnsw"
+    if previous is None:
+        del os.environ["RAG_INDEX"]
+    else:
+        os.environ["RAG_INDEX"] = previous
+    print("✅ Параметры индекса подбираются под размер базы")
+
+
+def test_index_kinds():
+    print("🧪 Тестирование квантованных и ANN индексов")
+    if not FAISS_AVAILABLE:
+        print("⚠️ faiss не установлен, тест пропущен")
+        return
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(50, 64))
+    vectors = (centers[rng.integers(0, 50, 5000)] + rng.normal(scale=0.3, size=(5000, 64))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[:200] + rng.normal(scale=0.05, size=(200, 64)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    reports = {kind: evaluate_index(build_index(kind, vectors), vectors, queries, k=10) for kind in INDEX_KINDS}
+    assert reports["flat"]["recall_at_k"] == 1.0
+    assert reports["fp16"]["recall_at_k"] > 0.95 and reports["sq8"]["recall_at_k"] > 0.8
+    assert reports["hnsw"]["recall_at_k"] > 0.8 and reports["ivfpq"]["recall_at_k"] > 0.3
+    # Квантование уменьшает индекс
+    assert reports["sq8"]["memory_bytes"] < reports["fp16"]["memory_bytes"] < reports["flat"]["memory_bytes"]
+    assert reports["ivfpq"]["memory_bytes"] < reports["flat"]["memory_bytes"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, "kb.faiss")
+        store_file = os.path.join(tmp, "kb.npz")
+        encode = _Encoder()
+        texts = [f"элемент {i}" for i in range(50)]
+        sync_faiss_index(index_file, KnowledgeEmbeddings(store_file, "m"), texts, encode)
+        # Смена типа индекса - пересборка из сохраненных векторов без кодирования
+        index = sync_faiss_index(index_file, KnowledgeEmbeddings(store_file, "m"), texts, encode, "hnsw")
+        assert index.ntotal == 50 and len(encode.calls) == 1
+        assert KnowledgeEmbeddings(store_file, "m").index_kind == "hnsw"
+    print("✅ Индексы всех типов строятся, recall и память измеряются")
+
+
+if __name__ == "__main__":
+    test_incremental_sync()
+    test_faiss_index_sync()
+    test_index_spec()
+    test_index_kinds()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки общего завершающего шага загрузчиков
+"""
+
+import os
+import sqlite3
+
+import pandas as pd
+
+from data_version import get_data_version
+from funnel_schema import LAYOUT_STAR, funnel_layout
+from index_advisor import agent_query_shapes, verify_indexes
+from load_pipeline import finalize_load
+from rollups import rollups_current
+from visit_sketches import APPROX_VISITS_ENV, SKETCH_TABLE, sketches_current
+
+
+def _load_tables(conn):
+    """Таблицы так, как их пишут загрузчики через to_sql"""
+    pd.read_csv("rko_econometric_sample.csv").to_sql("campaign_metrics", conn, if_exists="replace", index=False)
+    pd.DataFrame({
+        "date": [f"2025-05-{i % 30 + 1:02d}" for i in range(600)],
+        "utm_campaign": [f"rko_{i % 6}" for i in range(600)],
+        "utm_source": [["yandex", "vk"][i % 2] for i in range(600)],
+        "visit_id": [str(i) for i in range(600)],
+        "submits": [float(i % 3) for i in range(600)],
+        "account_num": [i % 2 for i in range(600)],
+    }).to_sql("funnel_data", conn, if_exists="replace", index=False)
+
+
+def test_finalize_load():
+    print("🧪 Тестирование завершающего шага загрузки")
+    conn = sqlite3.connect(":memory:")
+    _load_tables(conn)
+
+    result = finalize_load(conn, build_sketches=True)
+    assert result["data_version"] == get_data_version(conn) == 1
+    assert result["funnel_rows"] == 600 and funnel_layout(conn) == LAYOUT_STAR
+    assert result["campaigns"] == 17
+    # Версия, rollup-таблицы и скетчи согласованы, индексы покрывают запросы агента
+    assert rollups_current(conn) and sketches_current(conn)
+    assert result["full_scans"] == {}
+    assert verify_indexes(conn, agent_query_shapes(conn)) == {}
+    assert any(name.startswith("idx_cover_rollup_campaign_platform") for name in result["indexes"])
+
+    # Повторная загрузка: rollup-таблицы пересоздаются, индексы ставятся на новые таблицы
+    _load_tables(conn)
+    result = finalize_load(conn, build_sketches=True)
+    assert result["data_version"] == 2
+    assert rollups_current(conn) and sketches_current(conn)
+    assert verify_indexes(conn, agent_query_shapes(conn)) == {}
+    conn.close()
+    print("✅ Все производные структуры построены для новой версии данных")
+
+
+def test_sketches_opt_in():
+    print("🧪 Тестирование скетчей визитов только по FUNNEL_APPROX_VISITS")
+    conn = sqlite3.connect(":memory:")
+    _load_tables(conn)
+    finalize_load(conn, build_sketches=True)
+
+    # Без FUNNEL_APPROX_VISITS=1 визиты не хешируются, прежние скетчи удаляются
+    previous = os.environ.pop(APPROX_VISITS_ENV, None)
+    try:
+        _load_tables(conn)
+        result = finalize_load(conn)
+        assert result["sketches"] == 0 and not sketches_current(conn)
+        assert not conn.execute(f"SELECT name FROM sqlite_master WHERE name = '{SKETCH_TABLE}'").fetchall()
+
+        os.environ[APPROX_VISITS_ENV] = "1"
+        result = finalize_load(conn)
+        assert result["sketches"] > 0 and sketches_current(conn)
+    finally:
+        os.environ.pop(APPROX_VISITS_ENV, None)
+        if previous is not None:
+            os.environ[APPROX_VISITS_ENV] = previous
+    assert rollups_current(conn)
+    conn.close()
+    print("✅ Скетчи строятся только для приближенного подсчета визитов")
+
+
+if __name__ == "__main__":
+    test_finalize_load()
+    test_sketches_opt_in()
+    print("\n✅ Тестирование завершено!")
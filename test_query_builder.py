@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки параметризованных запросов и кэша шаблонов
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from query_builder import SQLQuery, QueryPlanCache, render_sql
+from ai_agent import MarketingAnalyticsAgent
+
+
+def _create_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE campaign_metrics (
+            "Дата" TEXT, "ID Кампании" INTEGER, "Название кампании" TEXT, "Площадка" TEXT,
+            "Показы" REAL, "Клики" REAL, "Расход до НДС" REAL, "Визиты" INTEGER
+        )
+    """)
+    conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+        ("2025-05-01", 1, "ФРК4 Бизнес-Фест", "Telegram Ads", 1000, 10, 500.0, 8),
+        ("2025-05-01", 2, "Годовой PERFORMANCE", "Яндекс.Директ", 2000, 40, 800.0, 30),
+        ("2025-05-02", 3, "Кафе O'Key", "VK Реклама", 300, 3, 90.0, 2),
+    ])
+    conn.commit()
+    conn.close()
+
+
+def test_render_sql():
+    print("🧪 Тестирование подстановки параметров для отображения")
+    sql = "SELECT 'a?b' as x, \"col?\" FROM t WHERE name LIKE ? AND id = ?"
+    rendered = render_sql(sql, ["%O'KEY%", 5])
+    assert rendered == "SELECT 'a?b' as x, \"col?\" FROM t WHERE name LIKE '%O''KEY%' AND id = 5"
+
+    query = SQLQuery("SELECT * FROM t WHERE a = ?", ["rko"], "t|a")
+    assert isinstance(query, str)
+    assert "rko" in query
+    assert query.sql == "SELECT * FROM t WHERE a = ?"
+    assert query.params == ("rko",)
+    print("✅ Параметры подставляются только вне кавычек")
+
+
+def test_query_plan_cache():
+    print("🧪 Тестирование LRU кэша шаблонов")
+    cache = QueryPlanCache(maxsize=2)
+    assert cache.get_or_build("a", lambda: "SQL A") == "SQL A"
+    assert cache.get_or_build("a", lambda: "другой") == "SQL A"
+    cache.get_or_build("b", lambda: "SQL B")
+    cache.get_or_build("c", lambda: "SQL C")
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 3}
+    # get() тоже отмечает использование: вытесняется "c", а не "b"
+    assert cache.get("b") == "SQL B"
+    cache.get_or_build("d", lambda: "SQL D")
+    assert cache.get("c") is None and cache.get("b") == "SQL B"
+    print("✅ Кэш вытесняет самые старые шаблоны")
+
+
+def test_agent_reuses_template():
+    print("🧪 Тестирование повторного использования шаблона агентом")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "agent.db")
+        _create_db(db_path)
+        agent = MarketingAnalyticsAgent(db_path)
+
+        first = agent.generate_sql_query("отчет по кампании ФРК4")
+        second = agent.generate_sql_query("отчет по кампании PERFORMANCE")
+
+        assert first.template_key == second.template_key
+        assert first.sql == second.sql
+        assert first.params != second.params
+        assert "ФРК4" not in first.sql
+        assert agent.query_plans.stats()["hits"] >= 1
+
+        df = agent.execute_query(second)
+        campaigns = df[df["level"] == "campaign"]
+        assert list(campaigns["campaign_name"]) == ["Годовой PERFORMANCE"]
+
+        # Кавычки в значении не ломают запрос
+        df = agent.execute_query(agent.generate_sql_query("отчет по кампании O'KEY"))
+        assert (df["level"] == "campaign").sum() == 1
+        agent.pool.close_all()
+    print("✅ Одинаковая форма вопроса переиспользует SQL шаблон")
+
+
+if __name__ == "__main__":
+    test_render_sql()
+    test_query_plan_cache()
+    test_agent_reuses_template()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки разбора намерения вопроса за один проход
+"""
+
+import dataclasses
+import random
+
+from query_intent import (
+    FUNNEL, FUNNEL_DAILY, GENERAL_STATS, INTENT_KEYWORDS, INTENT_PARSER, LIMIT_FIRST, LIMIT_TOP, PRODUCT, TERMS, UTM,
+    IntentParser
+)
+
+QUESTIONS = [
+    "Покажи общую статистику по всем кампаниям",
+    "Топ кампаний по расходу",
+    "Первые 5 кампаний по показам",
+    "Сделай отчет по кампании ФРК4 Бизнес-Фест",
+    "Конверсия воронки по utm_source=yandex",
+    "Динамика заявок по дням",
+    "Что такое CTR и CPC?",
+    "Эффективность площадок для РКО",
+    "Сравни источники и каналы",
+    "лучшиелучший топтоп",
+    "",
+]
+
+
+def _expected(text):
+    # Прежняя семантика: any(word in question_lower for word in ...) по каждому списку
+    return frozenset(flag for flag, words in INTENT_KEYWORDS.items() if any(word in text for word in words))
+
+
+def test_matches_keyword_scans():
+    print("🧪 Тестирование совпадения с проверками any(...)")
+    for question in QUESTIONS:
+        text = question.lower()
+        assert INTENT_PARSER.scan(text) == _expected(text), question
+
+    # Случайные тексты из кусков ключевых слов: перекрытия и слова внутри слов
+    random.seed(3)
+    words = sorted({word for group in INTENT_KEYWORDS.values() for word in group})
+    for _ in range(2000):
+        parts = []
+        for _ in range(random.randint(1, 6)):
+            word = random.choice(words)
+            start = random.randint(0, len(word) - 1)
+            parts.append(word[start:start + random.randint(1, len(word))] if random.random() < 0.5 else word)
+        text = random.choice(["", " "]).join(parts)
+        assert INTENT_PARSER.scan(text) == _expected(text), text
+    print("✅ Признаки совпадают с прежними проверками")
+
+
+def test_overlapping_keywords():
+    print("🧪 Тестирование перекрывающихся ключевых слов")
+    parser = IntentParser({"a": ["utm"], "b": ["utm_source"], "c": ["source"], "d": ["ce x"]})
+    assert parser.scan("utm_source x") == frozenset({"a", "b", "c", "d"})
+    assert parser.scan("utm_sourc") == frozenset({"a"})
+
+    flags = INTENT_PARSER.scan("первые 5 метки")
+    assert LIMIT_FIRST in flags and UTM in flags and LIMIT_TOP not in flags
+    # "динамика" - и признак воронки, и динамика по дням
+    assert {FUNNEL, FUNNEL_DAILY} <= INTENT_PARSER.scan("динамика")
+    print("✅ Находятся все вхождения, включая вложенные")
+
+
+def test_frozen_intent():
+    print("🧪 Тестирование неизменяемого QueryIntent")
+    intent = INTENT_PARSER.parse("Топ кампаний РКО по расходу", "фрк4", {"utm_source": "yandex"})
+    assert intent.text == "топ кампаний рко по расходу"
+    assert intent.has(PRODUCT) and not intent.has(GENERAL_STATS) and not intent.has(TERMS)
+    assert intent.order_by == "cost DESC" and intent.limit == 10
+    assert intent.campaign_name == "фрк4" and intent.utm == {"utm_source": "yandex"}
+    assert not intent.is_funnel
+    assert INTENT_PARSER.parse("конверсия").is_funnel and INTENT_PARSER.parse("utm метки").is_funnel
+    assert INTENT_PARSER.parse("клики").order_by == "clicks DESC"
+    assert INTENT_PARSER.parse("кампании").order_by is None and INTENT_PARSER.parse("кампании").limit is None
+
+    try:
+        intent.campaign_name = "другая"
+        assert False, "QueryIntent должен быть неизменяемым"
+    except dataclasses.FrozenInstanceError:
+        pass
+    # Хешируется - можно использовать как ключ
+    assert hash(intent) == hash(INTENT_PARSER.parse("Топ кампаний РКО по расходу", "фрк4", {"utm_source": "yandex"}))
+    print("✅ QueryIntent неизменяемый и хешируемый")
+
+
+if __name__ == "__main__":
+    test_matches_keyword_scans()
+    test_overlapping_keywords()
+    test_frozen_intent()
+    print("\n✅ Тестирование завершено!")
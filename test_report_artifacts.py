@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки ленивых артефактов ответа (файл отчета, дашборд)
+"""
+
+from report_artifacts import CSV_EXTENSION, EXCEL_EXTENSION, ArtifactStore, LazyArtifact, ReportFile
+
+
+def test_lazy_artifact_memoized():
+    print("🧪 Тестирование построения по запросу")
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"metrics": {"total_clicks": 10}}
+
+    artifact = LazyArtifact(build)
+    assert not artifact.ready and calls == []
+    assert artifact.get() == {"metrics": {"total_clicks": 10}}
+    assert artifact.get() is artifact.get()
+    assert artifact.ready and len(calls) == 1
+    print("✅ Значение строится один раз и только при обращении")
+
+
+def test_report_file_format():
+    print("🧪 Тестирование формата файла отчета")
+    excel = ReportFile(lambda: (b"PK\x03\x04", EXCEL_EXTENSION))
+    assert excel.get() == b"PK\x03\x04"
+    assert excel.file_name.endswith(".xlsx") and "spreadsheetml" in excel.mime
+
+    # Формат определяется построением: Excel не удался - выгружен CSV
+    csv = ReportFile(lambda: ("Отчет".encode("utf-8-sig"), CSV_EXTENSION))
+    name = csv.file_name
+    csv.get()
+    assert csv.file_name == name[:-len("xlsx")] + "csv"
+    assert csv.mime == "text/csv" and "CSV" in csv.label
+    print("✅ Имя файла, MIME и подпись соответствуют построенному формату")
+
+
+def test_store_evicts_old_artifacts():
+    print("🧪 Тестирование вытеснения старых артефактов")
+    store = ArtifactStore(max_items=3, max_bytes=250)
+    files = [ReportFile(lambda i=i: (bytes(100), EXCEL_EXTENSION), store) for i in range(4)]
+
+    files[0].get()
+    files[1].get()
+    assert store.stats() == {"size": 2, "bytes": 200, "evicted": 0}
+    # Третий файл не помещается по объему - вытесняется самый давний
+    files[2].get()
+    assert not files[0].ready and files[1].ready and files[2].ready
+    assert store.stats()["bytes"] == 200
+
+    # Обращение продлевает жизнь: теперь самый давний - files[2]
+    files[1].get()
+    files[3].get()
+    assert files[1].ready and not files[2].ready and files[3].ready
+
+    # Вытесненный артефакт строится заново
+    assert files[0].get() == bytes(100) and files[0].ready
+    assert store.stats()["evicted"] == 3
+
+    # Дашборды без размера ограничены числом артефактов
+    dashboards = ArtifactStore(max_items=2)
+    artifacts = [LazyArtifact(lambda: {"charts": []}, dashboards) for _ in range(3)]
+    for artifact in artifacts:
+        artifact.get()
+    assert [artifact.ready for artifact in artifacts] == [False, True, True]
+    assert len(dashboards) == 2
+    print("✅ Старые артефакты освобождаются, а при обращении строятся снова")
+
+
+if __name__ == "__main__":
+    test_lazy_artifact_memoized()
+    test_report_file_format()
+    test_store_evicts_old_artifacts()
+    print("\n✅ Тестирование завершено!")
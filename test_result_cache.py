@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша результатов
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import Future
+
+from data_version import bump_data_version
+from result_cache import ResultCache, normalize_question
+from rollups import build_rollups
+
+
+def test_result_cache():
+    print("🧪 Тестирование кэша результатов")
+    assert normalize_question("  Покажи   общую статистику? ") == "покажи общую статистику"
+
+    cache = ResultCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    # Вытесняется давно не использованная запись
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1, "expired": 0}
+
+    short_cache = ResultCache(ttl=0.01)
+    short_cache.put("a", 1)
+    time.sleep(0.02)
+    assert short_cache.get("a") is None
+    assert short_cache.stats()["expired"] == 1
+    print("✅ LRU вытеснение и TTL работают")
+
+
+def test_process_question_cache():
+    print("🧪 Тестирование кэша ответов агента")
+    import ai_agent
+    from ai_agent import MarketingAnalyticsAgent
+
+    # Отчет выгружаем в CSV, чтобы тест не зависел от openpyxl
+    openpyxl_available = ai_agent.OPENPYXL_AVAILABLE
+    ai_agent.OPENPYXL_AVAILABLE = False
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cache.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE campaign_metrics (
+                "Дата" TEXT, "ID Кампании" INTEGER, "Название кампании" TEXT, "Площадка" TEXT,
+                "Показы" REAL, "Клики" REAL, "Расход до НДС" REAL, "Визиты" INTEGER
+            )
+        """)
+        conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            ("2025-05-01", 1, "Годовой performance. РКО 2025.", "Яндекс.Директ", 1000, 20, 500.0, 10),
+            ("2025-05-02", 2, "ФРК4 Бизнес-Фест", "Telegram Ads", 800, 8, 300.0, 4),
+        ])
+        conn.commit()
+
+        agent = MarketingAnalyticsAgent(db_path)
+        first = agent.process_question("Покажи общую статистику")
+
+        # Попадание в кэш не выполняет запрос и не строит анализ
+        execute_query = agent.execute_query
+        agent.execute_query = None
+        second = agent.process_question("ПОКАЖИ ОБЩУЮ СТАТИСТИКУ")
+        agent.execute_query = execute_query
+        assert agent.result_cache.stats()["hits"] == 1
+        assert second[:2] == first[:2]
+        # Каждому вызову - свой кортеж и свои ленивые артефакты
+        assert second is not first
+        assert second[2] is not first[2] and second[3] is not first[3]
+        assert second[3].get() == first[3].get()
+
+        # Ответ без данных не кэшируется
+        agent.process_question("Отчет по кампании Несуществующая")
+        assert len(agent.result_cache) == 1
+
+        # Загрузчик обновил данные - ответ строится заново
+        bump_data_version(conn)
+        third = agent.process_question("Покажи общую статистику")
+        assert third is not first
+        assert third[0] == first[0]
+        assert agent.result_cache.stats()["misses"] == 3
+        assert len(agent.conversation_history) == 4
+
+        # Другой SQL при той же версии данных (появились rollup-таблицы) - другой ключ
+        build_rollups(conn)
+        fourth = agent.process_question("Покажи общую статистику")
+        assert fourth[1].template_key != third[1].template_key
+        assert agent.result_cache.stats()["misses"] == 4
+
+        # Настройки агента, которых нет в SQL, тоже входят в ключ
+        agent.approximate_visits = True
+        agent.process_question("Покажи общую статистику")
+        assert agent.result_cache.stats()["misses"] == 5
+        agent.approximate_visits = False
+        agent.process_question("Покажи общую статистику")
+        assert agent.result_cache.stats()["hits"] == 2
+
+        conn.close()
+        agent.pool.close_all()
+    ai_agent.OPENPYXL_AVAILABLE = openpyxl_available
+    print("✅ Повторный вопрос отдается из кэша до смены версии данных")
+
+
+class _WarmingRAG:
+    """RAG-система, модель которой еще загружается в фоне"""
+
+    def __init__(self):
+        self.ready = Future()
+        self.calls = []
+
+    def is_ready(self):
+        return self.ready.done()
+
+    def enhance_report(self, report, question, wait=True):
+        self.calls.append(wait)
+        return report + "\n\n📚 Контекстная информация" if self.is_ready() else report
+
+
+def test_rag_warm_up_not_cached():
+    print("🧪 Тестирование ответов во время загрузки RAG")
+    import ai_agent
+    from ai_agent import MarketingAnalyticsAgent
+
+    openpyxl_available = ai_agent.OPENPYXL_AVAILABLE
+    ai_agent.OPENPYXL_AVAILABLE = False
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "rag.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE campaign_metrics (
+                "Дата" TEXT, "ID Кампании" INTEGER, "Название кампании" TEXT, "Площадка" TEXT,
+                "Показы" REAL, "Клики" REAL, "Расход до НДС" REAL, "Визиты" INTEGER
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+        agent = MarketingAnalyticsAgent(db_path)
+        agent.rag_system = _WarmingRAG()
+        # Ответ не ждет модель и не попадает в кэш без RAG-контекста
+        first = agent.process_question("Что такое CTR?")
+        assert "Контекстная информация" not in first[0]
+        assert agent.rag_system.calls == [False]
+        assert len(agent.result_cache) == 0
+
+        agent.rag_system.ready.set_result(agent.rag_system)
+        second = agent.process_question("Что такое CTR?")
+        assert "Контекстная информация" in second[0]
+        # Данных нет - ответ с RAG-контекстом тоже строится заново
+        assert len(agent.result_cache) == 0
+        agent.pool.close_all()
+    ai_agent.OPENPYXL_AVAILABLE = openpyxl_available
+    print("✅ RAG-контекст добавляется, когда модель готова")
+
+
+if __name__ == "__main__":
+    test_result_cache()
+    test_process_question_cache()
+    test_rag_warm_up_not_cached()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки rollup-таблиц и выбора таблицы для запроса
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from connection_pool import SQLiteConnectionPool
+from data_version import bump_data_version
+from rollups import FACT_TABLE, ROLLUPS, RollupRouter, apply_rollup_deltas, build_rollups, rollups_current
+
+
+def _create_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE campaign_metrics (
+            "Дата" TEXT, "ID Кампании" INTEGER, "Название кампании" TEXT, "Площадка" TEXT,
+            "Показы" REAL, "Клики" REAL, "Расход до НДС" REAL, "Визиты" INTEGER
+        )
+    """)
+    rows = []
+    for day in range(1, 31):
+        for platform in ("Telegram Ads", "Яндекс.Директ", "VK Реклама"):
+            rows.append((f"2025-05-{day:02d}", 1, "ФРК4 Бизнес-Фест", platform, 100, 2, 50.0, 1))
+            rows.append((f"2025-05-{day:02d}", 2, "Годовой performance", platform, 200, 4, 90.0, 3))
+    conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    return conn
+
+
+def test_build_rollups():
+    print("🧪 Тестирование построения rollup-таблиц")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _create_db(os.path.join(tmp, "rollups.db"))
+        bump_data_version(conn)
+
+        built = build_rollups(conn)
+        assert built == {
+            "rollup_campaign_platform": 6,
+            "rollup_campaign_day": 60,
+            "rollup_platform_day": 90,
+        }
+
+        # Суммы совпадают с таблицей фактов
+        fact = conn.execute("""
+            SELECT "Название кампании", "Площадка", SUM("Показы"), SUM("Клики"), SUM("Расход до НДС"), SUM("Визиты")
+            FROM campaign_metrics GROUP BY 1, 2 ORDER BY 1, 2
+        """).fetchall()
+        rollup = conn.execute("""
+            SELECT "Название кампании", "Площадка", SUM("Показы"), SUM("Клики"), SUM("Расход до НДС"), SUM("Визиты")
+            FROM rollup_campaign_platform GROUP BY 1, 2 ORDER BY 1, 2
+        """).fetchall()
+        assert rollup == fact
+        conn.close()
+    print("✅ Rollup-таблицы построены, суммы совпадают")
+
+
+def test_build_rollups_english_columns():
+    print("🧪 Тестирование rollup-таблиц для английских названий колонок")
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE campaign_metrics (
+            date TEXT, campaign_id INTEGER, campaign_name TEXT, platform TEXT,
+            impressions REAL, clicks REAL, cost_before_vat REAL, visits INTEGER
+        )
+    """)
+    conn.execute("INSERT INTO campaign_metrics VALUES ('2025-05-01', 1, 'РКО', 'Telegram Ads', 10, 1, 5.0, 1)")
+    built = build_rollups(conn)
+    assert set(built) == {"rollup_campaign_platform", "rollup_campaign_day", "rollup_platform_day"}
+    row = conn.execute('SELECT "Название кампании", "Показы" FROM rollup_campaign_platform').fetchone()
+    assert row == ("РКО", 10)
+
+    # Без таблицы фактов ничего не строится
+    assert build_rollups(sqlite3.connect(":memory:")) == {}
+    print("✅ Колонки rollup-таблиц называются одинаково для любых загрузчиков")
+
+
+def test_rollup_deltas_null_keys():
+    print("🧪 Тестирование upsert ячеек с пустым измерением")
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE campaign_metrics (
+            "Дата" TEXT, "ID Кампании" INTEGER, "Название кампании" TEXT, "Площадка" TEXT,
+            "Показы" REAL, "Клики" REAL, "Расход до НДС" REAL, "Визиты" INTEGER
+        )
+    """)
+    conn.execute("INSERT INTO campaign_metrics VALUES ('2025-05-01', 1, 'РКО', NULL, 10, 1, 5.0, 1)")
+    build_rollups(conn)
+
+    # Две загрузки строк без площадки и одна с площадкой
+    batches = [
+        [("2025-05-01", 1, "РКО", None, 5, 1, 2.0, 1)],
+        [("2025-05-01", 1, "РКО", None, 7, 0, 1.0, 0), ("2025-05-02", 1, "РКО", "VK Реклама", 3, 1, 1.0, 1)],
+    ]
+    for batch in batches:
+        conn.executemany("INSERT INTO campaign_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        apply_rollup_deltas(conn, [
+            dict(zip(["Дата", "ID Кампании", "Название кампании", "Площадка", "Показы", "Клики",
+                      "Расход до НДС", "Визиты"], row))
+            for row in batch
+        ])
+
+    incremental = {table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall(), key=repr) for table in ROLLUPS}
+    assert conn.execute(
+        'SELECT COUNT(*), SUM("Показы") FROM rollup_campaign_platform WHERE "Площадка" IS NULL'
+    ).fetchone() == (1, 22)
+    # Ячейки совпадают с полной перестройкой, дубликатов с NULL в ключе нет
+    build_rollups(conn)
+    assert {table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall(), key=repr) for table in ROLLUPS} == incremental
+    conn.close()
+    print("✅ Ячейки с NULL в ключе обновляются, а не дублируются")
+
+
+def test_rollup_router():
+    print("🧪 Тестирование выбора таблицы для запроса")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "router.db")
+        conn = _create_db(db_path)
+        router = RollupRouter(SQLiteConnectionPool(db_path))
+
+        # Rollup-таблиц еще нет
+        assert router.choose(["campaign", "platform"]) == FACT_TABLE
+
+        bump_data_version(conn)
+        build_rollups(conn)
+        assert router.choose(["campaign", "platform"]) == "rollup_campaign_platform"
+        assert router.choose(["campaign"]) == "rollup_campaign_platform"
+        assert router.choose(["date"]) == "rollup_campaign_day"
+        assert router.choose(["platform", "date"]) == "rollup_platform_day"
+        assert router.choose(["campaign", "platform", "date"]) == FACT_TABLE
+
+        # Скрипт дописал строки в обход загрузчиков (без новой версии) - rollup устарели
+        conn.execute("INSERT INTO campaign_metrics VALUES ('2025-06-01', 1, 'ФРК4 Бизнес-Фест', 'VK Реклама', 1, 1, 1.0, 1)")
+        conn.commit()
+        assert not rollups_current(conn)
+        assert router.choose(["campaign", "platform"]) == FACT_TABLE
+        build_rollups(conn)
+        assert rollups_current(conn)
+        assert router.choose(["campaign", "platform"]) == "rollup_campaign_platform"
+
+        # Загрузчик сменил версию данных, но не перестроил rollup - читаем таблицу фактов
+        bump_data_version(conn)
+        assert router.choose(["campaign", "platform"]) == FACT_TABLE
+        assert router.tables() == []
+        conn.close()
+        router.pool.close_all()
+    print("✅ Выбирается самая маленькая актуальная таблица")
+
+
+def test_agent_reads_rollup():
+    print("🧪 Тестирование чтения отчетов агентом из rollup-таблицы")
+    from ai_agent import MarketingAnalyticsAgent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "agent.db")
+        conn = _create_db(db_path)
+        agent = MarketingAnalyticsAgent(db_path)
+        fact_query = agent.generate_sql_query("отчет по кампании ФРК4")
+        assert "FROM campaign_metrics" in fact_query.sql
+        fact_df = agent.execute_query(fact_query)
+
+        bump_data_version(conn)
+        build_rollups(conn)
+        conn.close()
+
+        rollup_query = agent.generate_sql_query("отчет по кампании ФРК4")
+        assert "FROM rollup_campaign_platform" in rollup_query.sql
+        assert rollup_query.template_key != fact_query.template_key
+        rollup_df = agent.execute_query(rollup_query)
+        # Строки площадок и итога содержат NULL, поэтому сравниваются сами DataFrame
+        assert rollup_df.equals(fact_df)
+
+        general = agent.execute_query(agent.generate_sql_query("покажи общую статистику"))
+        assert general.iloc[0]["campaigns_count"] == 2
+        assert general.iloc[0]["total_impressions"] == 27000
+        agent.pool.close_all()
+    print("✅ Агент отвечает из rollup-таблицы теми же цифрами")
+
+
+if __name__ == "__main__":
+    test_build_rollups()
+    test_build_rollups_english_columns()
+    test_rollup_deltas_null_keys()
+    test_rollup_router()
+    test_agent_reads_rollup()
+    print("\n✅ Тестирование завершено!")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки точного поиска терминов базы знаний
+"""
+
+from term_index import TermIndex
+
+ITEMS = [
+    {"term": "CTR", "definition": "Click-Through Rate"},
+    {"term": "CR", "definition": "Conversion Rate"},
+    {"term": "CPC", "definition": "Cost Per Click"},
+    {"term": "РКО", "definition": "Расчетно-кассовое обслуживание"},
+    {"term": "РКО кампании", "definition": "Кампании РКО"},
+    {"term": "Яндекс.Директ", "definition": "Контекстная реклама"},
+    {"term": "Маркетинг", "definition": "Комплекс мероприятий"},
+]
+
+
+def test_glossary_lookup():
+    print("🧪 Тестирование словарных запросов")
+    terms = TermIndex(ITEMS)
+    assert terms.lookup("Что такое CTR?") == [0]
+    assert terms.lookup("ctr") == [0]
+    assert terms.lookup("что означает CTR и CPC") == [0, 2]
+    assert terms.lookup("расшифровка CR") == [1]
+    assert terms.lookup("маркетинг") == [6]
+    # Более длинный термин находится целиком
+    assert terms.lookup("что такое РКО кампании") == [4]
+    assert terms.lookup("Яндекс.Директ") == [5]
+    print("✅ Определения находятся без модели")
+
+
+def test_semantic_fallback():
+    print("🧪 Тестирование запросов для семантического поиска")
+    terms = TermIndex(ITEMS)
+    # Кроме терминов есть другие слова - нужен семантический поиск
+    assert terms.lookup("как снизить CPC на площадках") is None
+    assert terms.lookup("что такое ROI") is None
+    # "CR" не находится внутри "CTR" и "CRM"
+    assert terms.find("CTR и CRM") == [0]
+    assert terms.find("отчет по РКО за май") == [3]
+    assert TermIndex([]).lookup("CTR") is None
+    print("✅ Остальные запросы уходят в семантический поиск")
+
+
+if __name__ == "__main__":
+    test_glossary_lookup()
+    test_semantic_fallback()
+    print("\n✅ Тестирование завершено!")
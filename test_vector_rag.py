@@ -39,6 +39,20 @@ def test_vector_rag():
     print("✨ Улучшенный отчет:")
     print(enhanced_report)
     
+    # Тестируем пакетный поиск
+    print("\n" + "=" * 50)
+    print("📦 Тестирование пакетного поиска")
+    print("=" * 50)
+    
+    batch_queries = test_queries + ["как снизить стоимость клика", "что такое CTR и CPC"]
+    batch_results = rag.search_batch(batch_queries, top_k=2)
+    assert len(batch_results) == len(batch_queries)
+    for query, results in zip(batch_queries, batch_results):
+        assert [item['term'] for item in results] == [item['term'] for item in rag.search(query, top_k=2)], query
+    enhanced_reports = rag.enhance_reports_batch([test_report] * 2, ["ДМИК", "CTR"])
+    assert enhanced_reports[0] == rag.enhance_report(test_report, "ДМИК")
+    print(f"✅ {len(batch_queries)} запросов: результаты совпадают с поиском по одному")
+    
     print("\n✅ Векторная RAG система работает корректно!")
 
 if __name__ == "__main__":
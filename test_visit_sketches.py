@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки HyperLogLog-скетчей визитов воронки
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+
+from connection_pool import SQLiteConnectionPool
+from data_version import bump_data_version
+from funnel_schema import FUNNEL_TEMPLATES, build_funnel_star, render_funnel_sql
+from visit_sketches import SQLITE_AGGREGATES, HyperLogLog, build_visit_sketches, sketches_current
+
+# Колонки результата, которые сравниваются точно (суммы) и с допуском (визиты)
+EXACT_COLUMNS = {"submits", "accounts_opened", "created", "calls_answered", "quality_leads"}
+RELATIVE_ERROR = 0.05
+
+
+def _create_db(path, visits=60000):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE funnel_data (date, traffic_source, utm_campaign, utm_source, utm_medium, utm_content,
+                                  utm_term, visit_id, submits, res, subs_all, account_num, created_flag,
+                                  call_answered_flag, quality_flag, quality)
+    """)
+    # Визит встречается в двух строках (несколько событий одного визита), submits различаются по кампаниям
+    conn.executemany("INSERT INTO funnel_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (f"2025-05-{i % 30 + 1:02d}", "Ad traffic", f"rko_{i % 20}", ["yandex", "vk", "telegram"][i % 3],
+         "cpc", "c", "t", i // 2, float(i % 20), 0.0, 0.0, i % 5 == 0, 0, i % 7 == 0, i % 11 == 0, 0)
+        for i in range(visits * 2)
+    ])
+    bump_data_version(conn)
+    return conn
+
+
+def test_hyperloglog():
+    print("🧪 Тестирование HyperLogLog")
+    sketch = HyperLogLog()
+    for value in range(100000):
+        sketch.add(value)
+    assert abs(sketch.estimate() - 100000) / 100000 < RELATIVE_ERROR
+    assert sketch.dense is not None
+
+    # Малые множества считаются почти точно и хранятся разреженно
+    small = HyperLogLog()
+    for value in ["a", "b", "c", "a", 1, 1.0]:
+        small.add(value)
+    assert small.sparse is not None and round(small.estimate()) == 4
+    restored = HyperLogLog.from_bytes(small.to_bytes())
+    assert restored.sparse == small.sparse
+    assert HyperLogLog.from_bytes(sketch.to_bytes()).dense == sketch.dense
+
+    # Объединение скетчей - оценка объединения множеств
+    left, right = HyperLogLog(), HyperLogLog()
+    for value in range(0, 60000):
+        left.add(value)
+    for value in range(40000, 100000):
+        right.add(value)
+    left.merge(right)
+    assert abs(left.estimate() - 100000) / 100000 < RELATIVE_ERROR
+    print(f"✅ Оценка 100000 различных значений: {sketch.estimate():.0f}")
+
+
+def _compare(exact_rows, approx_rows, columns, kind):
+    assert len(exact_rows) == len(approx_rows), kind
+    for exact, approx in zip(exact_rows, approx_rows):
+        for column, exact_value, approx_value in zip(columns, exact, approx):
+            if column == "visits":
+                assert abs(approx_value - exact_value) <= max(2, exact_value * RELATIVE_ERROR), (kind, exact, approx)
+            elif column in EXACT_COLUMNS or not isinstance(exact_value, (int, float)):
+                assert approx_value == exact_value, (kind, column, exact, approx)
+
+
+def test_sketch_templates():
+    print("🧪 Тестирование шаблонов воронки по скетчам")
+    with tempfile.TemporaryDirectory() as tmp:
+        for star in (False, True):
+            db_path = os.path.join(tmp, f"sketch_{star}.db")
+            conn = _create_db(db_path)
+            if star:
+                build_funnel_star(conn)
+                bump_data_version(conn)
+            assert not sketches_current(conn)
+            # Сочетания (дата, источник, кампания) повторяются с периодом НОК(30, 3, 20) = 60 строк
+            assert build_visit_sketches(conn) == 60
+            assert sketches_current(conn)
+            layout = "star" if star else "wide"
+            conn.close()
+
+            pool = SQLiteConnectionPool(db_path, aggregates=SQLITE_AGGREGATES)
+            with pool.connection() as reader:
+                timings = {}
+                for kind in FUNNEL_TEMPLATES:
+                    params = ["rko_3"] if FUNNEL_TEMPLATES[kind].get("campaign_filter") else []
+                    exact_sql = render_funnel_sql(kind, layout)
+                    approx_sql = render_funnel_sql(kind, layout, approximate=True)
+                    assert "hll_count(visit_sketch)" in approx_sql
+
+                    start = time.perf_counter()
+                    exact = reader.execute(exact_sql, params)
+                    columns = [description[0] for description in exact.description]
+                    exact_rows = exact.fetchall()
+                    exact_ms = (time.perf_counter() - start) * 1000
+                    start = time.perf_counter()
+                    approx_rows = reader.execute(approx_sql, params).fetchall()
+                    timings[kind] = (exact_ms, (time.perf_counter() - start) * 1000)
+
+                    # Порядок по оценке визитов может отличаться - сравниваем группы по названию
+                    exact_rows, approx_rows = sorted(exact_rows), sorted(approx_rows)
+                    _compare(exact_rows, approx_rows, columns, kind)
+            pool.close_all()
+
+            # Новая версия данных - скетчи устарели
+            conn = sqlite3.connect(db_path)
+            bump_data_version(conn)
+            assert not sketches_current(conn)
+            conn.close()
+            print(f"   {layout}: " + ", ".join(
+                f"{kind} {exact_ms:.0f} -> {approx_ms:.0f} мс" for kind, (exact_ms, approx_ms) in timings.items()
+            ))
+    print("✅ Суммы совпадают точно, визиты - в пределах 5%")
+
+
+if __name__ == "__main__":
+    test_hyperloglog()
+    test_sketch_templates()
+    print("\n✅ Тестирование завершено!")
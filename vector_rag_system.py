@@ -7,6 +7,8 @@ from dataclasses import dataclass
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from knowledge_embeddings import KnowledgeEmbeddings, index_kind_from_env, sync_faiss_index
+
 @dataclass
 class KnowledgeItem:
     category: str
@@ -17,12 +19,14 @@ class KnowledgeItem:
     embedding: Optional[np.ndarray] = None
 
 class VectorRAGSystem:
-    def __init__(self, model_name: str = "sbert_large_nlu_ru"):
+    def __init__(self, model_name: str = "sbert_large_nlu_ru", index_kind: Optional[str] = None):
         """
         Инициализация векторной RAG системы
         
         Args:
             model_name: Название модели для эмбеддингов (русская модель)
+            index_kind: Тип FAISS индекса (knowledge_embeddings.INDEX_KINDS),
+                по умолчанию из RAG_INDEX в окружении
         """
         self.model_name = model_name
         self.model = None
@@ -30,7 +34,8 @@ class VectorRAGSystem:
         self.knowledge_items = []
         self.embeddings = []
         self.index_file = "vector_rag_index.pkl"
-        self.embeddings_file = "vector_rag_embeddings.npy"
+        self.embeddings_file = "vector_rag_embeddings.npz"
+        self.index_kind = index_kind or index_kind_from_env()
         
         # Инициализируем модель
         self._load_model()
@@ -51,6 +56,8 @@ class VectorRAGSystem:
             print(f"⚠️ Ошибка загрузки модели {self.model_name}, используем fallback...")
             try:
                 self.model = SentenceTransformer('all-MiniLM-L6-v2')
+                # Отпечаток индекса должен называть модель, которой закодированы векторы
+                self.model_name = 'all-MiniLM-L6-v2'
                 print("✅ Fallback модель загружена")
             except Exception as e2:
                 print(f"❌ Ошибка загрузки fallback модели: {e2}")
@@ -740,51 +747,36 @@ class VectorRAGSystem:
             )
         ]
     
-    def _build_vector_index(self):
-        """Создает векторный индекс для быстрого поиска"""
-        if os.path.exists(self.index_file) and os.path.exists(self.embeddings_file):
-            print("🔄 Загрузка существующего векторного индекса...")
-            self._load_existing_index()
-        else:
-            print("🔄 Создание нового векторного индекса...")
-            self._create_new_index()
+    def _item_text(self, item: KnowledgeItem) -> str:
+        """Текст элемента для эмбеддинга: термин, определение, примеры и связанные термины"""
+        text = f"{item.term} {item.definition}"
+        if item.examples:
+            text += f" {' '.join(item.examples)}"
+        if item.related_terms:
+            text += f" {' '.join(item.related_terms)}"
+        return text
     
-    def _create_new_index(self):
-        """Создает новый векторный индекс"""
-        # Создаем тексты для эмбеддингов
-        texts = []
-        for item in self.knowledge_items:
-            # Объединяем термин, определение, примеры и связанные термины
-            text = f"{item.term} {item.definition}"
-            if item.examples:
-                text += f" {' '.join(item.examples)}"
-            if item.related_terms:
-                text += f" {' '.join(item.related_terms)}"
-            texts.append(text)
-        
-        # Создаем эмбеддинги
-        print("🔄 Создание эмбеддингов...")
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Нормализованные эмбеддинги для косинусного сходства (Inner Product)"""
+        print(f"🔄 Создание эмбеддингов: {len(texts)}...")
         embeddings = self.model.encode(texts, show_progress_bar=True)
-        
-        # Нормализуем эмбеддинги для косинусного сходства
-        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-        
-        # Создаем FAISS индекс
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)  # Inner Product для косинусного сходства
-        self.index.add(embeddings.astype('float32'))
-        
-        # Сохраняем индекс и эмбеддинги
-        faiss.write_index(self.index, self.index_file)
-        np.save(self.embeddings_file, embeddings)
-        
-        print(f"✅ Векторный индекс создан: {len(self.knowledge_items)} элементов")
+        return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype('float32')
     
-    def _load_existing_index(self):
-        """Загружает существующий векторный индекс"""
-        self.index = faiss.read_index(self.index_file)
-        self.embeddings = np.load(self.embeddings_file)
-        print(f"✅ Векторный индекс загружен: {len(self.knowledge_items)} элементов")
+    def _build_vector_index(self):
+        """
+        Загружает векторный индекс, если его отпечаток (модель + содержимое
+        базы знаний) совпадает, иначе кодирует только измененные элементы
+        и обновляет индекс
+        """
+        texts = [self._item_text(item) for item in self.knowledge_items]
+        store = KnowledgeEmbeddings(self.embeddings_file, self.model_name)
+        if store.is_current(texts):
+            print("🔄 Загрузка существующего векторного индекса...")
+        else:
+            print("🔄 Обновление векторного индекса...")
+        self.index = sync_faiss_index(self.index_file, store, texts, self._encode_texts, self.index_kind)
+        self.embeddings = store.embeddings
+        print(f"✅ Векторный индекс готов: {len(self.knowledge_items)} элементов")
     
     def search_knowledge(self, query: str, top_k: int = 5) -> List[KnowledgeItem]:
         """
@@ -797,23 +789,40 @@ class VectorRAGSystem:
         Returns:
             Список релевантных элементов знаний
         """
-        if not self.model or not self.index:
-            return []
+        return self.search_batch([query], top_k)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[KnowledgeItem]]:
+        """
+        Семантический поиск по списку запросов: один вызов model.encode
+        и один index.search по матрице (n x d)
+        
+        Args:
+            queries: Поисковые запросы
+            top_k: Количество результатов на запрос
+            
+        Returns:
+            Списки релевантных элементов знаний в порядке queries
+        """
+        if not self.model or not self.index or not queries:
+            return [[] for _ in queries]
         
-        # Создаем эмбеддинг для запроса
-        query_embedding = self.model.encode([query])
-        query_embedding = query_embedding / np.linalg.norm(query_embedding, axis=1, keepdims=True)
+        # Создаем эмбеддинги для всех запросов
+        query_embeddings = self.model.encode(queries, batch_size=64)
+        query_embeddings = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
         
         # Ищем похожие векторы
-        similarities, indices = self.index.search(query_embedding.astype('float32'), top_k)
+        similarities, indices = self.index.search(query_embeddings.astype('float32'), top_k)
         
         # Возвращаем соответствующие элементы знаний
         results = []
-        for idx, similarity in zip(indices[0], similarities[0]):
-            if idx < len(self.knowledge_items):
-                item = self.knowledge_items[idx]
-                item.embedding = self.embeddings[idx] if idx < len(self.embeddings) else None
-                results.append(item)
+        for row in indices:
+            items = []
+            for idx in row:
+                if 0 <= idx < len(self.knowledge_items):
+                    item = self.knowledge_items[idx]
+                    item.embedding = self.embeddings[idx] if idx < len(self.embeddings) else None
+                    items.append(item)
+            results.append(items)
         
         return results
     
@@ -829,8 +838,29 @@ class VectorRAGSystem:
             Улучшенный отчет с контекстной информацией
         """
         # Ищем релевантные знания
-        relevant_items = self.search_knowledge(question, top_k=3)
+        return self._with_context(report, question, self.search_knowledge(question, top_k=3))
+    
+    def enhance_reports_batch(self, reports: List[str], questions: List[str]) -> List[str]:
+        """
+        Улучшает пакет отчетов одним батч-поиском (регламентные прогоны вопросов)
         
+        Args:
+            reports: Исходные отчеты
+            questions: Вопросы, по которым построены отчеты
+            
+        Returns:
+            Улучшенные отчеты в том же порядке
+        """
+        if len(reports) != len(questions):
+            raise ValueError("Число отчетов и вопросов должно совпадать")
+        results = self.search_batch(questions, top_k=3)
+        return [
+            self._with_context(report, question, items)
+            for report, question, items in zip(reports, questions, results)
+        ]
+    
+    def _with_context(self, report: str, question: str, relevant_items: List[KnowledgeItem]) -> str:
+        """Добавляет к отчету высокорелевантные элементы знаний"""
         if not relevant_items:
             return report
         
@@ -879,6 +909,7 @@ class VectorRAGSystem:
             "total_items": len(self.knowledge_items),
             "categories": categories,
             "model_name": self.model_name,
+            "index_kind": self.index_kind,
             "index_size": self.index.ntotal if self.index else 0
         }
 
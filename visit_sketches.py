@@ -0,0 +1,246 @@
+"""
+HyperLogLog-скетчи визитов воронки по (date, utm_source, utm_campaign)
+для приближенного COUNT(DISTINCT visit_id)
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import struct
+import sys
+from itertools import groupby
+from typing import Dict, Optional
+
+from data_version import get_data_version
+from funnel_schema import FUNNEL_SKETCH_TABLE as SKETCH_TABLE
+from funnel_schema import FUNNEL_TABLE, HLL_COUNT_FUNCTION, LAYOUT_STAR, funnel_layout
+
+SKETCH_META_TABLE = f"{SKETCH_TABLE}_meta"
+
+# Переменная окружения, включающая приближенный подсчет визитов (агент и загрузчики)
+APPROX_VISITS_ENV = "FUNNEL_APPROX_VISITS"
+
+# 2^12 регистров: стандартная ошибка 1.04 / sqrt(4096) ~ 1.6%
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+
+# Суммируемые колонки воронки, которые хранятся рядом со скетчем
+SUM_COLUMNS = ["submits", "account_num", "created_flag", "call_answered_flag", "quality_flag"]
+
+_DENSE = 0
+_SPARSE = 1
+_PAIR = struct.Struct(">HB")
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(66)]
+
+
+class HyperLogLog:
+    """
+    HyperLogLog с 64-битным хешем blake2b.
+
+    Регистры хранятся словарем, пока заполнено мало регистров (скетч кампании
+    за день обычно содержит десятки визитов), и массивом байт после этого.
+    """
+
+    __slots__ = ("sparse", "dense")
+
+    def __init__(self):
+        self.sparse: Optional[Dict[int, int]] = {}
+        self.dense: Optional[bytearray] = None
+
+    def add(self, value):
+        if value is None:
+            return
+        # 1.0 и 1 (REAL и INTEGER в разных схемах) - один визит
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> (64 - PRECISION)
+        rest = hashed & ((1 << (64 - PRECISION)) - 1)
+        self._update(index, (64 - PRECISION) - rest.bit_length() + 1)
+
+    def _update(self, index: int, rank: int):
+        if self.dense is not None:
+            if rank > self.dense[index]:
+                self.dense[index] = rank
+            return
+        if rank > self.sparse.get(index, 0):
+            self.sparse[index] = rank
+            if len(self.sparse) * _PAIR.size > REGISTERS:
+                self._densify()
+
+    def _densify(self):
+        self.dense = bytearray(REGISTERS)
+        for index, rank in self.sparse.items():
+            self.dense[index] = rank
+        self.sparse = None
+
+    def merge(self, other: "HyperLogLog"):
+        """Объединение: регистр-максимум (скетч объединения множеств)"""
+        if other.dense is not None:
+            if self.dense is None and not self.sparse:
+                # Пустой скетч просто принимает регистры другого
+                self.sparse, self.dense = None, bytearray(other.dense)
+                return
+            if self.dense is None:
+                self._densify()
+            self.dense = bytearray(map(max, self.dense, other.dense))
+        else:
+            for index, rank in other.sparse.items():
+                self._update(index, rank)
+
+    def estimate(self) -> float:
+        if self.dense is not None:
+            registers = self.dense
+            zeros = registers.count(0)
+        else:
+            registers = self.sparse.values()
+            zeros = REGISTERS - len(self.sparse)
+        alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+        # Нулевые регистры дают по 2^0 = 1
+        harmonic = sum(map(_INVERSE_POWERS.__getitem__, registers))
+        if self.dense is None:
+            harmonic += zeros
+        estimate = alpha * REGISTERS * REGISTERS / harmonic
+        if estimate <= 2.5 * REGISTERS and zeros:
+            # Линейный подсчет для малых множеств
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return estimate
+
+    def to_bytes(self) -> bytes:
+        if self.dense is not None:
+            return bytes([_DENSE]) + bytes(self.dense)
+        pairs = b"".join(_PAIR.pack(index, rank) for index, rank in sorted(self.sparse.items()))
+        return bytes([_SPARSE]) + pairs
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        sketch = cls()
+        if data[0] == _DENSE:
+            sketch.sparse = None
+            sketch.dense = bytearray(data[1:])
+        else:
+            sketch.sparse = {index: rank for index, rank in _PAIR.iter_unpack(data[1:])}
+        return sketch
+
+
+class HLLCount:
+    """Агрегат SQLite hll_count(visit_sketch): объединяет скетчи группы и возвращает оценку"""
+
+    def __init__(self):
+        self.sketch = HyperLogLog()
+
+    def step(self, data):
+        if data is not None:
+            self.sketch.merge(HyperLogLog.from_bytes(data))
+
+    def finalize(self):
+        return int(round(self.sketch.estimate()))
+
+
+# Агрегаты для регистрации в соединениях агента (SQLiteConnectionPool(aggregates=...))
+SQLITE_AGGREGATES = {HLL_COUNT_FUNCTION: HLLCount}
+
+
+def approximate_visits_enabled() -> bool:
+    """Включен ли приближенный подсчет визитов (FUNNEL_APPROX_VISITS=1)"""
+    return os.environ.get(APPROX_VISITS_ENV) == "1"
+
+
+def sketch_columns(layout: str):
+    """Ключевые колонки скетчей - те же, что в funnel_data этой схемы"""
+    suffix = "_id" if layout == LAYOUT_STAR else ""
+    return ["date", f"utm_source{suffix}", f"utm_campaign{suffix}"]
+
+
+def build_visit_sketches(conn: sqlite3.Connection) -> int:
+    """
+    Строит таблицу скетчей по funnel_data: по строке на (date, utm_source,
+    utm_campaign) с HyperLogLog-скетчем visit_id и суммами SUM_COLUMNS.
+
+    Вызывается загрузчиками после bump_data_version: в метаданных
+    запоминается текущая версия данных, и агент читает скетчи, только пока
+    она совпадает. Визиты читаются одним упорядоченным проходом, поэтому в
+    памяти держится скетч одной группы.
+
+    Returns:
+        Количество групп (0, если funnel_data нет)
+    """
+    layout = funnel_layout(conn)
+    conn.execute(f"DROP TABLE IF EXISTS {SKETCH_TABLE}")
+    conn.execute(f"DROP TABLE IF EXISTS {SKETCH_META_TABLE}")
+    if layout is None:
+        return 0
+
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({FUNNEL_TABLE})")}
+    keys = sketch_columns(layout)
+    if not set(keys + ["visit_id"]) <= existing:
+        return 0
+    sums = [column for column in SUM_COLUMNS if column in existing]
+
+    key_sql = ", ".join(keys)
+    # Колонки сумм без типа: целые суммы флагов остаются целыми
+    columns = keys + sums + ["visit_sketch BLOB NOT NULL"]
+    conn.execute(f"CREATE TABLE {SKETCH_TABLE} ({', '.join(columns)})")
+
+    totals = conn.cursor().execute(
+        f"SELECT {', '.join(keys + [f'SUM({column})' for column in sums])} "
+        f"FROM {FUNNEL_TABLE} GROUP BY {key_sql} ORDER BY {key_sql}"
+    )
+    visits = conn.cursor().execute(
+        f"SELECT {key_sql}, visit_id FROM {FUNNEL_TABLE} ORDER BY {key_sql}"
+    )
+
+    def rows():
+        # Оба курсора упорядочены по одному ключу и содержат одни и те же группы
+        for (key, group), total in zip(groupby(visits, key=lambda row: row[:3]), totals):
+            assert tuple(total[:3]) == tuple(key), (key, total)
+            sketch = HyperLogLog()
+            for row in group:
+                sketch.add(row[3])
+            yield tuple(total) + (sketch.to_bytes(),)
+
+    placeholders = ", ".join("?" * len(columns))
+    conn.executemany(f"INSERT INTO {SKETCH_TABLE} VALUES ({placeholders})", rows())
+    count = conn.execute(f"SELECT COUNT(*) FROM {SKETCH_TABLE}").fetchone()[0]
+
+    conn.execute(f"CREATE TABLE {SKETCH_META_TABLE} (data_version INTEGER NOT NULL, layout TEXT NOT NULL)")
+    conn.execute(f"INSERT INTO {SKETCH_META_TABLE} VALUES (?, ?)", (get_data_version(conn), layout))
+    conn.commit()
+    return count
+
+
+def drop_visit_sketches(conn: sqlite3.Connection):
+    """Удаляет скетчи (загрузка без приближенного подсчета визитов)"""
+    conn.execute(f"DROP TABLE IF EXISTS {SKETCH_TABLE}")
+    conn.execute(f"DROP TABLE IF EXISTS {SKETCH_META_TABLE}")
+    conn.commit()
+
+
+def stamp_visit_sketches(conn: sqlite3.Connection):
+    """
+    Отмечает скетчи актуальными для текущей версии данных.
+
+    Для загрузчиков, которые увеличивают версию данных, не меняя funnel_data
+    (инкрементальная загрузка campaign_metrics): скетчи остаются верными,
+    и перестраивать их не нужно.
+    """
+    conn.execute(f"UPDATE {SKETCH_META_TABLE} SET data_version = ?", (get_data_version(conn),))
+    conn.commit()
+
+
+def sketches_current(conn: sqlite3.Connection) -> bool:
+    """Построены ли скетчи для текущей версии данных и схемы funnel_data"""
+    try:
+        row = conn.execute(f"SELECT data_version, layout FROM {SKETCH_META_TABLE}").fetchone()
+    except sqlite3.OperationalError:
+        return False
+    return row is not None and row[0] == get_data_version(conn) and row[1] == funnel_layout(conn)
+
+
+if __name__ == "__main__":
+    # Построение скетчей для уже загруженной БД: python visit_sketches.py [путь к БД]
+    db_conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else "marketing_analytics.db")
+    print(f"Скетчи визитов воронки созданы: {build_visit_sketches(db_conn)} групп")
+    db_conn.close()